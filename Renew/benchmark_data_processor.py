@@ -0,0 +1,146 @@
+import glob
+import os
+import re
+import time
+
+from data_processor import (PARSER_BACKENDS, SoupParserBackend, _HIGHLIGHT_DISPATCH, _SPEC_DISPATCH,
+                            clean_label_for_comparison, clean_value, extract_car_data)
+
+# Fichas guardadas de los tests: se mide sobre las mismas páginas que comprueban la salida
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests', 'pages')
+PAGES = 20_000  # Fichas simuladas para la parte de etiquetas y valores
+EXTRACT_PAGES = 500  # extract_car_data completo es mucho más lento: con menos fichas basta
+
+
+# --- Implementación anterior (cadena de replace e if/elif), solo como referencia ---
+
+def legacy_clean_value(text):
+    if text is None:
+        return ''
+    text = text.strip()
+    text = text.replace('€', '').replace('Km', '').replace('CV', '').replace('/ Mes', '').replace('KW', '')
+    text = text.replace('m', '').replace('Kg', '').replace('L', '').replace('/100', '')
+    text = text.replace('CO₂', '').replace('seg', '').replace('km/h', '')
+    text = text.replace(':', '').replace('(', '').replace(')', '')
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+
+def legacy_clean_label(text):
+    if text is None:
+        return ''
+    text = text.replace('á', 'a').replace('é', 'e').replace('í', 'i').replace('ó', 'o').replace('ú', 'u')
+    text = text.replace('Á', 'A').replace('É', 'E').replace('Í', 'I').replace('Ó', 'O').replace('Ú', 'U')
+    text = text.replace('ñ', 'n').replace('Ñ', 'N')
+    return text.strip().lower().replace(' ', '')
+
+
+def legacy_fields(highlights, specs, equipment):
+    car_data = {}
+    for raw_label, raw_value in highlights:
+        label = legacy_clean_label(raw_label)
+        if label == 'condicion':
+            car_data['condition'] = legacy_clean_value(raw_value)
+        elif label == 'carroceria':
+            car_data['body_type'] = legacy_clean_value(raw_value)
+        elif label == 'matriculacion':
+            match = re.search(r'(\d{4})$', raw_value)
+            car_data['registration_year'] = match.group(1) if match else legacy_clean_value(raw_value)
+        elif label == 'kilometros':
+            car_data['kilometros'] = legacy_clean_value(raw_value)
+        elif label == 'combustible':
+            car_data['fuel_type'] = legacy_clean_value(raw_value)
+        elif label == 'eficienciaco2':
+            car_data['co2_class_combined'] = legacy_clean_value(raw_value)
+        elif label == 'cambio':
+            car_data['transmission'] = legacy_clean_value(raw_value)
+        elif label == 'potencia':
+            match_cv_parentheses = re.search(r'\((\d+)\s*CV\)', raw_value, re.IGNORECASE)
+            if match_cv_parentheses:
+                car_data['engine_cv'] = match_cv_parentheses.group(1)
+            else:
+                cleaned = legacy_clean_value(raw_value)
+                numbers_only_match = re.search(r'(\d+)', cleaned)
+                car_data['engine_cv'] = numbers_only_match.group(1) if numbers_only_match else cleaned
+        elif label == 'traccion':
+            car_data['traction'] = legacy_clean_value(raw_value)
+        elif label == 'plazas':
+            car_data['seats'] = legacy_clean_value(raw_value)
+    for raw_label, raw_value in specs:
+        label = legacy_clean_label(raw_label.replace(':', ''))
+        if label == 'unicopropietario':
+            car_data['unique_owner'] = legacy_clean_value(raw_value)
+        elif label == 'itvvalidahasta':
+            car_data['itv_valid_until'] = legacy_clean_value(raw_value)
+        elif label == 'tipodeiva':
+            car_data['iva_type'] = legacy_clean_value(raw_value)
+        elif label == 'numerodellaves':
+            car_data['number_of_keys'] = legacy_clean_value(raw_value)
+    for panel_id, items in equipment.items():
+        if items:
+            car_data[panel_id] = "; ".join([legacy_clean_value(item) for item in items])
+    return car_data
+
+
+# --- Implementación actual (tablas de campos compiladas y translate) ---
+
+def table_fields(highlights, specs, equipment):
+    car_data = {}
+    for raw_label, raw_value in highlights:
+        entry = _HIGHLIGHT_DISPATCH.get(clean_label_for_comparison(raw_label))
+        if entry:
+            field, parse = entry
+            car_data[field] = parse(raw_value)
+    for raw_label, raw_value in specs:
+        entry = _SPEC_DISPATCH.get(clean_label_for_comparison(raw_label.replace(':', '')))
+        if entry:
+            field, parse = entry
+            car_data[field] = parse(raw_value)
+    for panel_id, items in equipment.items():
+        if items:
+            car_data[panel_id] = "; ".join([clean_value(item) for item in items])
+    return car_data
+
+
+def seconds_for(function, arguments, repetitions):
+    started = time.perf_counter()
+    for _ in range(repetitions):
+        for argument in arguments:
+            function(*argument)
+    return time.perf_counter() - started
+
+
+def main():
+    pages = []
+    for path in sorted(glob.glob(os.path.join(PAGES_DIR, '*.html'))):
+        with open(path, encoding='utf-8') as f:
+            pages.append((os.path.basename(path), f.read()))
+    if not pages:
+        print(f"No hay fichas guardadas en {PAGES_DIR}")
+        return
+
+    # Los textos crudos se sacan una vez: aquí solo se mide la asignación de etiquetas y la limpieza de valores
+    raw_fields = []
+    for name, html_content in pages:
+        parser = SoupParserBackend(html_content)
+        fields = (parser.highlights(), parser.specs(), parser.equipment())
+        if legacy_fields(*fields) != table_fields(*fields):
+            print(f"Aviso: {name} da campos distintos con la implementación anterior")
+        raw_fields.append(fields)
+
+    repetitions = max(1, PAGES // len(raw_fields))
+    legacy = seconds_for(legacy_fields, raw_fields, repetitions)
+    table = seconds_for(table_fields, raw_fields, repetitions)
+    print(f"Etiquetas y valores, {repetitions * len(raw_fields)} fichas:")
+    print(f"  if/elif + replace: {legacy:.3f} s")
+    print(f"  tablas + translate: {table:.3f} s ({legacy / table:.1f}x)")
+
+    repetitions = max(1, EXTRACT_PAGES // len(pages))
+    print(f"extract_car_data completo, {repetitions * len(pages)} fichas:")
+    for backend in sorted(PARSER_BACKENDS):
+        arguments = [(html_content, name, [], backend) for name, html_content in pages]
+        print(f"  {backend}: {seconds_for(extract_car_data, arguments, repetitions):.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,4 +14,112 @@ MAIN_DRIVE_FOLDER_NAME = 'Renew_Autofer_Scrapes'
 TEMP_IMAGE_DIR = 'temp_renew_images'
 
 # Nombre del archivo donde se guardarán las URLs de los coches.
-URLS_FILE = 'urls.txt'
\ No newline at end of file
+URLS_FILE = 'urls.txt'
+
+# --- Configuración del navegador de Playwright ---
+# Ejecutar Chromium sin interfaz gráfica. Ponlo a False para depurar visualmente.
+HEADLESS = True
+
+# Número máximo de contextos (BrowserContext) aislados que se mantienen abiertos a la vez.
+BROWSER_CONTEXT_POOL_SIZE = 4
+
+# Número de anuncios que se procesan con un mismo contexto antes de cerrarlo y crear uno nuevo.
+# Evita que la memoria de Chromium crezca indefinidamente en los lotes nocturnos.
+CONTEXT_MAX_USES = 50
+
+
+# --- Configuración del modo concurrente de main.py ---
+# Número de páginas de detalle que se scrapean a la vez (se puede cambiar con --concurrency).
+# Con 1 se mantiene el recorrido secuencial de siempre.
+DEFAULT_CONCURRENCY = 1
+
+# Máximo de páginas abiertas a la vez contra un mismo host, para no saturar al concesionario.
+MAX_CONCURRENCY_PER_HOST = 4
+
+# --- Bloqueo de recursos pesados durante el scraping ---
+# Si es True, cada contexto del navegador aborta las peticiones de los tipos y hosts de abajo.
+# Las imágenes se bloquean mientras carga la página y durante la lectura de la galería en una sola pasada;
+# solo se dejan pasar las de la galería mientras se recorre el carrusel (allow_requests en request_router.py).
+BLOCK_HEAVY_RESOURCES = True
+
+# Tipos de recurso de Playwright (request.resource_type) que se abortan.
+BLOCKED_RESOURCE_TYPES = ['image', 'media', 'font']
+
+# Hosts de analítica y publicidad que se abortan (también sus subdominios).
+BLOCKED_TRACKER_HOSTS = [
+    'google-analytics.com', 'googletagmanager.com', 'doubleclick.net', 'googleadservices.com',
+    'googlesyndication.com', 'facebook.net', 'facebook.com', 'hotjar.com', 'clarity.ms',
+    'bing.com', 'tiktok.com', 'linkedin.com', 'criteo.com', 'taboola.com',
+]
+
+# Fragmentos de URL que nunca se bloquean (lo que necesita la galería LightGallery para funcionar).
+ROUTING_ALLOWLIST = ['lightgallery', 'lg-fonts', 'lg.woff', 'lg.ttf']
+
+# Prefijo del CDN desde el que se sirven las fotos de la galería. Mientras se recorre el carrusel LightGallery
+# estas imágenes no se bloquean: la galería solo muestra (y deja leer) la imagen actual cuando se ha descargado.
+GALLERY_IMAGE_URL_PREFIX = 'https://cdn.dealerk.es/dealer/datafiles/vehicle/images/'
+
+# --- Rastreo incremental ---
+# Si es True, main.py solo vuelve a scrapear los anuncios nuevos o cambiados y el CSV contiene
+# únicamente altas, cambios y bajas (columna change_type). Se puede forzar todo con --full.
+INCREMENTAL_CRAWL = True
+
+# Base de datos SQLite con el último estado conocido de cada anuncio (indexado por GUID).
+LISTING_STATE_DB = 'listing_state.sqlite3'
+
+# Número de revalidaciones HTTP (sin navegador) que se hacen a la vez.
+REVALIDATION_WORKERS = 8
+
+# --- Descubrimiento de anuncios (frontera de rastreo) ---
+# Buscador de stock del concesionario que se pagina para descubrir las URLs de las fichas.
+STOCK_SEARCH_URL = 'https://www.autofer.com/coches/segunda-mano/'
+
+# Parámetro de la URL del buscador que indica el número de página.
+SEARCH_PAGE_PARAM = 'page'
+
+# Límite de seguridad de páginas del buscador que se recorren (se para antes si una página no trae nada nuevo).
+MAX_SEARCH_PAGES = 200
+
+# Base de datos SQLite con la cola de URLs pendientes; permite reanudar un rastreo interrumpido.
+FRONTIER_DB = 'crawl_frontier.sqlite3'
+
+# Los anuncios que han cambiado en los últimos días se scrapean antes que el resto.
+RECENTLY_CHANGED_DAYS = 3
+
+# --- Archivo de snapshots HTML ---
+# Si es True, el HTML de cada ficha descargada se guarda comprimido para poder re-extraer los datos
+# sin navegador con reextract.py.
+SNAPSHOT_ARCHIVE_ENABLED = True
+
+# Base de datos SQLite con los HTML comprimidos (direccionados por su SHA-256) y las descargas por GUID y fecha.
+SNAPSHOT_ARCHIVE_DB = 'snapshots.sqlite3'
+
+# --- Salida de datos ---
+# Formato del fichero de salida de main.py y reextract.py: 'csv' o 'parquet' (necesita pyarrow).
+OUTPUT_FORMAT = 'csv'
+
+# --- Subida masiva a Google Drive ---
+# Número de subidas simultáneas a Drive.
+DRIVE_UPLOAD_WORKERS = 8
+
+# Los archivos de hasta este tamaño (bytes) se suben en una sola petición multipart; los mayores, con subida reanudable.
+DRIVE_RESUMABLE_THRESHOLD = 5 * 1024 * 1024
+
+# Reintentos ante errores 429/5xx de Drive, con espera exponencial (1 s, 2 s, 4 s...) más un poco de azar.
+DRIVE_UPLOAD_MAX_RETRIES = 6
+
+# Base de datos SQLite con los archivos ya subidos; un lote interrumpido continúa donde se quedó.
+DRIVE_UPLOAD_MANIFEST_DB = 'drive_uploads.sqlite3'
+
+# Índice local MD5 → archivo de Drive. Una imagen con el mismo contenido que otra ya subida no se vuelve a subir:
+# en su carpeta se crea un acceso directo al archivo existente (o nada, si DRIVE_DEDUP_SHORTCUTS es False).
+DRIVE_CONTENT_INDEX_DB = 'drive_content_index.sqlite3'
+DRIVE_DEDUP_SHORTCUTS = True
+
+# Caché local de las subcarpetas de Drive (nombre → ID) por carpeta padre, y horas que se considera válida.
+DRIVE_FOLDER_CACHE_FILE = 'drive_folders.json'
+DRIVE_FOLDER_CACHE_TTL_HOURS = 24
+
+# Raíz alternativa de la API de Drive, p. ej. 'http://127.0.0.1:8080/' para un servidor falso local en pruebas
+# sin red (ver tests/fake_drive.py). None = Google.
+DRIVE_API_ENDPOINT = None
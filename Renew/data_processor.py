@@ -1,7 +1,24 @@
 import re
 from bs4 import BeautifulSoup
+from functools import lru_cache
 import hashlib
 
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:  # lxml es opcional: sin él se usa siempre BeautifulSoup
+    lxml = None
+
+
+# Unidades y símbolos de varios caracteres que se eliminan de los valores, en una sola pasada de regex.
+# ('km/h' ya no hace falta: la 'm' se elimina siempre, igual que hacía la cadena de replace original.)
+_VALUE_TOKENS_REGEX = re.compile('|'.join(re.escape(token) for token in
+                                          ('Km', 'CV', '/ Mes', 'KW', 'Kg', '/100', 'CO₂', 'seg')))
+# Caracteres sueltos que se eliminan de los valores (los puntos se conservan: pueden ser decimales)
+_VALUE_DELETE_TABLE = str.maketrans('', '', '€mL:()')
+# Quita acentos y eñes y elimina los espacios de una etiqueta
+_LABEL_TABLE = str.maketrans('áéíóúÁÉÍÓÚñÑ', 'aeiouAEIOUnN', ' ')
+
 
 def clean_value(text: str) -> str:
     """
@@ -9,16 +26,11 @@ def clean_value(text: str) -> str:
     """
     if text is None:
         return ''
-    text = text.strip()
-    # Remove common units and symbols that are part of values
-    text = text.replace('€', '').replace('Km', '').replace('CV', '').replace('/ Mes', '').replace('KW', '')
-    text = text.replace('m', '').replace('Kg', '').replace('L', '').replace('/100', '')
-    text = text.replace('CO₂', '').replace('seg', '').replace('km/h', '')
-    text = text.replace(':', '').replace('(', '').replace(')', '')  # Keep periods if they are decimal separators
-    text = re.sub(r'\s+', ' ', text)  # Normalize multiple spaces to one single space
-    return text.strip()
+    text = _VALUE_TOKENS_REGEX.sub('', text).translate(_VALUE_DELETE_TABLE)
+    return ' '.join(text.split())  # Normaliza espacios múltiples a uno solo y recorta los extremos
 
 
+@lru_cache(maxsize=1024)
 def clean_label_for_comparison(text: str) -> str:
     """
     Limpia una etiqueta para una comparación robusta:
@@ -26,23 +38,268 @@ def clean_label_for_comparison(text: str) -> str:
     - Convierte caracteres acentuados comunes a sus equivalentes sin acento.
     - Convierte a minúsculas.
     - Elimina todos los espacios.
+    Las etiquetas de la web son siempre las mismas pocas decenas, así que el resultado se cachea.
     """
     if text is None:
         return ''
-    text = text.replace('á', 'a').replace('é', 'e').replace('í', 'i').replace('ó', 'o').replace('ú', 'u')
-    text = text.replace('Á', 'A').replace('É', 'E').replace('Í', 'I').replace('Ó', 'O').replace('Ú', 'U')
-    text = text.replace('ñ', 'n').replace('Ñ', 'N')
-    text = text.strip().lower().replace(' ', '')
-    return text
+    return text.translate(_LABEL_TABLE).strip().lower()
+
+
+def _parse_registration_year(raw_value: str) -> str:
+    match = re.search(r'(\d{4})$', raw_value)
+    if match:
+        return match.group(1)
+    return clean_value(raw_value)
+
+
+def _parse_engine_cv(raw_value: str) -> str:
+    match_cv_parentheses = re.search(r'\((\d+)\s*CV\)', raw_value, re.IGNORECASE)
+    if match_cv_parentheses:
+        return match_cv_parentheses.group(1)
+    cleaned_val_for_numbers = clean_value(raw_value)
+    numbers_only_match = re.search(r'(\d+)', cleaned_val_for_numbers)
+    if numbers_only_match:
+        return numbers_only_match.group(1)
+    return cleaned_val_for_numbers
+
+
+# --- Tablas de campos: etiqueta en la web → campo de car_data → función que interpreta el valor ---
+# Para leer un campo nuevo de la web basta con añadir una fila aquí.
+
+# Lista de destacados (stock-vehicle-highlights-list)
+HIGHLIGHT_FIELDS = [
+    ('Condición', 'condition', clean_value),
+    ('Carrocería', 'body_type', clean_value),
+    ('Matriculación', 'registration_year', _parse_registration_year),
+    ('Kilómetros', 'kilometros', clean_value),
+    ('Combustible', 'fuel_type', clean_value),
+    ('Eficiencia CO2', 'co2_class_combined', clean_value),
+    ('Cambio', 'transmission', clean_value),
+    ('Potencia', 'engine_cv', _parse_engine_cv),
+    ('Tracción', 'traction', clean_value),
+    ('Plazas', 'seats', clean_value),
+]
+
+# Especificaciones adicionales (stock-vehicle-detail__specs)
+SPEC_FIELDS = [
+    ('Único propietario', 'unique_owner', clean_value),
+    ('ITV válida hasta', 'itv_valid_until', clean_value),
+    ('Tipo de IVA', 'iva_type', clean_value),
+    ('Número de llaves', 'number_of_keys', clean_value),
+]
+
+
+def _compile_field_table(field_table: list) -> dict:
+    """Indexa una tabla de campos por su etiqueta ya normalizada, para buscarla en O(1)."""
+    return {clean_label_for_comparison(label): (field, parse) for label, field, parse in field_table}
+
+
+_HIGHLIGHT_DISPATCH = _compile_field_table(HIGHLIGHT_FIELDS)
+_SPEC_DISPATCH = _compile_field_table(SPEC_FIELDS)
+
+
+# Pestañas de equipamiento: sufijo del campo details_<categoría> → id del panel en el HTML
+EQUIPMENT_PANELS = {
+    'exterior': 'panel-equipamiento-exterior',
+    'interior': 'panel-equipamiento-interior',
+    'confort': 'panel-equipamiento-confort',
+    'seguridad': 'panel-equipamiento-seguridad',
+    'extras': 'panel-equipamiento-extras',
+}
+
+
+class SoupParserBackend:
+    """
+    Backend de parseo con BeautifulSoup + html.parser (el de siempre).
+    Cada método devuelve el texto crudo de una parte de la ficha, o None / lista vacía si no está.
+    """
+    name = 'html.parser'
+
+    def __init__(self, html_content: str):
+        self.soup = BeautifulSoup(html_content, 'html.parser')
+
+    def make_model(self):
+        span = self.soup.find('span', class_='stock-vehicle-detail__header--make-model')
+        return span.get_text(strip=True) if span else None
+
+    def trim(self):
+        span = self.soup.find('span', class_='stock-vehicle-detail__header--trim')
+        return span.get_text() if span else None
+
+    def prices(self) -> tuple:
+        """Retorna (precio_contado, precio_financiado) sin limpiar."""
+        cash, financed = None, None
+        price_wrapper = self.soup.find('div', class_='stock-vehicle-detail__header--price-wrapper')
+        if price_wrapper:
+            cash_price_div = price_wrapper.find('div', class_='price-financed--header__cash')
+            if cash_price_div:
+                cash_value_p = cash_price_div.find('p', class_='price__value')
+                if cash_value_p:
+                    cash = cash_value_p.get_text()
+
+            financed_price_div = price_wrapper.find('div', class_='price-financed--header__financed')
+            if financed_price_div:
+                financed_value_p = financed_price_div.find('p', class_='price__value')
+                if financed_value_p:
+                    financed = financed_value_p.get_text()
+        return cash, financed
+
+    def highlights(self) -> list:
+        """Pares (etiqueta, valor) de la lista de destacados."""
+        pairs = []
+        highlights_list = self.soup.find('ul', class_='stock-vehicle-highlights-list')
+        if highlights_list:
+            for item in highlights_list.find_all('li', class_=re.compile(r'stock-vehicle-highlights-list__item')):
+                label_span = item.find('span', class_='stock-vehicle-highlights-list__item-label')
+                value_span = item.find('span', class_='stock-vehicle-highlights-list__item-value')
+                if label_span and value_span:
+                    pairs.append((label_span.get_text(), value_span.get_text()))
+        return pairs
+
+    def specs(self) -> list:
+        """Pares (etiqueta, valor) de las especificaciones adicionales."""
+        pairs = []
+        for row in self.soup.find_all('div', class_='stock-vehicle-detail__specs--row'):
+            label_tag = row.find('div', class_='stock-vehicle-detail__specs--label')
+            value_tag = row.find('div', class_='stock-vehicle-detail__specs--value')
+            if label_tag and value_tag:
+                pairs.append((label_tag.get_text(), value_tag.get_text()))
+        return pairs
 
+    def equipment(self) -> dict:
+        """Textos de cada panel de equipamiento presente, por id de panel."""
+        panels = {}
+        wrapper = self.soup.find('div', class_='elektra-tabs__content-wrapper')
+        if wrapper:
+            for panel_id in EQUIPMENT_PANELS.values():
+                panel = wrapper.find('div', id=panel_id)
+                if panel:
+                    panels[panel_id] = [item.get_text() for item in panel.find_all('p', class_='text__body-default')]
+        return panels
 
-def extract_car_data(html_content: str, original_url: str, image_urls_from_playwright: list) -> dict:
+
+def _has_class(class_name: str) -> str:
+    """Condición XPath equivalente a class_='...' de BeautifulSoup (la clase es uno de los tokens)."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+
+if lxml is not None:
+    # XPaths compiladas una sola vez; cada una baja directamente al subárbol que necesita
+    _XP_MAKE_MODEL = etree.XPath(f"(//span[{_has_class('stock-vehicle-detail__header--make-model')}])[1]")
+    _XP_TRIM = etree.XPath(f"(//span[{_has_class('stock-vehicle-detail__header--trim')}])[1]")
+    _XP_PRICE_WRAPPER = etree.XPath(f"(//div[{_has_class('stock-vehicle-detail__header--price-wrapper')}])[1]")
+    _XP_CASH_VALUE = etree.XPath(f"(.//div[{_has_class('price-financed--header__cash')}])[1]"
+                                 f"/descendant::p[{_has_class('price__value')}][1]")
+    _XP_FINANCED_VALUE = etree.XPath(f"(.//div[{_has_class('price-financed--header__financed')}])[1]"
+                                     f"/descendant::p[{_has_class('price__value')}][1]")
+    _XP_HIGHLIGHTS_ITEMS = etree.XPath(f"(//ul[{_has_class('stock-vehicle-highlights-list')}])[1]"
+                                       f"//li[contains(@class, 'stock-vehicle-highlights-list__item')]")
+    _XP_HIGHLIGHT_LABEL = etree.XPath(f"(.//span[{_has_class('stock-vehicle-highlights-list__item-label')}])[1]")
+    _XP_HIGHLIGHT_VALUE = etree.XPath(f"(.//span[{_has_class('stock-vehicle-highlights-list__item-value')}])[1]")
+    _XP_SPECS_ROWS = etree.XPath(f"//div[{_has_class('stock-vehicle-detail__specs--row')}]")
+    _XP_SPEC_LABEL = etree.XPath(f"(.//div[{_has_class('stock-vehicle-detail__specs--label')}])[1]")
+    _XP_SPEC_VALUE = etree.XPath(f"(.//div[{_has_class('stock-vehicle-detail__specs--value')}])[1]")
+    _XP_EQUIPMENT_WRAPPER = etree.XPath(f"(//div[{_has_class('elektra-tabs__content-wrapper')}])[1]")
+    _XP_EQUIPMENT_PANEL = etree.XPath("(.//div[@id=$panel_id])[1]")
+    _XP_EQUIPMENT_ITEMS = etree.XPath(f".//p[{_has_class('text__body-default')}]")
+    _XP_TEXT = etree.XPath(".//text()")
+    _LXML_PARSER = lxml.html.HTMLParser(encoding='utf-8')
+
+
+def _first(xpath_result):
+    return xpath_result[0] if xpath_result else None
+
+
+class LxmlParserBackend:
+    """
+    Backend de parseo con lxml: el árbol se construye en C y cada campo se localiza con una XPath
+    precompilada que solo recorre su subárbol (cabecera, destacados, especificaciones y equipamiento),
+    en lugar de hacer una docena de búsquedas sobre un árbol de BeautifulSoup.
+    Devuelve exactamente los mismos textos que SoupParserBackend.
+    """
+    name = 'lxml'
+
+    def __init__(self, html_content: str):
+        try:
+            self.root = lxml.html.fromstring((html_content or '').encode('utf-8'), parser=_LXML_PARSER)
+        except etree.ParserError:
+            # HTML vacío o solo espacios/comentarios: html.parser devuelve una ficha sin datos, lxml
+            # lanza "Document is empty". Se usa un documento vacío para dar el mismo resultado.
+            self.root = lxml.html.Element('html')
+
+    @staticmethod
+    def _text(element, strip: bool = False) -> str:
+        # Equivale a get_text() / get_text(strip=True) de BeautifulSoup (los comentarios no cuentan)
+        if strip:
+            return ''.join(text.strip() for text in _XP_TEXT(element))
+        return ''.join(_XP_TEXT(element))
+
+    def make_model(self):
+        span = _first(_XP_MAKE_MODEL(self.root))
+        return self._text(span, strip=True) if span is not None else None
+
+    def trim(self):
+        span = _first(_XP_TRIM(self.root))
+        return self._text(span) if span is not None else None
+
+    def prices(self) -> tuple:
+        cash, financed = None, None
+        price_wrapper = _first(_XP_PRICE_WRAPPER(self.root))
+        if price_wrapper is not None:
+            cash_value_p = _first(_XP_CASH_VALUE(price_wrapper))
+            if cash_value_p is not None:
+                cash = self._text(cash_value_p)
+            financed_value_p = _first(_XP_FINANCED_VALUE(price_wrapper))
+            if financed_value_p is not None:
+                financed = self._text(financed_value_p)
+        return cash, financed
+
+    def highlights(self) -> list:
+        pairs = []
+        for item in _XP_HIGHLIGHTS_ITEMS(self.root):
+            label_span = _first(_XP_HIGHLIGHT_LABEL(item))
+            value_span = _first(_XP_HIGHLIGHT_VALUE(item))
+            if label_span is not None and value_span is not None:
+                pairs.append((self._text(label_span), self._text(value_span)))
+        return pairs
+
+    def specs(self) -> list:
+        pairs = []
+        for row in _XP_SPECS_ROWS(self.root):
+            label_tag = _first(_XP_SPEC_LABEL(row))
+            value_tag = _first(_XP_SPEC_VALUE(row))
+            if label_tag is not None and value_tag is not None:
+                pairs.append((self._text(label_tag), self._text(value_tag)))
+        return pairs
+
+    def equipment(self) -> dict:
+        panels = {}
+        wrapper = _first(_XP_EQUIPMENT_WRAPPER(self.root))
+        if wrapper is not None:
+            for panel_id in EQUIPMENT_PANELS.values():
+                panel = _first(_XP_EQUIPMENT_PANEL(wrapper, panel_id=panel_id))
+                if panel is not None:
+                    panels[panel_id] = [self._text(item) for item in _XP_EQUIPMENT_ITEMS(panel)]
+        return panels
+
+
+# Backends disponibles para extract_car_data, por nombre
+PARSER_BACKENDS = {SoupParserBackend.name: SoupParserBackend}
+if lxml is not None:
+    PARSER_BACKENDS[LxmlParserBackend.name] = LxmlParserBackend
+
+# lxml si está instalado; si no, BeautifulSoup con html.parser
+DEFAULT_PARSER_BACKEND = LxmlParserBackend.name if lxml is not None else SoupParserBackend.name
+
+def extract_car_data(html_content: str, original_url: str, image_urls_from_playwright: list,
+                     backend: str = DEFAULT_PARSER_BACKEND) -> dict:
     """
     Extrae datos específicos de la ficha de un coche desde su contenido HTML.
     Ahora también recibe las URLs de las imágenes recopiladas por Playwright.
+    `backend` elige el parser de PARSER_BACKENDS ('lxml' o 'html.parser'); ambos dan el mismo resultado.
     Retorna un diccionario con los datos del coche, eliminando campos 'N/A'.
     """
-    soup = BeautifulSoup(html_content, 'html.parser')
+    parser = PARSER_BACKENDS[backend](html_content)
     car_data = {}
 
     car_data['original_url'] = original_url
@@ -63,125 +320,52 @@ def extract_car_data(html_content: str, original_url: str, image_urls_from_playw
         car_data[field] = 'N/A'
 
     # --- Extracción de Marca y Modelo ---
-    make_model_span = soup.find('span', class_='stock-vehicle-detail__header--make-model')
-    if make_model_span:
-        full_make_model = make_model_span.get_text(strip=True)
+    full_make_model = parser.make_model()
+    if full_make_model is not None:
         parts = full_make_model.split(maxsplit=1)
         if len(parts) > 0:
             car_data['brand'] = parts[0]
         if len(parts) > 1:
             car_data['model'] = parts[1]
 
-    trim_span = soup.find('span', class_='stock-vehicle-detail__header--trim')
-    if trim_span and car_data['model'] != 'N/A':
-        trim_text = clean_value(trim_span.get_text())
+    trim_text_raw = parser.trim()
+    if trim_text_raw is not None and car_data['model'] != 'N/A':
+        trim_text = clean_value(trim_text_raw)
         car_data['model'] = f"{car_data['model']} {trim_text}".strip()
-    elif trim_span:
-        car_data['model'] = clean_value(trim_span.get_text())
+    elif trim_text_raw is not None:
+        car_data['model'] = clean_value(trim_text_raw)
 
     # --- Extracción de Precios ---
-    price_wrapper = soup.find('div', class_='stock-vehicle-detail__header--price-wrapper')
-    if price_wrapper:
-        cash_price_div = price_wrapper.find('div', class_='price-financed--header__cash')
-        if cash_price_div:
-            cash_value_p = cash_price_div.find('p', class_='price__value')
-            if cash_value_p:
-                car_data['price_cash'] = clean_value(cash_value_p.get_text())
-
-        financed_price_div = price_wrapper.find('div', class_='price-financed--header__financed')
-        if financed_price_div:
-            financed_value_p = financed_price_div.find('p', class_='price__value')
-            if financed_value_p:
-                car_data['price_financed'] = clean_value(financed_value_p.get_text())
+    cash_price, financed_price = parser.prices()
+    if cash_price is not None:
+        car_data['price_cash'] = clean_value(cash_price)
+    if financed_price is not None:
+        car_data['price_financed'] = clean_value(financed_price)
 
     # --- Extracción de Stock Vehicle Highlights List ---
-    highlights_list = soup.find('ul', class_='stock-vehicle-highlights-list')
-    if highlights_list:
-        list_items = highlights_list.find_all('li', class_=re.compile(r'stock-vehicle-highlights-list__item'))
-        if list_items:
-            for item in list_items:
-                label_span = item.find('span', class_='stock-vehicle-highlights-list__item-label')
-                value_span = item.find('span', class_='stock-vehicle-highlights-list__item-value')
-
-                if label_span and value_span:
-                    raw_label = label_span.get_text()
-                    cleaned_label_for_comp = clean_label_for_comparison(raw_label)
-                    raw_value = value_span.get_text()
-
-                    if cleaned_label_for_comp == 'condicion':
-                        car_data['condition'] = clean_value(raw_value)
-                    elif cleaned_label_for_comp == 'carroceria':
-                        car_data['body_type'] = clean_value(raw_value)
-                    elif cleaned_label_for_comp == 'matriculacion':
-                        match = re.search(r'(\d{4})$', raw_value)
-                        if match:
-                            car_data['registration_year'] = match.group(1)
-                        else:
-                            car_data['registration_year'] = clean_value(raw_value)
-                    elif cleaned_label_for_comp == 'kilometros':
-                        car_data['kilometros'] = clean_value(raw_value)
-                    elif cleaned_label_for_comp == 'combustible':
-                        car_data['fuel_type'] = clean_value(raw_value)
-                    elif cleaned_label_for_comp == 'eficienciaco2':
-                        car_data['co2_class_combined'] = clean_value(raw_value)
-                    elif cleaned_label_for_comp == 'cambio':
-                        car_data['transmission'] = clean_value(raw_value)
-                    elif cleaned_label_for_comp == 'potencia':
-                        match_cv_parentheses = re.search(r'\((\d+)\s*CV\)', raw_value, re.IGNORECASE)
-                        if match_cv_parentheses:
-                            car_data['engine_cv'] = match_cv_parentheses.group(1)
-                        else:
-                            cleaned_val_for_numbers = clean_value(raw_value)
-                            numbers_only_match = re.search(r'(\d+)', cleaned_val_for_numbers)
-                            if numbers_only_match:
-                                car_data['engine_cv'] = numbers_only_match.group(1)
-                            else:
-                                car_data['engine_cv'] = cleaned_val_for_numbers
-                    elif cleaned_label_for_comp == 'traccion':
-                        car_data['traction'] = clean_value(raw_value)
-                    elif cleaned_label_for_comp == 'plazas':
-                        car_data['seats'] = clean_value(raw_value)
+    for raw_label, raw_value in parser.highlights():
+        entry = _HIGHLIGHT_DISPATCH.get(clean_label_for_comparison(raw_label))
+        if entry:
+            field, parse = entry
+            car_data[field] = parse(raw_value)
 
     # --- Extracción de Detalles de Pestañas y Especificaciones Adicionales ---
     # Estos campos se inicializan a N/A y solo se llenarán si se encuentran en el HTML inicial.
     # Dado que no se interactúa con pestañas, seguirán siendo N/A si están detrás de una interacción.
 
     # Especificaciones adicionales (Único Propietario, ITV, IVA, Llaves)
-    specs_rows = soup.find_all('div', class_='stock-vehicle-detail__specs--row')
-    if specs_rows:
-        for row in specs_rows:
-            label_tag = row.find('div', class_='stock-vehicle-detail__specs--label')
-            value_tag = row.find('div', class_='stock-vehicle-detail__specs--value')
-            if label_tag and value_tag:
-                raw_label = label_tag.get_text()
-                cleaned_label_for_comp = clean_label_for_comparison(raw_label.replace(':', ''))
-                raw_value = value_tag.get_text()
-
-                if cleaned_label_for_comp == 'unicopropietario':
-                    car_data['unique_owner'] = clean_value(raw_value)
-                elif cleaned_label_for_comp == 'itvvalidahasta':
-                    car_data['itv_valid_until'] = clean_value(raw_value)
-                elif cleaned_label_for_comp == 'tipodeiva':
-                    car_data['iva_type'] = clean_value(raw_value)
-                elif cleaned_label_for_comp == 'numerodellaves':
-                    car_data['number_of_keys'] = clean_value(raw_value)
+    for raw_label, raw_value in parser.specs():
+        entry = _SPEC_DISPATCH.get(clean_label_for_comparison(raw_label.replace(':', '')))
+        if entry:
+            field, parse = entry
+            car_data[field] = parse(raw_value)
 
     # Equipamiento (Exterior, Interior, Confort, Seguridad, Extras)
-    equipamiento_tabs_content_wrapper = soup.find('div', class_='elektra-tabs__content-wrapper')
-    if equipamiento_tabs_content_wrapper:
-        tab_categories_mapping = {
-            'exterior': 'panel-equipamiento-exterior',
-            'interior': 'panel-equipamiento-interior',
-            'confort': 'panel-equipamiento-confort',
-            'seguridad': 'panel-equipamiento-seguridad',
-            'extras': 'panel-equipamiento-extras',
-        }
-        for category_key, panel_id in tab_categories_mapping.items():
-            panel = equipamiento_tabs_content_wrapper.find('div', id=panel_id)
-            if panel:
-                items = panel.find_all('p', class_='text__body-default')
-                if items:
-                    car_data[f'details_{category_key}'] = "; ".join([clean_value(item.get_text()) for item in items])
+    equipment_panels = parser.equipment()
+    for category_key, panel_id in EQUIPMENT_PANELS.items():
+        items = equipment_panels.get(panel_id)
+        if items:
+            car_data[f'details_{category_key}'] = "; ".join([clean_value(item) for item in items])
 
     # Asignar las URLs de las imágenes recopiladas por Playwright
     car_data['images'] = image_urls_from_playwright
@@ -200,4 +384,24 @@ def generate_guid_from_data(url: str) -> str:
     Genera un GUID (identificador único global) basado en la URL del coche.
     Esto asegura que cada coche tenga un identificador único y consistente.
     """
-    return hashlib.md5(url.encode('utf-8')).hexdigest()
\ No newline at end of file
+    return hashlib.md5(url.encode('utf-8')).hexdigest()
+
+
+# Bloques del HTML que cambian en cada petición (scripts con nonces, tokens CSRF, comentarios...)
+# y que no deben afectar a la huella del anuncio.
+_VOLATILE_HTML_REGEX = re.compile(
+    r'<script\b.*?</script>|<style\b.*?</style>|<noscript\b.*?</noscript>|<!--.*?-->|<meta\b[^>]*>'
+    r'|<input\b[^>]*type=["\']hidden["\'][^>]*>',
+    re.IGNORECASE | re.DOTALL)
+
+
+def fingerprint_html(html_content: str) -> str:
+    """
+    Calcula una huella SHA-256 estable del HTML de un anuncio, ignorando scripts, estilos, metadatos
+    y espacios. Dos descargas del mismo anuncio sin cambios deben dar la misma huella.
+    """
+    if not html_content:
+        return None
+    stable_html = _VOLATILE_HTML_REGEX.sub('', html_content)
+    stable_html = re.sub(r'\s+', ' ', stable_html).strip()
+    return hashlib.sha256(stable_html.encode('utf-8')).hexdigest()
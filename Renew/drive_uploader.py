@@ -1,17 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+import hashlib
+import json
+import mimetypes
 import os
 import pickle  # Importamos pickle para guardar/cargar tokens
+import random
+import sqlite3
+import threading
+import time
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload
 
+from config import (DRIVE_UPLOAD_WORKERS, DRIVE_RESUMABLE_THRESHOLD, DRIVE_UPLOAD_MAX_RETRIES,
+                    DRIVE_UPLOAD_MANIFEST_DB, DRIVE_API_ENDPOINT, DRIVE_FOLDER_CACHE_FILE,
+                    DRIVE_FOLDER_CACHE_TTL_HOURS, DRIVE_CONTENT_INDEX_DB, DRIVE_DEDUP_SHORTCUTS)
+
 # Si modificas estos 'scopes', elimina el archivo token.pickle.
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
 
 
-def authenticate_google_drive():
-    """Autentica con la API de Google Drive, solicitando verificación si es necesario."""
+# Respuestas de Drive que se reintentan: límite de peticiones y errores temporales del servidor
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+SHORTCUT_MIME_TYPE = 'application/vnd.google-apps.shortcut'
+
+# Máximo de peticiones por lote (batch) que admite la API de Drive
+DRIVE_BATCH_SIZE = 100
+
+# Tamaño de cada trozo de las subidas reanudables (múltiplo de 256 KB, como exige la API)
+RESUMABLE_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def get_drive_credentials():
+    """Carga (o solicita) las credenciales de Google Drive, guardándolas en token.pickle."""
     creds = None
     # El archivo token.pickle almacena los tokens de acceso y actualización del usuario.
     # Se crea automáticamente cuando el flujo de autorización se completa por primera vez.
@@ -33,52 +62,585 @@ def authenticate_google_drive():
         # Guardar las credenciales para la próxima ejecución en token.pickle
         with open('token.pickle', 'wb') as token:
             pickle.dump(creds, token)
+    return creds
+
+
+def build_drive_service(creds):
+    """
+    Crea un cliente de la API de Drive. Si DRIVE_API_ENDPOINT está definido, todas las peticiones (metadatos,
+    subidas y lotes) van a esa raíz en lugar de a Google.
+    """
+    if not DRIVE_API_ENDPOINT:
+        return build('drive', 'v3', credentials=creds, cache_discovery=False)
+    # client_options solo cambiaría la base de los metadatos: las subidas seguirían en https y los lotes
+    # irían a Google. Por eso se cambia la raíz en el documento de descubrimiento que trae la librería.
+    document = json.loads(discovery_cache.get_static_doc('drive', 'v3'))
+    document['rootUrl'] = document['mtlsRootUrl'] = DRIVE_API_ENDPOINT.rstrip('/') + '/'
+    return build_from_document(document, credentials=creds)
+
+
+def authenticate_google_drive():
+    """Autentica con la API de Google Drive, solicitando verificación si es necesario."""
+    return build_drive_service(get_drive_credentials())
+
+
+class DriveFolderRegistry:
+    """
+    Registro de las subcarpetas de una carpeta padre de Drive (nombre → ID).
+    Lista los hijos del padre una sola vez (paginando) y guarda el resultado en DRIVE_FOLDER_CACHE_FILE durante
+    DRIVE_FOLDER_CACHE_TTL_HOURS, así que buscar la carpeta de un coche ya no cuesta una consulta por anuncio.
+    Las carpetas que faltan se crean de 100 en 100 con el endpoint batch de Drive. Es seguro usarlo desde varios hilos;
+    cada llamada usa el cliente de Drive (`service`) de quien la hace, porque no se pueden compartir entre hilos.
+    """
+
+    def __init__(self, parent_folder_id: str = None, cache_path: str = DRIVE_FOLDER_CACHE_FILE,
+                 ttl_hours: float = DRIVE_FOLDER_CACHE_TTL_HOURS):
+        self.parent_folder_id = parent_folder_id
+        self.cache_path = cache_path
+        self.ttl_hours = ttl_hours
+        self._lock = threading.Lock()
+        self._folders = None
+
+    def _cache_key(self) -> str:
+        return self.parent_folder_id or 'root'
+
+    def _load_cache(self):
+        """Retorna el mapa nombre → ID guardado para este padre, o None si no existe o ha caducado."""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f).get(self._cache_key())
+        except (OSError, ValueError) as e:
+            print(f"Caché de carpetas de Drive ilegible ({e}); se vuelve a listar.")
+            return None
+        if not entry or time.time() - entry['listed_at'] > self.ttl_hours * 3600:
+            return None
+        return entry['folders']
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        cache = {}
+        if os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, 'r', encoding='utf-8') as f:
+                    cache = json.load(f)
+            except (OSError, ValueError):
+                cache = {}
+        # El archivo guarda los registros de todos los padres: solo se toca la entrada de este
+        if self._folders is None:
+            cache.pop(self._cache_key(), None)
+        else:
+            cache[self._cache_key()] = {'listed_at': time.time(), 'folders': self._folders}
+        with open(self.cache_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+
+    def _list_children(self, service) -> dict:
+        """Lista todas las subcarpetas del padre con paginación (1000 por página)."""
+        query = f"mimeType='{FOLDER_MIME_TYPE}' and trashed=false and '{self._cache_key()}' in parents"
+        folders = {}
+        page_token = None
+        while True:
+            request = service.files().list(q=query, spaces='drive', pageSize=1000, pageToken=page_token,
+                                           fields='nextPageToken, files(id, name)')
+            response = execute_with_backoff(request)
+            for item in response.get('files', []):
+                folders.setdefault(item['name'], item['id'])
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return folders
 
-    service = build('drive', 'v3', credentials=creds)
-    return service
+    def _ensure_loaded(self, service):
+        # Se llama con el lock tomado
+        if self._folders is None:
+            self._folders = self._load_cache()
+            if self._folders is None:
+                self._folders = self._list_children(service)
+                self._save_cache()
+                print(f"Carpetas de Drive listadas: {len(self._folders)} subcarpetas en '{self._cache_key()}'.")
+
+    def invalidate(self, folder_name: str = None):
+        """
+        Olvida la caché entera (o solo `folder_name`), p. ej. si Drive responde 404 para un ID guardado.
+        La próxima consulta vuelve a listar el padre.
+        """
+        with self._lock:
+            if folder_name is None or self._folders is None:
+                self._folders = None
+            else:
+                self._folders.pop(folder_name, None)
+            self._save_cache()
+
+    def folder_name_for(self, folder_id: str):
+        """Nombre con el que está en caché la carpeta `folder_id`, o None si este registro no la conoce."""
+        with self._lock:
+            if self._folders is None:
+                return None
+            return next((name for name, cached_id in self._folders.items() if cached_id == folder_id), None)
+
+    def _create_folders_batch(self, service, folder_names: list[str]) -> dict:
+        """Crea las carpetas en lotes de DRIVE_BATCH_SIZE; las que fallen en el lote se reintentan una a una."""
+        created = {}
+        for start in range(0, len(folder_names), DRIVE_BATCH_SIZE):
+            chunk = folder_names[start:start + DRIVE_BATCH_SIZE]
+            failed = []
+
+            def on_response(request_id, response, exception, chunk=chunk, failed=failed):
+                if exception is not None:
+                    failed.append(chunk[int(request_id)])
+                else:
+                    created[chunk[int(request_id)]] = response['id']
+
+            batch = service.new_batch_http_request(callback=on_response)
+            for index, folder_name in enumerate(chunk):
+                batch.add(service.files().create(body=self._folder_metadata(folder_name), fields='id'),
+                          request_id=str(index))
+            execute_with_backoff(batch)
+
+            for folder_name in failed:
+                request = service.files().create(body=self._folder_metadata(folder_name), fields='id')
+                created[folder_name] = execute_with_backoff(request)['id']
+        return created
+
+    def _folder_metadata(self, folder_name: str) -> dict:
+        file_metadata = {'name': folder_name, 'mimeType': FOLDER_MIME_TYPE}
+        if self.parent_folder_id:
+            file_metadata['parents'] = [self.parent_folder_id]
+        return file_metadata
+
+    def ensure_folders(self, service, folder_names: list[str]) -> dict:
+        """Retorna {nombre: ID} para todas las carpetas pedidas, creando de una vez las que falten."""
+        with self._lock:
+            self._ensure_loaded(service)
+            missing = sorted({name for name in folder_names if name not in self._folders})
+            if missing:
+                created = self._create_folders_batch(service, missing)
+                self._folders.update(created)
+                self._save_cache()
+                print(f"Carpetas creadas en Drive: {len(created)}")
+            return {name: self._folders[name] for name in folder_names}
+
+    def get_or_create(self, service, folder_name: str) -> str:
+        """Retorna el ID de la subcarpeta `folder_name`, creándola si no existe."""
+        return self.ensure_folders(service, [folder_name])[folder_name]
+
+
+# Un registro por carpeta padre, compartido por todas las llamadas a create_drive_folder_if_not_exists
+_folder_registries = {}
+_folder_registries_lock = threading.Lock()
+
+
+def folder_registry(parent_folder_id=None) -> DriveFolderRegistry:
+    """Retorna el DriveFolderRegistry de `parent_folder_id` (None = raíz de Drive), creándolo la primera vez."""
+    with _folder_registries_lock:
+        if parent_folder_id not in _folder_registries:
+            _folder_registries[parent_folder_id] = DriveFolderRegistry(parent_folder_id)
+        return _folder_registries[parent_folder_id]
 
 
 def create_drive_folder_if_not_exists(service, folder_name, parent_folder_id=None):
     """
     Crea una carpeta en Google Drive si no existe.
-    Retorna el ID de la carpeta.
+    Retorna el ID de la carpeta. Usa el registro en caché del padre: no hace una consulta por llamada.
+    Para muchas carpetas a la vez, usa folder_registry(parent).ensure_folders(service, nombres).
+    """
+    return folder_registry(parent_folder_id).get_or_create(service, folder_name)
+
+
+def refresh_stale_folder(service, folder_id: str):
+    """
+    Para cuando Drive responde 404 a una carpeta que salió de un registro (p. ej. se borró a mano): la olvida
+    y la vuelve a resolver por su nombre, creándola de nuevo. Retorna el ID nuevo, o None si ningún registro
+    tenía ese ID en caché.
+    """
+    with _folder_registries_lock:
+        registries = list(_folder_registries.values())
+    for registry in registries:
+        folder_name = registry.folder_name_for(folder_id)
+        if folder_name is not None:
+            registry.invalidate(folder_name)
+            return registry.get_or_create(service, folder_name)
+    return None
+
+
+def _media_for_file(file_path: str) -> MediaFileUpload:
+    """
+    Los archivos pequeños (la mayoría de JPEG) se suben en una sola petición multipart;
+    solo los que superan DRIVE_RESUMABLE_THRESHOLD usan una sesión reanudable por trozos.
+    """
+    mimetype = mimetypes.guess_type(file_path)[0] or 'image/jpeg'
+    if os.path.getsize(file_path) > DRIVE_RESUMABLE_THRESHOLD:
+        return MediaFileUpload(file_path, mimetype=mimetype, resumable=True, chunksize=RESUMABLE_CHUNK_SIZE)
+    return MediaFileUpload(file_path, mimetype=mimetype, resumable=False)
+
+
+def execute_with_backoff(request, max_retries: int = DRIVE_UPLOAD_MAX_RETRIES):
+    """
+    Ejecuta una petición de la API de Drive reintentando los errores 429/5xx con espera exponencial y azar.
+    En las subidas reanudables se reutiliza la misma petición, que continúa desde el último trozo confirmado.
     """
-    query = f"mimeType='application/vnd.google-apps.folder' and name='{folder_name}' and trashed=false"
-    if parent_folder_id:
-        query += f" and '{parent_folder_id}' in parents"
+    for attempt in range(max_retries + 1):
+        try:
+            return request.execute()
+        except HttpError as e:
+            if e.resp.status not in RETRYABLE_STATUS_CODES or attempt == max_retries:
+                raise
+            delay = 2 ** attempt + random.uniform(0, 1)
+            print(f"Drive respondió {e.resp.status}; reintento {attempt + 1}/{max_retries} en {delay:.1f} s.")
+            time.sleep(delay)
 
-    results = service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
-    items = results.get('files', [])
 
-    if not items:
-        file_metadata = {
-            'name': folder_name,
-            'mimeType': 'application/vnd.google-apps.folder'
-        }
-        if parent_folder_id:
-            file_metadata['parents'] = [parent_folder_id]
+def file_md5(file_path: str) -> str:
+    """MD5 del contenido del archivo, el mismo valor que Drive expone como md5Checksum."""
+    digest = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-        file = service.files().create(body=file_metadata, fields='id').execute()
-        print(f"Carpeta creada: {folder_name} (ID: {file.get('id')})")
-        return file.get('id')
-    else:
-        print(f"La carpeta '{folder_name}' ya existe (ID: {items[0].get('id')})")
-        return items[0].get('id')
 
+_CONTENT_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS drive_content (
+    md5 TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    web_view_link TEXT,
+    name TEXT,
+    indexed_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS drive_content_folders (
+    md5 TEXT NOT NULL,
+    folder_id TEXT NOT NULL,
+    PRIMARY KEY (md5, folder_id)
+);
+"""
 
-def upload_image_to_drive(service, file_path, folder_id):
+
+class ContentHashIndex:
+    """
+    Índice local (SQLite) de las imágenes que ya están en Drive, por su MD5 (el md5Checksum de Drive).
+    upload_image_to_drive lo consulta para no volver a subir fotos idénticas: las de un anuncio re-scrapeado
+    y las fotos de stock que el concesionario repite en varios anuncios. También guarda en qué carpetas está ya
+    cada contenido (la del archivo y las de sus accesos directos), para no enlazarlo dos veces en la misma.
+    Es seguro usarlo desde varios hilos. Si se pierde o se desincroniza, se reconstruye con rebuild_from_drive.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._hash_locks = {}  # md5 → [lock, hilos que lo usan]; solo los hashes en uso ahora mismo
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_CONTENT_INDEX_SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @contextmanager
+    def lock_for(self, md5: str):
+        """
+        Lock por hash, para que dos hilos con la misma imagen no la suban los dos a la vez.
+        Se borra cuando ningún hilo lo usa, así que no crece con cada MD5 distinto del lote.
+        """
+        with self._lock:
+            entry = self._hash_locks.setdefault(md5, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._hash_locks[md5]
+
+    def lookup(self, md5: str):
+        """Retorna (file_id, web_view_link) del archivo de Drive con ese contenido, o None."""
+        with self._lock:
+            row = self._conn.execute("SELECT file_id, web_view_link FROM drive_content WHERE md5 = ?",
+                                     (md5,)).fetchone()
+        return (row['file_id'], row['web_view_link']) if row else None
+
+    def is_in_folder(self, md5: str, folder_id: str) -> bool:
+        """True si ese contenido ya está en `folder_id`, como archivo o como acceso directo."""
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM drive_content_folders WHERE md5 = ? AND folder_id = ?",
+                                     (md5, folder_id)).fetchone()
+        return row is not None
+
+    def add(self, md5: str, file_id: str, web_view_link: str = None, name: str = None, folder_id: str = None):
+        with self._lock:
+            self._conn.execute("DELETE FROM drive_content_folders WHERE md5 = ?", (md5,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO drive_content (md5, file_id, web_view_link, name, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?)", (md5, file_id, web_view_link, name, datetime.now().isoformat()))
+            if folder_id:
+                self._conn.execute("INSERT INTO drive_content_folders (md5, folder_id) VALUES (?, ?)",
+                                   (md5, folder_id))
+            self._conn.commit()
+
+    def add_folder(self, md5: str, folder_id: str):
+        """Anota que ese contenido ya está también en `folder_id` (se ha creado allí un acceso directo)."""
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO drive_content_folders (md5, folder_id) VALUES (?, ?)",
+                               (md5, folder_id))
+            self._conn.commit()
+
+    def forget(self, file_id: str):
+        """Quita del índice un archivo que ya no existe en Drive."""
+        with self._lock:
+            self._conn.execute("DELETE FROM drive_content_folders WHERE md5 IN "
+                               "(SELECT md5 FROM drive_content WHERE file_id = ?)", (file_id,))
+            self._conn.execute("DELETE FROM drive_content WHERE file_id = ?", (file_id,))
+            self._conn.commit()
+
+    def rebuild_from_drive(self, service) -> int:
+        """
+        Vacía el índice y lo vuelve a llenar listando (con paginación) todas las imágenes no borradas de Drive,
+        con las carpetas donde está cada una y las de sus accesos directos.
+        """
+        entries = []
+        folders = set()
+        md5_by_file_id = {}
+        for item in _list_all_files(service, "mimeType contains 'image/' and trashed=false",
+                                    'id, name, md5Checksum, webViewLink, parents'):
+            if item.get('md5Checksum'):
+                entries.append((item['md5Checksum'], item['id'], item.get('webViewLink'), item.get('name')))
+                md5_by_file_id[item['id']] = item['md5Checksum']
+                folders.update((item['md5Checksum'], parent) for parent in item.get('parents', []))
+        for item in _list_all_files(service, f"mimeType='{SHORTCUT_MIME_TYPE}' and trashed=false",
+                                    'parents, shortcutDetails'):
+            md5 = md5_by_file_id.get(item.get('shortcutDetails', {}).get('targetId'))
+            if md5:
+                folders.update((md5, parent) for parent in item.get('parents', []))
+        now = datetime.now().isoformat()
+        with self._lock:
+            self._conn.execute("DELETE FROM drive_content")
+            self._conn.execute("DELETE FROM drive_content_folders")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO drive_content (md5, file_id, web_view_link, name, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?)", [entry + (now,) for entry in entries])
+            self._conn.executemany("INSERT OR IGNORE INTO drive_content_folders (md5, folder_id) VALUES (?, ?)",
+                                   sorted(folders))
+            self._conn.commit()
+        print(f"Índice de contenido de Drive reconstruido: {len(entries)} imágenes.")
+        return len(entries)
+
+
+def _list_all_files(service, query: str, file_fields: str) -> list[dict]:
+    """Todos los archivos que cumplen `query`, recorriendo las páginas de 1000 en 1000."""
+    files = []
+    page_token = None
+    while True:
+        request = service.files().list(q=query, spaces='drive', pageSize=1000, pageToken=page_token,
+                                       fields=f'nextPageToken, files({file_fields})')
+        response = execute_with_backoff(request)
+        files += response.get('files', [])
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return files
+
+
+def _file_exists(service, file_id: str) -> bool:
+    """True si el archivo `file_id` sigue en Drive y no está en la papelera."""
+    try:
+        file = execute_with_backoff(service.files().get(fileId=file_id, fields='id, trashed'))
+    except HttpError as e:
+        if e.resp.status != 404:
+            raise
+        return False
+    return not file.get('trashed')
+
+
+def _link_existing_file(service, file_id: str, file_name: str, folder_id: str):
+    """Crea en `folder_id` un acceso directo al archivo `file_id`. Lanza HttpError 404 si el archivo ya no existe."""
+    shortcut_metadata = {'name': file_name, 'mimeType': SHORTCUT_MIME_TYPE, 'parents': [folder_id],
+                         'shortcutDetails': {'targetId': file_id}}
+    execute_with_backoff(service.files().create(body=shortcut_metadata, fields='id'))
+
+
+def upload_image_to_drive(service, file_path, folder_id, content_index: ContentHashIndex = None):
     """
     Sube un archivo de imagen a una carpeta específica de Google Drive.
     Retorna el ID del archivo y un enlace de vista web.
+    Con `content_index`, si ya hay en Drive una imagen con el mismo MD5 no se sube otra vez: se retorna
+    la existente (y se crea un acceso directo en `folder_id` si DRIVE_DEDUP_SHORTCUTS está activo).
+    Si `folder_id` viene de un registro de carpetas y Drive ya no la tiene, se vuelve a crear y se sube allí.
     """
     file_name = os.path.basename(file_path)
-    file_metadata = {'name': file_name, 'parents': [folder_id]}
-    media = MediaFileUpload(file_path, mimetype='image/jpeg', resumable=True)
-
     try:
-        file = service.files().create(body=file_metadata, media_body=media, fields='id, webViewLink').execute()
-        print(f"Subido '{file_name}' (ID: {file.get('id')})")
-        return file.get('id'), file.get('webViewLink')  # Retorna tanto el ID como el webViewLink
+        try:
+            return _store_in_folder(service, file_path, folder_id, content_index)
+        except HttpError as e:
+            new_folder_id = refresh_stale_folder(service, folder_id) if e.resp.status == 404 else None
+            if new_folder_id is None:
+                raise
+            print(f"La carpeta {folder_id} ya no existe en Drive; '{file_name}' se sube a la nueva ({new_folder_id}).")
+            return _store_in_folder(service, file_path, new_folder_id, content_index)
     except Exception as e:
         print(f"Error al subir {file_name}: {e}")
-        return None, None
\ No newline at end of file
+        return None, None
+
+
+def _store_in_folder(service, file_path: str, folder_id: str, content_index: ContentHashIndex = None) -> tuple:
+    """Sube (o enlaza, si el índice ya tiene su contenido) el archivo en `folder_id`. Deja pasar los HttpError."""
+    file_name = os.path.basename(file_path)
+    file_metadata = {'name': file_name, 'parents': [folder_id]}
+    if content_index is None:
+        return _upload_file(service, file_path, file_metadata)
+    md5 = file_md5(file_path)
+    with content_index.lock_for(md5):
+        existing = content_index.lookup(md5)
+        if existing and content_index.is_in_folder(md5, folder_id):
+            # Típico de un anuncio re-scrapeado: sus fotos se descargan otra vez con otra fecha y el manifiesto
+            # no las reconoce, pero el archivo (o un acceso directo) ya está en esa carpeta
+            print(f"'{file_name}' ya está en esa carpeta de Drive (ID: {existing[0]}); no se vuelve a subir.")
+            return existing
+        if existing:
+            try:
+                if DRIVE_DEDUP_SHORTCUTS:
+                    _link_existing_file(service, existing[0], file_name, folder_id)
+                    content_index.add_folder(md5, folder_id)
+                print(f"'{file_name}' ya está en Drive (ID: {existing[0]}); no se vuelve a subir.")
+                return existing
+            except HttpError as e:
+                # El 404 puede ser del archivo indexado o de la carpeta destino (borrada pero aún en caché).
+                # Solo si el archivo ya no existe se olvida y se sube de nuevo; si no, el error sube hasta
+                # upload_image_to_drive, que vuelve a resolver la carpeta y enlaza allí el archivo existente.
+                if e.resp.status != 404 or _file_exists(service, existing[0]):
+                    raise
+                content_index.forget(existing[0])
+        file_id, web_view_link = _upload_file(service, file_path, file_metadata)
+        content_index.add(md5, file_id, web_view_link, file_name, folder_id)
+        return file_id, web_view_link
+
+
+def _upload_file(service, file_path: str, file_metadata: dict) -> tuple:
+    request = service.files().create(body=file_metadata, media_body=_media_for_file(file_path),
+                                     fields='id, webViewLink')
+    file = execute_with_backoff(request)
+    print(f"Subido '{file_metadata['name']}' (ID: {file.get('id')})")
+    return file.get('id'), file.get('webViewLink')  # Retorna tanto el ID como el webViewLink
+
+
+_MANIFEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    file_path TEXT NOT NULL,
+    folder_id TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    file_id TEXT NOT NULL,
+    web_view_link TEXT,
+    uploaded_at TEXT NOT NULL,
+    PRIMARY KEY (file_path, folder_id)
+)
+"""
+
+
+class UploadManifest:
+    """
+    Registro persistente (SQLite) de los archivos ya subidos a cada carpeta de Drive.
+    Un archivo cuenta como subido mientras no cambien su tamaño ni su fecha de modificación,
+    así que al relanzar un lote interrumpido solo se sube lo que faltaba. Es seguro usarlo desde varios hilos.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(_MANIFEST_SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, file_path: str, folder_id: str):
+        """Retorna (file_id, web_view_link) si el archivo ya se subió sin cambios a esa carpeta, o None."""
+        stat = os.stat(file_path)
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM uploads WHERE file_path = ? AND folder_id = ?",
+                                     (os.path.abspath(file_path), folder_id)).fetchone()
+        if row is None or row['size'] != stat.st_size or row['mtime'] != stat.st_mtime:
+            return None
+        return row['file_id'], row['web_view_link']
+
+    def record(self, file_path: str, folder_id: str, file_id: str, web_view_link: str):
+        stat = os.stat(file_path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO uploads (file_path, folder_id, size, mtime, file_id, web_view_link, "
+                "uploaded_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(file_path), folder_id, stat.st_size, stat.st_mtime, file_id, web_view_link,
+                 datetime.now().isoformat()))
+            self._conn.commit()
+
+
+def upload_images_to_drive(uploads: list[tuple[str, str]], creds=None, workers: int = DRIVE_UPLOAD_WORKERS,
+                           manifest_path: str = DRIVE_UPLOAD_MANIFEST_DB,
+                           content_index_path: str = DRIVE_CONTENT_INDEX_DB) -> list[tuple]:
+    """
+    Sube en paralelo una lista de (ruta_del_archivo, id_de_carpeta) con un pool de `workers` hilos.
+    Los archivos que el manifiesto ya tiene como subidos se saltan, y los que tienen el mismo contenido que
+    una imagen ya subida se enlazan en lugar de subirse (ver ContentHashIndex; None lo desactiva).
+    Cada hilo usa su propio cliente de Drive,
+    porque los clientes de googleapiclient no se pueden compartir entre hilos.
+    Retorna una lista de (file_id, web_view_link) en el mismo orden que `uploads`; (None, None) si falló.
+    """
+    if not uploads:
+        return []
+    creds = creds or get_drive_credentials()
+    thread_state = threading.local()
+
+    content_index = ContentHashIndex(content_index_path) if content_index_path else None
+    with UploadManifest(manifest_path) as manifest:
+        results = []
+        pending = []
+        for index, (file_path, folder_id) in enumerate(uploads):
+            try:
+                result = manifest.get(file_path, folder_id)
+            except OSError as e:
+                # Un archivo que ya no está en disco no detiene el lote: cuenta como fallido
+                print(f"No se puede leer {file_path} ({e}); no se sube.")
+                result = (None, None)
+            if result is None:
+                pending.append(index)
+            results.append(result)
+        print(f"Subida a Drive: {len(pending)} archivos pendientes, {len(uploads) - len(pending)} ya subidos "
+              f"o ilegibles.")
+
+        def upload(index):
+            if not hasattr(thread_state, 'service'):
+                thread_state.service = build_drive_service(creds)
+            file_path, folder_id = uploads[index]
+            file_id, web_view_link = upload_image_to_drive(thread_state.service, file_path, folder_id, content_index)
+            if file_id:
+                try:
+                    manifest.record(file_path, folder_id, file_id, web_view_link)
+                except OSError as e:
+                    # Borrado después de subirlo: está en Drive, pero se volverá a comprobar en el próximo lote
+                    print(f"No se puede registrar {file_path} en el manifiesto ({e}).")
+            return file_id, web_view_link
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pending) or 1))) as executor:
+            for index, result in zip(pending, executor.map(upload, pending)):
+                results[index] = result
+    if content_index:
+        content_index.close()
+
+    failed = sum(1 for file_id, _ in results if file_id is None)
+    print(f"Subida a Drive finalizada: {len(uploads) - failed} archivos en Drive, {failed} con error.")
+    return results
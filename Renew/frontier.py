@@ -0,0 +1,146 @@
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from data_processor import generate_guid_from_data
+
+# Prioridades de la cola: primero lo nuevo, después lo que ha cambiado hace poco y al final el resto
+PRIORITY_NEW = 0
+PRIORITY_RECENTLY_CHANGED = 1
+PRIORITY_KNOWN = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS frontier (
+    guid TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    discovered_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS frontier_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+)
+"""
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+class CrawlFrontier:
+    """
+    Cola persistente (SQLite) de URLs de fichas pendientes de scrapear, sin duplicados por GUID.
+    Si una ejecución se interrumpe, las URLs que quedaron 'pending' se retoman en la siguiente
+    en lugar de volver a recorrer el buscador. Es seguro marcar resultados desde varios hilos.
+    Estados: 'pending', 'done', 'failed' y 'gone' (la ficha respondió 404/410).
+    También recuerda si el descubrimiento de la ronda recorrió el buscador entero (ver discovery_complete).
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM frontier WHERE status = 'pending'").fetchone()[0]
+
+    def reset(self):
+        """Vacía la cola para empezar una ronda de rastreo nueva."""
+        with self._lock:
+            self._conn.execute("DELETE FROM frontier")
+            self._conn.execute("DELETE FROM frontier_meta")
+            self._conn.commit()
+
+    def set_discovery_complete(self, complete: bool):
+        """Guarda si la ronda actual contiene todo el stock publicado (el buscador se recorrió sin errores)."""
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO frontier_meta (key, value) VALUES ('discovery_complete', ?)",
+                               ('1' if complete else '0',))
+            self._conn.commit()
+
+    def discovery_complete(self) -> bool:
+        """True si la ronda actual se descubrió entera; solo entonces lo que falta en la cola es una baja."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM frontier_meta WHERE key = 'discovery_complete'").fetchone()
+        return row is not None and row['value'] == '1'
+
+    def add(self, urls: list[str], priority_for=None) -> int:
+        """
+        Añade URLs a la cola ignorando las que ya están (mismo GUID).
+        `priority_for(guid)` decide la prioridad de cada una; por defecto todas son PRIORITY_NEW.
+        Retorna cuántas URLs nuevas se han encolado.
+        """
+        now = _now()
+        added = 0
+        with self._lock:
+            for url in urls:
+                guid = generate_guid_from_data(url)
+                priority = priority_for(guid) if priority_for else PRIORITY_NEW
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO frontier (guid, url, priority, discovered_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)", (guid, url, priority, now, now))
+                added += cursor.rowcount
+            self._conn.commit()
+        return added
+
+    def pending_urls(self) -> list[str]:
+        """URLs pendientes ordenadas por prioridad y, dentro de cada prioridad, por orden de descubrimiento."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url FROM frontier WHERE status = 'pending' ORDER BY priority, discovered_at, rowid").fetchall()
+        return [row['url'] for row in rows]
+
+    def active_guids(self) -> set:
+        """GUIDs de la ronda actual que siguen publicados (todos menos los marcados como 'gone')."""
+        with self._lock:
+            rows = self._conn.execute("SELECT guid FROM frontier WHERE status != 'gone'").fetchall()
+        return {row['guid'] for row in rows}
+
+    def gone_guids(self) -> set:
+        """GUIDs de la ronda actual cuya ficha respondió 404/410."""
+        with self._lock:
+            rows = self._conn.execute("SELECT guid FROM frontier WHERE status = 'gone'").fetchall()
+        return {row['guid'] for row in rows}
+
+    def mark(self, url: str, status: str):
+        with self._lock:
+            self._conn.execute("UPDATE frontier SET status = ?, updated_at = ? WHERE guid = ?",
+                               (status, _now(), generate_guid_from_data(url)))
+            self._conn.commit()
+
+    def mark_result(self, url: str, car_data: dict):
+        """Marca una URL como 'done' o 'failed' según el resultado de scrape_car_details."""
+        self.mark(url, 'failed' if 'error' in car_data else 'done')
+
+
+def listing_priority(store, recently_changed_days: int):
+    """
+    Construye la función de prioridad para CrawlFrontier.add a partir del ListingStateStore:
+    anuncios desconocidos o retirados → PRIORITY_NEW, cambiados en los últimos días → PRIORITY_RECENTLY_CHANGED.
+    """
+    threshold = (datetime.now() - timedelta(days=recently_changed_days)).isoformat()
+
+    def priority_for(guid: str) -> int:
+        row = store.get(guid) if store else None
+        if row is None or row['removed_at'] is not None:
+            return PRIORITY_NEW
+        if row['last_changed'] >= threshold:
+            return PRIORITY_RECENTLY_CHANGED
+        return PRIORITY_KNOWN
+
+    return priority_for
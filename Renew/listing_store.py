@@ -0,0 +1,126 @@
+import json
+import sqlite3
+from datetime import datetime
+
+# Claves del registro que cambian entre ejecuciones sin que cambie el anuncio; no cuentan como actualización
+VOLATILE_RECORD_KEYS = {'image_source', 'change_type'}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    guid TEXT PRIMARY KEY,
+    original_url TEXT NOT NULL,
+    html_hash TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    record_json TEXT,
+    images_json TEXT,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    last_changed TEXT NOT NULL,
+    removed_at TEXT
+)
+"""
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+def _comparable_record(record: dict) -> str:
+    stable = {k: v for k, v in record.items() if k not in VOLATILE_RECORD_KEYS and k != 'images'}
+    return json.dumps(stable, ensure_ascii=False, sort_keys=True)
+
+
+class ListingStateStore:
+    """
+    Estado persistente (SQLite) de los anuncios ya scrapeados, indexado por el GUID de
+    generate_guid_from_data. Guarda la huella del HTML, las cabeceras de caché, el registro extraído,
+    la lista de imágenes y las fechas, para que main.py solo vuelva a scrapear lo que ha cambiado.
+    No tiene bloqueo propio: si se usa desde varios hilos, las llamadas deben serializarse
+    (main.py lo hace con un lock al procesar cada resultado).
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, guid: str):
+        """Retorna la fila guardada del anuncio (sqlite3.Row) o None si no existe."""
+        return self._conn.execute("SELECT * FROM listings WHERE guid = ?", (guid,)).fetchone()
+
+    def get_record(self, guid: str) -> dict:
+        row = self.get(guid)
+        if row is None or row['record_json'] is None:
+            return None
+        record = json.loads(row['record_json'])
+        record['images'] = json.loads(row['images_json'] or '[]')
+        return record
+
+    def touch(self, guid: str):
+        """Marca un anuncio como visto en esta ejecución sin modificar su registro."""
+        self._conn.execute("UPDATE listings SET last_seen = ?, removed_at = NULL WHERE guid = ?", (_now(), guid))
+        self._conn.commit()
+
+    def upsert(self, record: dict, html_hash: str = None, etag: str = None, last_modified: str = None) -> str:
+        """
+        Guarda el registro extraído de un anuncio.
+        Retorna 'insert' si es nuevo, 'update' si ha cambiado (o vuelve tras haber sido retirado)
+        y 'unchanged' si es igual al guardado.
+        """
+        guid = record['guid']
+        images = record.get('images', [])
+        record_json = _comparable_record(record)
+        images_json = json.dumps(images, ensure_ascii=False)
+        now = _now()
+
+        row = self.get(guid)
+        if row is None:
+            self._conn.execute(
+                "INSERT INTO listings (guid, original_url, html_hash, etag, last_modified, record_json, images_json, "
+                "first_seen, last_seen, last_changed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (guid, record.get('original_url', ''), html_hash, etag, last_modified, record_json, images_json,
+                 now, now, now))
+            change = 'insert'
+        else:
+            changed = (row['record_json'] != record_json or row['images_json'] != images_json
+                       or row['removed_at'] is not None)
+            self._conn.execute(
+                "UPDATE listings SET original_url = ?, html_hash = ?, etag = ?, last_modified = ?, record_json = ?, "
+                "images_json = ?, last_seen = ?, last_changed = ?, removed_at = NULL WHERE guid = ?",
+                (record.get('original_url', row['original_url']), html_hash, etag, last_modified, record_json,
+                 images_json, now, now if changed else row['last_changed'], guid))
+            change = 'update' if changed else 'unchanged'
+        self._conn.commit()
+        return change
+
+    def active_guids(self) -> set:
+        """GUIDs de los anuncios que no están marcados como retirados."""
+        rows = self._conn.execute("SELECT guid FROM listings WHERE removed_at IS NULL").fetchall()
+        return {row['guid'] for row in rows}
+
+    def mark_removed(self, seen_guids: set) -> list[dict]:
+        """
+        Marca como retirados los anuncios activos que no se han visto en esta ejecución.
+        Retorna una fila {'guid', 'original_url', 'change_type': 'remove'} por cada uno.
+        """
+        now = _now()
+        removed = []
+        for row in self._conn.execute("SELECT guid, original_url FROM listings WHERE removed_at IS NULL").fetchall():
+            if row['guid'] not in seen_guids:
+                removed.append({'guid': row['guid'], 'original_url': row['original_url'], 'change_type': 'remove'})
+        self._conn.executemany("UPDATE listings SET removed_at = ? WHERE guid = ?",
+                               [(now, row['guid']) for row in removed])
+        self._conn.commit()
+        return removed
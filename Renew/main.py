@@ -1,27 +1,26 @@
-from playwright.sync_api import sync_playwright
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import csv
+from urllib.parse import urlparse
+import argparse
 import os
+import queue
 import re
-import time
+import threading
 
 # Importar funciones de data_processor.py
 from data_processor import extract_car_data, generate_guid_from_data
-
-# Lista de URLs a scrapear (puedes añadir más si lo deseas)
-URLS_TO_SCRAPE = [
-    "https://www.autofer.com/coches/segunda-mano/madrid/renault/clio/gasolina/1-0-tce-90cv-intens/1062915/",
-    "https://www.autofer.com/coches/segunda-mano/madrid/renault/austral/gasolina/e-tech-full-hybrid-200cv-evolution/1056593/",
-    "https://www.autofer.com/coches/segunda-mano/madrid/renault/arkana/gasolina/1-3-tce-140cv-edc-microhibrido-zen/1038292/",
-    "https://www.autofer.com/coches/segunda-mano/madrid/dacia/sandero-stepway/gasolina/0-9-tce-90cv-stepway-comfort/1000546/",
-    "https://www.autofer.com/coches/segunda-mano/madrid/dacia/duster/hibrido/1-0-tce-100cv-glp-4x2-sl-aniversario/1011551/",
-    "https://www.autofer.com/coches/segunda-mano/madrid/dacia/sandero-stepway/gasolina/1-0-tce-90cv-stepway-expression/1036354/",
-    "https://www.autofer.com/coches/segunda-mano/madrid/renault/megane/gasolina/tce-74kw-100cv-tech-road-energy/1000597/",
-    "https://www.autofer.com/coches/segunda-mano/madrid/renault/megane/gasolina/tce-140cv-gpf-techno-fast-track/895637/",
-    "https://www.autofer.com/coches/segunda-mano/madrid/renault/arkana/gasolina/1-6-e-tech-145cv-rs-line/1058061/",
-    "https://www.autofer.com/coches/segunda-mano/madrid/renault/clio/hibrido/1-6-e-tech-hibrido-140cv-zen/914544/"
-    # "https://www.autofer.com/coches/segunda-mano/madrid/otro-ejemplo/url-aqui/1234567/", # Añade más URLs aquí
-]
+from scraper import ScraperSession, revalidate_listing, discover_listing_urls, normalize_listing_url
+from request_router import allow_requests
+from listing_store import ListingStateStore
+from frontier import CrawlFrontier, listing_priority
+from snapshot_archive import SnapshotArchive
+from sinks import open_sink, SINK_FORMATS
+from config import (DEFAULT_CONCURRENCY, MAX_CONCURRENCY_PER_HOST, INCREMENTAL_CRAWL, LISTING_STATE_DB,
+                    REVALIDATION_WORKERS, URLS_FILE, STOCK_SEARCH_URL, MAX_SEARCH_PAGES, FRONTIER_DB,
+                    RECENTLY_CHANGED_DAYS, SNAPSHOT_ARCHIVE_ENABLED, SNAPSHOT_ARCHIVE_DB, OUTPUT_FORMAT,
+                    GALLERY_IMAGE_URL_PREFIX)
+from readiness import (WAIT_TIMINGS, DETAIL_READY_SELECTOR, GALLERY_CONTAINER_SELECTOR, wait_for_selector,
+                       wait_for_dom_change, wait_for_request)
 
 # --- Configuración del carrusel de imágenes ---
 GALLERY_OPEN_BUTTON_TEXT_REGEX = re.compile(r'\d+\s*imágenes', re.IGNORECASE)
@@ -30,14 +29,191 @@ IMAGE_SELECTOR = 'img.lg-object.lg-image'
 
 MAX_IMAGE_ITERATIONS = 50  # Un límite de seguridad para el bucle
 
+# Todas las fotos de la galería se sirven desde GALLERY_IMAGE_URL_PREFIX (config.py), el CDN del concesionario
+GALLERY_IMAGE_URL_REGEX = re.compile(re.escape(GALLERY_IMAGE_URL_PREFIX) + r'[^"\'\s<>()\\,]+')
+
+# Contenedores de la galería en la ficha. Además se usa el bloque que rodea al botón 'X imágenes':
+# su primer antepasado que ya contiene fotos del CDN.
+GALLERY_ROOT_SELECTORS = ['[data-lg-id]', '.lightgallery', 'div.lg-outer']
+
+# Retorna los valores de los atributos de los elementos dentro de los contenedores de la galería
+_GALLERY_ATTRIBUTES_SCRIPT = """
+([rootSelectors, buttonPattern, urlPrefix]) => {
+    const roots = new Set();
+    for (const selector of rootSelectors) {
+        document.querySelectorAll(selector).forEach(element => roots.add(element));
+    }
+    const values = element => [element, ...element.querySelectorAll('*')]
+        .flatMap(node => Array.from(node.attributes, attribute => attribute.value));
+    const buttonRegex = new RegExp(buttonPattern, 'i');
+    const button = Array.from(document.querySelectorAll('button')).find(b => buttonRegex.test(b.textContent || ''));
+    for (let element = button && button.parentElement; element && element !== document.body;
+         element = element.parentElement) {
+        if (values(element).some(value => value.replaceAll('\\\\/', '/').includes(urlPrefix))) {
+            roots.add(element);
+            break;
+        }
+    }
+    return Array.from(roots).flatMap(values);
+}
+"""
+
+
+def expected_gallery_image_count(playwright_page) -> int:
+    """Lee el número de imágenes del botón 'X imágenes' sin abrir la galería. Devuelve 0 si no se encuentra."""
+    try:
+        gallery_open_button = playwright_page.get_by_role("button", name=GALLERY_OPEN_BUTTON_TEXT_REGEX).first
+        if gallery_open_button.is_visible():
+            match = re.search(r'(\d+)', gallery_open_button.text_content() or '')
+            if match:
+                return int(match.group(1))
+    except Exception as e:
+        print(f"DEBUG: No se pudo leer el número de imágenes de la galería: {e}")
+    return 0
+
+
+def gallery_attribute_values(playwright_page) -> list[str]:
+    """
+    Valores de todos los atributos (src, data-src, href, data-*...) de los elementos de la galería de esta ficha.
+    Solo se mira dentro de la galería: las URLs del CDN no llevan el id del vehículo, y el resto de la página
+    (vehículos relacionados o similares) también tiene fotos del mismo CDN.
+    """
+    try:
+        return playwright_page.evaluate(_GALLERY_ATTRIBUTES_SCRIPT, [GALLERY_ROOT_SELECTORS,
+                                                                     GALLERY_OPEN_BUTTON_TEXT_REGEX.pattern,
+                                                                     GALLERY_IMAGE_URL_PREFIX])
+    except Exception as e:
+        print(f"DEBUG: No se pudieron leer los atributos de la galería: {e}")
+        return []
+
 
-def scrape_car_details(url: str, playwright_page) -> dict:
+def harvest_gallery_image_urls(attribute_values: list[str]) -> list[str]:
+    """
+    Extrae en orden y sin duplicados las URLs de las fotos del CDN que aparecen en los atributos de la galería,
+    incluido el JSON que algunos atributos data-* llevan con las barras escapadas ('\\/').
+    """
+    image_urls = []
+    for value in attribute_values:
+        for match in GALLERY_IMAGE_URL_REGEX.finditer(value.replace('\\/', '/')):
+            if match.group(0) not in image_urls:
+                image_urls.append(match.group(0))
+    return image_urls
+
+
+def collect_images_from_carousel(playwright_page) -> list:
+    """
+    Recorre el carrusel LightGallery haciendo clic en 'siguiente' y devuelve las URLs de las imágenes.
+    Es lento (una espera por imagen), así que solo se usa si no se han podido leer las URLs de la página.
+    """
+    image_urls = []
+
+    # Abrir la galería
+    gallery_open_button = playwright_page.get_by_role("button", name=GALLERY_OPEN_BUTTON_TEXT_REGEX)
+    if gallery_open_button.is_visible():
+        gallery_open_button.click()
+        print("DEBUG: Clic en el botón para abrir la galería ('X imágenes').")
+        # Esperamos a que la imagen principal sea visible y también el botón de siguiente
+        if (wait_for_selector(playwright_page, f'{IMAGE_SELECTOR}:visible', timeout=5000, name='galeria_imagen')
+                and wait_for_selector(playwright_page, NEXT_BUTTON_SELECTOR, timeout=5000, name='galeria_siguiente')):
+            print("DEBUG: Galería LightGallery abierta y elementos visibles.")
+        else:
+            print("DEBUG: Fallo al esperar selectores de galería. Puede que la galería no se haya abierto correctamente.")
+    else:
+        print(f"DEBUG: Botón para abrir la galería (con texto 'X imágenes') NO encontrado o no visible.")
+
+    # Recopilar URLs de imágenes del carrusel
+    # Capturar la primera imagen
+    current_image_element = playwright_page.locator(IMAGE_SELECTOR).first
+    if current_image_element.is_visible():
+        src = current_image_element.get_attribute('src')
+        if src and src not in image_urls:
+            image_urls.append(src)
+            print(f"DEBUG: Imagen inicial de galería añadida: {src}")
+    else:
+        print("DEBUG: La primera imagen de la galería no está visible después de intentar abrirla.")
+
+    next_button = playwright_page.locator(NEXT_BUTTON_SELECTOR)
+    if next_button.is_visible():
+        print("DEBUG: Botón 'siguiente' del carrusel de LightGallery encontrado. Recopilando imágenes...")
+        for i in range(MAX_IMAGE_ITERATIONS):
+            try:
+                # Comprobamos si el botón 'siguiente' tiene la clase 'lg-disabled'
+                # Si la tiene, significa que hemos llegado al final del carrusel.
+                # Se añade un pequeño timeout para get_attribute por si el atributo no está inmediatamente disponible.
+                next_button_class = next_button.get_attribute('class', timeout=100)
+                if next_button_class and (
+                        'lg-disabled' in next_button_class or 'lg-next-disabled' in next_button_class):
+                    print("DEBUG: Botón 'siguiente' deshabilitado. Fin del carrusel.")
+                    break
+
+                # Obtener el SRC de la imagen actual ANTES de hacer clic
+                current_src_before_click = playwright_page.locator(IMAGE_SELECTOR).first.get_attribute('src')
+
+                next_button.click()
+
+                # CAMBIO CLAVE: Esperar a que se pida una nueva imagen por red.
+                request = wait_for_request(playwright_page,
+                                           lambda req: req.url.startswith(GALLERY_IMAGE_URL_PREFIX) and
+                                                       req.resource_type == 'image' and
+                                                       req.url != current_src_before_click,
+                                           name='carrusel_peticion')
+                if request is None:
+                    print("DEBUG: No se detectó una nueva petición de imagen (timeout). Posible fin del carrusel o fallo.")
+                    break  # Salir del bucle si no hay nueva imagen por red
+                print(f"DEBUG: Nueva petición de imagen detectada: {request.url}")
+                # Esperar a que LightGallery actualice el src en el DOM en vez de dormir un tiempo fijo
+                wait_for_dom_change(playwright_page, IMAGE_SELECTOR, 'src', current_src_before_click, timeout=2000,
+                                    name='carrusel_src')
+
+                # Obtener el SRC de la imagen actual DESPUÉS de la espera por la respuesta
+                new_image_element = playwright_page.locator(IMAGE_SELECTOR).first
+                if new_image_element.is_visible():
+                    src = new_image_element.get_attribute('src')
+                    if src and src not in image_urls:
+                        image_urls.append(src)
+                        print(f"DEBUG: Imagen {len(image_urls)} añadida: {src}")
+                    else:
+                        if src in image_urls:
+                            print(f"DEBUG: Imagen {src} ya vista. Fin del carrusel o repetición.")
+                        else:
+                            print("DEBUG: No se pudo obtener src de la imagen actual después de click.")
+                        break
+                else:
+                    print("DEBUG: No hay imagen visible después de click. Fin del carrusel.")
+                    break
+            except Exception as e:
+                print(f"DEBUG: Error general en el bucle del carrusel (click o obtención de imagen): {e}")
+                break  # Salir del bucle ante cualquier error
+
+    else:
+        print(
+            "DEBUG: Botón 'siguiente' del carrusel de LightGallery NO encontrado o no visible (después de intentar abrir galería).")
+
+    # Cerrar la galería LightGallery
+    close_button = playwright_page.locator('button.lg-close.lg-icon')
+    if close_button.is_visible():
+        close_button.click()
+        print("DEBUG: Galería LightGallery cerrada.")
+        wait_for_selector(playwright_page, GALLERY_CONTAINER_SELECTOR, state='hidden', timeout=2000,
+                          name='galeria_cerrada')
+    else:
+        print("DEBUG: Botón para cerrar la galería (lg-close) NO encontrado o no visible.")
+
+    return image_urls
+
+
+def scrape_car_details(url: str, playwright_page, archive: SnapshotArchive = None) -> dict:
+    """
+    Scrapea una ficha de detalle con una página de Playwright ya abierta.
+    Si se pasa `archive`, el HTML descargado se guarda en el archivo de snapshots para re-extracciones.
+    """
     car_data = {}
     image_urls = []
 
     try:
         print(f"--- Scraping details for: {url} ---")
         playwright_page.goto(url, wait_until='domcontentloaded')
+        wait_for_selector(playwright_page, DETAIL_READY_SELECTOR, state='attached', name='ficha_lista')
         print("Página de detalle cargada.")
 
         # Aceptar cookies
@@ -45,113 +221,36 @@ def scrape_car_details(url: str, playwright_page) -> dict:
         if accept_cookies_button.is_visible():
             accept_cookies_button.click()
             print("DEBUG: Cookies aceptadas.")
-            playwright_page.wait_for_timeout(1000)
+            wait_for_selector(playwright_page, 'button.iubenda-cs-accept-btn', state='hidden', timeout=3000,
+                              name='cookies_cerradas')
         else:
             print("DEBUG: Botón de aceptar cookies NO encontrado o no visible.")
 
-        # Abrir la galería
-        gallery_open_button = playwright_page.get_by_role("button", name=GALLERY_OPEN_BUTTON_TEXT_REGEX)
-        if gallery_open_button.is_visible():
-            gallery_open_button.click()
-            print("DEBUG: Clic en el botón para abrir la galería ('X imágenes').")
-            try:
-                # Esperamos a que la imagen principal sea visible y también el botón de siguiente
-                playwright_page.wait_for_selector(f'{IMAGE_SELECTOR}:visible', state='visible', timeout=5000)
-                playwright_page.wait_for_selector(NEXT_BUTTON_SELECTOR, state='visible', timeout=5000)
-                print("DEBUG: Galería LightGallery abierta y elementos visibles.")
-            except Exception as e:
-                print(
-                    f"DEBUG: Fallo al esperar selectores de galería: {e}. Puede que la galería no se haya abierto correctamente.")
-        else:
-            print(f"DEBUG: Botón para abrir la galería (con texto 'X imágenes') NO encontrado o no visible.")
-
-        # Recopilar URLs de imágenes del carrusel
-        # Capturar la primera imagen
-        current_image_element = playwright_page.locator(IMAGE_SELECTOR).first
-        if current_image_element.is_visible():
-            src = current_image_element.get_attribute('src')
-            if src and src not in image_urls:
-                image_urls.append(src)
-                print(f"DEBUG: Imagen inicial de galería añadida: {src}")
-        else:
-            print("DEBUG: La primera imagen de la galería no está visible después de intentar abrirla.")
-
-        next_button = playwright_page.locator(NEXT_BUTTON_SELECTOR)
-        if next_button.is_visible():
-            print("DEBUG: Botón 'siguiente' del carrusel de LightGallery encontrado. Recopilando imágenes...")
-            for i in range(MAX_IMAGE_ITERATIONS):
-                try:
-                    # Comprobamos si el botón 'siguiente' tiene la clase 'lg-disabled'
-                    # Si la tiene, significa que hemos llegado al final del carrusel.
-                    # Se añade un pequeño timeout para get_attribute por si el atributo no está inmediatamente disponible.
-                    next_button_class = next_button.get_attribute('class', timeout=100)
-                    if next_button_class and (
-                            'lg-disabled' in next_button_class or 'lg-next-disabled' in next_button_class):
-                        print("DEBUG: Botón 'siguiente' deshabilitado. Fin del carrusel.")
-                        break
-
-                    # Obtener el SRC de la imagen actual ANTES de hacer clic
-                    current_src_before_click = playwright_page.locator(IMAGE_SELECTOR).first.get_attribute('src')
-
-                    next_button.click()
-
-                    # CAMBIO CLAVE: Esperar a que se cargue una nueva imagen por red.
-                    # Esto es más fiable que esperar el cambio de atributo en el DOM.
-                    try:
-                        response = playwright_page.wait_for_response(lambda res:
-                                                                     res.url.startswith(
-                                                                         'https://cdn.dealerk.es/dealer/datafiles/vehicle/images/') and
-                                                                     res.request.resource_type == 'image' and
-                                                                     res.url != current_src_before_click,
-                                                                     # Asegurar que la URL sea diferente
-                                                                     timeout=10000
-                                                                     # Se le da más tiempo para la respuesta de red (10 segundos)
-                                                                     )
-                        print(f"DEBUG: Nueva respuesta de imagen detectada: {response.url}")
-                        # Después de la respuesta, damos un pequeño tiempo para que el DOM se actualice.
-                        playwright_page.wait_for_timeout(200)
-                    except Exception as e_wait_response:
-                        print(
-                            f"DEBUG: No se detectó una nueva respuesta de imagen o timeout. Posible fin del carrusel o fallo: {e_wait_response}")
-                        break  # Salir del bucle si no hay nueva imagen por red
-
-                    # Obtener el SRC de la imagen actual DESPUÉS de la espera por la respuesta
-                    new_image_element = playwright_page.locator(IMAGE_SELECTOR).first
-                    if new_image_element.is_visible():
-                        src = new_image_element.get_attribute('src')
-                        if src and src not in image_urls:
-                            image_urls.append(src)
-                            print(f"DEBUG: Imagen {len(image_urls)} añadida: {src}")
-                        else:
-                            if src in image_urls:
-                                print(f"DEBUG: Imagen {src} ya vista. Fin del carrusel o repetición.")
-                            else:
-                                print("DEBUG: No se pudo obtener src de la imagen actual después de click.")
-                            break
-                    else:
-                        print("DEBUG: No hay imagen visible después de click. Fin del carrusel.")
-                        break
-                except Exception as e:
-                    print(f"DEBUG: Error general en el bucle del carrusel (click o obtención de imagen): {e}")
-                    break  # Salir del bucle ante cualquier error
-
-        else:
-            print(
-                "DEBUG: Botón 'siguiente' del carrusel de LightGallery NO encontrado o no visible (después de intentar abrir galería).")
-
-        # Cerrar la galería LightGallery
-        close_button = playwright_page.locator('button.lg-close.lg-icon')
-        if close_button.is_visible():
-            close_button.click()
-            print("DEBUG: Galería LightGallery cerrada.")
-            playwright_page.wait_for_timeout(500)
-        else:
-            print("DEBUG: Botón para cerrar la galería (lg-close) NO encontrado o no visible.")
+        # Leer las URLs de la galería directamente de la página; el carrusel solo queda como respaldo
+        expected_images = expected_gallery_image_count(playwright_page)
+        image_urls = harvest_gallery_image_urls(gallery_attribute_values(playwright_page))
+        image_source = 'page_state'
+        if not image_urls or (expected_images and len(image_urls) < expected_images):
+            print(f"DEBUG: Solo {len(image_urls)} de {expected_images or '?'} imágenes en la página. "
+                  f"Recorriendo el carrusel.")
+            # El RequestRouter aborta las imágenes, y la galería no muestra la actual hasta descargarla:
+            # mientras dura el carrusel se dejan pasar las fotos del CDN
+            with allow_requests(playwright_page, GALLERY_IMAGE_URL_PREFIX + '**'):
+                carousel_urls = collect_images_from_carousel(playwright_page)
+            image_urls = image_urls + [src for src in carousel_urls if src not in image_urls]
+            image_source = 'carousel'
+        print(f"DEBUG: {len(image_urls)} imágenes obtenidas (origen: {image_source}).")
 
         html_content = playwright_page.content()
         print("HTML completo de la página de detalle obtenido.")
+        if archive:
+            try:
+                archive.store(url, html_content, image_urls, image_source)
+            except Exception as e:
+                print(f"Error al archivar el HTML de {url}: {e}")
 
         car_data = extract_car_data(html_content, url, image_urls)
+        car_data['image_source'] = image_source
 
         print(f"Datos extraídos para {car_data.get('model', 'N/A')}:")
         print(f"  Marca: {car_data.get('brand', 'N/A')}, Modelo: {car_data.get('model', 'N/A')}")
@@ -166,64 +265,315 @@ def scrape_car_details(url: str, playwright_page) -> dict:
     return car_data
 
 
-def save_to_csv(data: list[dict], filename: str):
-    if not data:
-        print("No hay datos para guardar en CSV.")
-        return
-
-    all_keys = set()
-    for row in data:
-        all_keys.update(row.keys())
-
-    fieldnames_ordered_start = ['original_url', 'guid', 'brand', 'model', 'price_cash', 'price_financed',
-                                'kilometros', 'registration_year', 'fuel_type', 'engine_cv',
-                                'transmission', 'condition', 'body_type', 'traction', 'seats']
-
-    fieldnames_ordered_end = ['images']
-
-    fieldnames = []
-    for key in fieldnames_ordered_start:
-        if key in all_keys:
-            fieldnames.append(key)
-            all_keys.remove(key)
-
-    remaining_keys = sorted(list(all_keys - set(fieldnames_ordered_end)))
-    fieldnames.extend(remaining_keys)
-
-    for key in fieldnames_ordered_end:
-        if key in all_keys:
-            fieldnames.append(key)
-
-    with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
-        writer.writeheader()
-        for row in data:
-            row_to_write = row.copy()
-            if 'images' in row_to_write and isinstance(row_to_write['images'], list):
-                row_to_write['images'] = '|'.join(row_to_write['images'])
-            writer.writerow(row_to_write)
-    print(f"Datos guardados en {filename}")
-
-
-def main():
-    all_scraped_cars_data = []
-
-    with sync_playwright() as p:
-        # ¡RECUERDA ACTIVAR headless=False para depurar visualmente!
-        # browser = p.chromium.launch(headless=False, slow_mo=500)
-        browser = p.chromium.launch(headless=True)
-        page = browser.new_page()
-
-        for url in URLS_TO_SCRAPE:
-            car_data = scrape_car_details(url, page)
-            all_scraped_cars_data.append(car_data)
+def scrape_urls_sequentially(urls: list[str], on_result=None, archive: SnapshotArchive = None,
+                             keep_results: bool = True) -> list[dict]:
+    """
+    Scrapea las URLs una a una con una única página. Es el modo por defecto.
+    Si se pasa `on_result(url, car_data)`, se llama en cuanto termina cada anuncio.
+    Con `keep_results=False` no se acumulan las filas (se retorna una lista vacía) y solo llegan por `on_result`.
+    """
+    if not urls:
+        return []
+    results = []
+    # Un único Chromium para todo el lote; los contextos se reciclan cada CONTEXT_MAX_USES anuncios
+    # (ver config.py). Cambia HEADLESS a False en config.py para depurar visualmente.
+    with ScraperSession() as session:
+        for url in urls:
+            with session.page() as page:
+                car_data = scrape_car_details(url, page, archive)
+            if keep_results:
+                results.append(car_data)
+            if on_result:
+                on_result(url, car_data)
             print("-" * 50)
+    return results
+
+
+def scrape_urls_concurrently(urls: list[str], concurrency: int,
+                             max_per_host: int = MAX_CONCURRENCY_PER_HOST, on_result=None,
+                             archive: SnapshotArchive = None, keep_results: bool = True) -> list[dict]:
+    """
+    Scrapea hasta `concurrency` páginas de detalle a la vez, sin superar `max_per_host` páginas
+    simultáneas contra un mismo host.
+    La API síncrona de Playwright no se puede compartir entre hilos, así que cada hilo trabajador
+    abre su propia ScraperSession y toma URLs de una cola común. Cada fila se genera con
+    scrape_car_details y se devuelve en el mismo orden que `urls`.
+    `on_result(url, car_data)` se llama en el mismo orden que `urls`: en cuanto termina cada anuncio, si ya se
+    entregaron todos los anteriores; si no, queda en espera hasta que terminen (la salida sale en orden de entrada).
+    Con `keep_results=False` no se acumulan las filas (se retorna una lista vacía) y solo llegan por `on_result`.
+    """
+    if not urls:
+        return []
+    results = [None] * len(urls)
+    finished = [False] * len(urls)
+    pending = queue.Queue()
+    for index, url in enumerate(urls):
+        pending.put((index, url))
+
+    host_limits = {}
+    host_limits_lock = threading.Lock()
+
+    # Anuncios terminados que esperan a que acaben los anteriores para pasar por `on_result`, por índice
+    waiting_results = {}
+    next_to_deliver = 0
+    delivery_lock = threading.Lock()
+
+    def deliver_in_order(index: int, url: str, car_data: dict):
+        nonlocal next_to_deliver
+        with delivery_lock:
+            waiting_results[index] = (url, car_data)
+            while next_to_deliver in waiting_results:
+                on_result(*waiting_results.pop(next_to_deliver))
+                next_to_deliver += 1
+
+    def host_semaphore(url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc
+        with host_limits_lock:
+            if host not in host_limits:
+                host_limits[host] = threading.BoundedSemaphore(max(1, max_per_host))
+            return host_limits[host]
+
+    def worker():
+        with ScraperSession(pool_size=1) as session:
+            while True:
+                try:
+                    index, url = pending.get_nowait()
+                except queue.Empty:
+                    return
+                with host_semaphore(url):
+                    with session.page() as page:
+                        car_data = scrape_car_details(url, page, archive)
+                if keep_results:
+                    results[index] = car_data
+                finished[index] = True
+                if on_result:
+                    deliver_in_order(index, url, car_data)
+                print(f"[{index + 1}/{len(urls)}] Terminado: {url}")
+
+    num_workers = max(1, min(concurrency, len(urls)))
+    print(f"Scrapeando {len(urls)} anuncios con {num_workers} páginas en paralelo "
+          f"(máximo {max_per_host} por host).")
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(worker) for _ in range(num_workers)]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error en un hilo de scraping: {e}")
+
+    # Si un hilo murió antes de procesar alguna URL, se registra como error igual que en scrape_car_details.
+    # No se pasa por `on_result`: en la cola de rastreo siguen pendientes y se retoman en la siguiente ejecución.
+    unfinished = [index for index in range(len(urls)) if not finished[index]]
+    if unfinished:
+        print(f"{len(unfinished)} URLs no se llegaron a procesar; quedan pendientes para la próxima ejecución.")
+    # Los que esperaban detrás de una URL no procesada se entregan ahora, en orden
+    for index in sorted(waiting_results):
+        on_result(*waiting_results.pop(index))
+    if not keep_results:
+        return []
+    for index in unfinished:
+        results[index] = {'original_url': urls[index], 'error': 'No procesada',
+                          'guid': generate_guid_from_data(urls[index]), 'images': []}
+    return results
+
+
+def plan_incremental_crawl(urls: list[str], store: ListingStateStore, force: bool = False) -> tuple[list, set, dict]:
+    """
+    Revalida cada URL con una petición HTTP condicional (sin navegador) y la compara con el estado guardado.
+    Retorna (urls_a_scrapear, guids_sin_cambios, revalidaciones_por_url).
+    Un anuncio se salta si ya está en el almacén y el servidor responde 304 o su huella HTML no ha cambiado.
+    Las URLs que responden 404/410 no se scrapean y acabarán marcadas como bajas.
+    """
+    stored_rows = {url: store.get(generate_guid_from_data(url)) for url in urls}
+
+    def revalidate(url):
+        row = stored_rows[url]
+        if row is None or row['removed_at'] is not None:
+            return revalidate_listing(url)
+        return revalidate_listing(url, row['etag'], row['last_modified'])
+
+    with ThreadPoolExecutor(max_workers=REVALIDATION_WORKERS) as executor:
+        revalidations = dict(zip(urls, executor.map(revalidate, urls)))
+
+    urls_to_scrape = []
+    unchanged_guids = set()
+    for url in urls:
+        row = stored_rows[url]
+        revalidation = revalidations[url]
+        if revalidation['status'] == 'gone':
+            print(f"El anuncio ya no existe (HTTP 404/410): {url}")
+            continue
+        unchanged = False
+        if row is not None and row['removed_at'] is None and row['record_json'] is not None:
+            unchanged = (revalidation['status'] == 'not_modified'
+                         or (revalidation['html_hash'] is not None and revalidation['html_hash'] == row['html_hash']))
+        if unchanged and not force:
+            unchanged_guids.add(row['guid'])
+        else:
+            urls_to_scrape.append(url)
+
+    print(f"Rastreo incremental: {len(urls_to_scrape)} anuncios a scrapear, {len(unchanged_guids)} sin cambios.")
+    return urls_to_scrape, unchanged_guids, revalidations
+
+
+def record_incremental_result(store: ListingStateStore, row: dict, revalidations: dict) -> str:
+    """
+    Guarda un anuncio recién scrapeado en el almacén y retorna su tipo de cambio
+    ('insert', 'update' o 'unchanged'). Los anuncios con error conservan su estado anterior y retornan None.
+    """
+    if 'error' in row:
+        if store.get(row['guid']) is not None:
+            store.touch(row['guid'])
+        return None
+    revalidation = revalidations.get(row['original_url'], {})
+    return store.upsert(row, revalidation.get('html_hash'), revalidation.get('etag'),
+                        revalidation.get('last_modified'))
+
+
+def finish_incremental_crawl(store: ListingStateStore, unchanged_guids: set, known_guids: set) -> list[dict]:
+    """
+    Cierra la ronda incremental: marca como vistos los anuncios sin cambios y retorna las bajas
+    (filas con change_type 'remove') de los anuncios que ya no aparecen.
+    `known_guids` son los anuncios publicados de la ronda actual, incluidos los ya scrapeados antes de
+    reanudar un rastreo interrumpido, que no deben contarse como bajas.
+    """
+    for guid in unchanged_guids:
+        store.touch(guid)
+    return store.mark_removed(set(unchanged_guids) | set(known_guids))
+
+
+def crawl_seen_guids(store: ListingStateStore, frontier: CrawlFrontier) -> set:
+    """
+    GUIDs que cuentan como publicados al cerrar la ronda. Si el buscador se recorrió entero, son los de la cola;
+    si no (--no-discover, --max-search-pages corto o un error en el buscador), la cola no tiene todo el stock
+    y solo se dan de baja los anuncios cuya ficha respondió 404/410: el resto de los conocidos siguen activos.
+    """
+    if frontier.discovery_complete():
+        return frontier.active_guids()
+    print("Aviso: el buscador no se recorrió entero; solo se dan de baja los anuncios que responden 404/410.")
+    return store.active_guids() - frontier.gone_guids()
+
+
+def load_seed_urls(filename: str) -> list[str]:
+    """Lee las URLs semilla de `filename` (una por línea). Si no existe, retorna una lista vacía."""
+    if not os.path.exists(filename):
+        return []
+    with open(filename, 'r', encoding='utf-8') as f:
+        return [normalize_listing_url(line.strip()) for line in f if line.strip() and not line.startswith('#')]
+
+
+def build_frontier(frontier: CrawlFrontier, store: ListingStateStore, discover: bool = True,
+                   max_search_pages: int = MAX_SEARCH_PAGES):
+    """
+    Llena la cola de rastreo con las URLs semilla de URLS_FILE y las fichas descubiertas en el buscador.
+    Si quedan URLs pendientes de una ejecución interrumpida, se reanuda esa ronda sin volver a descubrir.
+    La cola recuerda si el buscador se recorrió entero; sin descubrimiento (--no-discover) nunca lo está.
+    """
+    pending = frontier.pending_count()
+    if pending:
+        print(f"Reanudando un rastreo interrumpido: {pending} URLs pendientes en la cola.")
+        return
 
-        browser.close()
-
+    frontier.reset()
+    urls = load_seed_urls(URLS_FILE)
+    complete = False
+    if discover:
+        with ScraperSession(pool_size=1) as session:
+            discovered, complete = discover_listing_urls(session, STOCK_SEARCH_URL, max_search_pages)
+        urls += discovered
+    frontier.set_discovery_complete(complete)
+    added = frontier.add(urls, listing_priority(store, RECENTLY_CHANGED_DAYS))
+    print(f"Cola de rastreo preparada: {added} fichas únicas.")
+
+
+def print_image_source_summary(counts: dict):
+    """
+    Muestra de dónde salieron las imágenes de cada anuncio, para vigilar cuántos caen al carrusel.
+    `counts` es {origen: número de anuncios}; los anuncios con error se cuentan como 'error'.
+    """
+    total = sum(counts.values()) or 1
+    print("Origen de las imágenes por anuncio:")
+    for source, count in sorted(counts.items()):
+        print(f"  {source}: {count} ({count * 100 / total:.1f}%)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scraper de fichas de coches de autofer.com")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="Número de páginas de detalle que se scrapean a la vez (1 = secuencial).")
+    parser.add_argument('--max-per-host', type=int, default=MAX_CONCURRENCY_PER_HOST,
+                        help="Máximo de páginas simultáneas contra un mismo host.")
+    parser.add_argument('--full', action='store_true',
+                        help="Vuelve a scrapear todos los anuncios aunque no hayan cambiado (el estado se sigue "
+                             "actualizando y el CSV incluye todas las filas).")
+    parser.add_argument('--no-discover', action='store_true',
+                        help=f"No recorre el buscador de stock; solo scrapea las URLs de {URLS_FILE}.")
+    parser.add_argument('--max-search-pages', type=int, default=MAX_SEARCH_PAGES,
+                        help="Máximo de páginas del buscador de stock que se recorren.")
+    parser.add_argument('--format', default=OUTPUT_FORMAT, choices=sorted(SINK_FORMATS),
+                        help="Formato del fichero de salida (parquet necesita pyarrow).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    store = ListingStateStore(LISTING_STATE_DB) if INCREMENTAL_CRAWL else None
+    frontier = CrawlFrontier(FRONTIER_DB)
+    build_frontier(frontier, store, not args.no_discover, args.max_search_pages)
+
+    urls_to_scrape = frontier.pending_urls()
+    if store:
+        pending_urls = urls_to_scrape
+        urls_to_scrape, unchanged_guids, revalidations = plan_incremental_crawl(pending_urls, store, args.full)
+        for url in pending_urls:
+            if revalidations[url]['status'] == 'gone':
+                frontier.mark(url, 'gone')
+            elif url not in urls_to_scrape:
+                frontier.mark(url, 'done')
+
+    # Cada anuncio se escribe en la salida en cuanto termina; no se acumula el rastreo en memoria
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    csv_filename = f"scraped_cars_{timestamp}.csv"
-    save_to_csv(all_scraped_cars_data, csv_filename)
+    sink = open_sink(f"scraped_cars_{timestamp}", args.format)
+    image_sources = {}
+    change_counts = {}
+    results_lock = threading.Lock()
+
+    def handle_result(url: str, car_data: dict):
+        frontier.mark_result(url, car_data)
+        with results_lock:
+            source = car_data.get('image_source', 'error')
+            image_sources[source] = image_sources.get(source, 0) + 1
+            if store:
+                change = record_incremental_result(store, car_data, revalidations)
+                if change is None or (change == 'unchanged' and not args.full):
+                    return
+                car_data['change_type'] = change
+                change_counts[change] = change_counts.get(change, 0) + 1
+        sink.write(car_data)
+
+    # Si el rastreo se interrumpe, la salida se cierra igualmente con las filas ya escritas
+    with sink:
+        archive = SnapshotArchive(SNAPSHOT_ARCHIVE_DB) if SNAPSHOT_ARCHIVE_ENABLED else None
+        if args.concurrency > 1:
+            scrape_urls_concurrently(urls_to_scrape, args.concurrency, args.max_per_host, on_result=handle_result,
+                                     archive=archive, keep_results=False)
+        else:
+            scrape_urls_sequentially(urls_to_scrape, on_result=handle_result, archive=archive, keep_results=False)
+        if archive:
+            archive.close()
+
+        print_image_source_summary(image_sources)
+        WAIT_TIMINGS.print_summary()
+
+        if store:
+            with store:
+                removed = finish_incremental_crawl(store, unchanged_guids, crawl_seen_guids(store, frontier))
+            sink.write_many(removed)
+            if removed:
+                change_counts['remove'] = len(removed)
+            print(f"Cambios detectados: {change_counts or 'ninguno'}")
+    frontier.close()
     print("Scraping finalizado.")
 
 
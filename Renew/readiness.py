@@ -0,0 +1,135 @@
+import threading
+import time
+
+# Elemento que indica que la ficha del coche ya está en el DOM (cabecera con marca y modelo)
+DETAIL_READY_SELECTOR = 'span.stock-vehicle-detail__header--make-model'
+
+# Contenedor de LightGallery; desaparece al cerrar la galería
+GALLERY_CONTAINER_SELECTOR = 'div.lg-outer'
+
+# Tiempos máximos por defecto (ms). Son techos: las esperas terminan en cuanto se cumple la condición.
+DEFAULT_SELECTOR_TIMEOUT = 10000
+DEFAULT_DOM_CHANGE_TIMEOUT = 5000
+DEFAULT_REQUEST_TIMEOUT = 10000
+
+# Se resuelve con true en cuanto el atributo del elemento cambia respecto a `previous`,
+# observando el DOM con un MutationObserver en lugar de sondear. Se resuelve con false al agotar el tiempo.
+_DOM_CHANGE_SCRIPT = """
+([selector, attribute, previous, timeout]) => new Promise(resolve => {
+    const changed = () => {
+        const el = document.querySelector(selector);
+        const value = el && el.getAttribute(attribute);
+        return !!value && value !== previous;
+    };
+    if (changed()) {
+        resolve(true);
+        return;
+    }
+    const observer = new MutationObserver(() => {
+        if (changed()) {
+            observer.disconnect();
+            clearTimeout(timer);
+            resolve(true);
+        }
+    });
+    observer.observe(document.documentElement,
+                     {subtree: true, childList: true, attributes: true, attributeFilter: [attribute]});
+    const timer = setTimeout(() => {
+        observer.disconnect();
+        resolve(false);
+    }, timeout);
+})
+"""
+
+
+class WaitTimings:
+    """
+    Registro de cuánto ha durado realmente cada espera, agrupado por nombre.
+    Es seguro usarlo desde varios hilos (modo --concurrency de main.py).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._durations_ms = {}
+        self._timeouts = {}
+
+    def record(self, name: str, elapsed_ms: float, satisfied: bool):
+        with self._lock:
+            self._durations_ms.setdefault(name, []).append(elapsed_ms)
+            if not satisfied:
+                self._timeouts[name] = self._timeouts.get(name, 0) + 1
+
+    def summary(self) -> dict:
+        """Retorna {nombre: {'count', 'avg_ms', 'p95_ms', 'max_ms', 'timeouts'}}."""
+        with self._lock:
+            result = {}
+            for name, durations in self._durations_ms.items():
+                ordered = sorted(durations)
+                result[name] = {
+                    'count': len(ordered),
+                    'avg_ms': round(sum(ordered) / len(ordered), 1),
+                    'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+                    'max_ms': round(ordered[-1], 1),
+                    'timeouts': self._timeouts.get(name, 0),
+                }
+            return result
+
+    def print_summary(self):
+        print("Tiempos de espera por tipo:")
+        for name, stats in sorted(self.summary().items()):
+            print(f"  {name}: {stats['count']} esperas, media {stats['avg_ms']} ms, p95 {stats['p95_ms']} ms, "
+                  f"máx {stats['max_ms']} ms, timeouts {stats['timeouts']}")
+
+
+# Registro compartido por main.py y scraper.py
+WAIT_TIMINGS = WaitTimings()
+
+
+def _elapsed_ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
+
+
+def wait_for_selector(page, selector: str, state: str = 'visible', timeout: int = DEFAULT_SELECTOR_TIMEOUT,
+                      name: str = None) -> bool:
+    """
+    Espera a que `selector` alcance `state` ('attached', 'visible', 'hidden' o 'detached').
+    Retorna True si se cumplió y False si se agotó el tiempo; nunca lanza por timeout.
+    """
+    start = time.perf_counter()
+    try:
+        page.wait_for_selector(selector, state=state, timeout=timeout)
+        satisfied = True
+    except Exception:
+        satisfied = False
+    WAIT_TIMINGS.record(name or f"selector:{state}", _elapsed_ms(start), satisfied)
+    return satisfied
+
+
+def wait_for_dom_change(page, selector: str, attribute: str, previous_value: str,
+                        timeout: int = DEFAULT_DOM_CHANGE_TIMEOUT, name: str = None) -> bool:
+    """
+    Espera a que el atributo `attribute` del primer elemento que cumple `selector` deje de valer
+    `previous_value` (por ejemplo, el `src` de la imagen actual del carrusel tras pulsar 'siguiente').
+    Retorna True si cambió y False si se agotó el tiempo.
+    """
+    start = time.perf_counter()
+    try:
+        satisfied = bool(page.evaluate(_DOM_CHANGE_SCRIPT, [selector, attribute, previous_value, timeout]))
+    except Exception:
+        satisfied = False
+    WAIT_TIMINGS.record(name or "dom_change", _elapsed_ms(start), satisfied)
+    return satisfied
+
+
+def wait_for_request(page, predicate, timeout: int = DEFAULT_REQUEST_TIMEOUT, name: str = None):
+    """
+    Espera a la primera petición de red que cumpla `predicate`.
+    Retorna la petición, o None si se agotó el tiempo.
+    """
+    start = time.perf_counter()
+    try:
+        request = page.wait_for_request(predicate, timeout=timeout)
+    except Exception:
+        request = None
+    WAIT_TIMINGS.record(name or "request", _elapsed_ms(start), request is not None)
+    return request
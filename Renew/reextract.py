@@ -0,0 +1,83 @@
+"""
+Vuelve a ejecutar extract_car_data sobre todas las páginas del archivo de snapshots, sin abrir el navegador.
+Útil tras corregir el parser: reconstruye el dataset completo solo con CPU local.
+Uso:
+    python reextract.py [--archive snapshots.sqlite3] [--workers N] [--backend lxml] [--format csv] [--output nombre]
+"""
+from datetime import datetime
+from multiprocessing import Pool
+import argparse
+import os
+
+from config import SNAPSHOT_ARCHIVE_DB, OUTPUT_FORMAT
+from data_processor import extract_car_data, DEFAULT_PARSER_BACKEND, PARSER_BACKENDS
+from snapshot_archive import SnapshotArchive
+from sinks import open_sink, SINK_FORMATS
+
+# Archivo abierto por cada proceso del pool (se inicializa en _init_worker)
+_worker_archive = None
+_worker_backend = DEFAULT_PARSER_BACKEND
+
+
+def _init_worker(archive_path: str, backend: str):
+    global _worker_archive, _worker_backend
+    _worker_archive = SnapshotArchive(archive_path)
+    _worker_backend = backend
+
+
+def _reextract_snapshot(snapshot: dict) -> dict:
+    """Carga y descomprime el HTML de un snapshot dentro del proceso trabajador y extrae sus datos."""
+    try:
+        html_content = _worker_archive.load_html(snapshot['content_hash'])
+        car_data = extract_car_data(html_content, snapshot['original_url'], snapshot['images'], backend=_worker_backend)
+        if snapshot['image_source']:
+            car_data['image_source'] = snapshot['image_source']
+        car_data['fetched_at'] = snapshot['fetched_at']
+        return car_data
+    except Exception as e:
+        return {'original_url': snapshot['original_url'], 'guid': snapshot['guid'], 'error': str(e),
+                'images': snapshot['images']}
+
+
+def reextract_archive(archive_path: str, sink, workers: int = None, backend: str = DEFAULT_PARSER_BACKEND) -> int:
+    """
+    Re-extrae la última descarga de cada anuncio del archivo con un pool de `workers` procesos y escribe
+    cada fila en `sink` según llega. Retorna cuántos anuncios fallaron.
+    """
+    with SnapshotArchive(archive_path) as archive:
+        snapshots = archive.latest_snapshots()
+    print(f"Re-extrayendo {len(snapshots)} anuncios del archivo '{archive_path}' con {workers or os.cpu_count()} "
+          f"procesos (backend {backend}).")
+
+    errors = 0
+    with Pool(processes=workers, initializer=_init_worker, initargs=(archive_path, backend)) as pool:
+        # Solo viajan entre procesos el hash y los metadatos; el HTML se lee dentro de cada trabajador
+        for row in pool.imap(_reextract_snapshot, snapshots, chunksize=64):
+            errors += 'error' in row
+            sink.write(row)
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-extrae los datos de los coches desde el archivo de snapshots.")
+    parser.add_argument('--archive', default=SNAPSHOT_ARCHIVE_DB, help="Ruta del archivo de snapshots (SQLite).")
+    parser.add_argument('--workers', type=int, default=None, help="Procesos del pool (por defecto, uno por CPU).")
+    parser.add_argument('--backend', default=DEFAULT_PARSER_BACKEND, choices=sorted(PARSER_BACKENDS),
+                        help="Backend de parseo de extract_car_data.")
+    parser.add_argument('--format', default=OUTPUT_FORMAT, choices=sorted(SINK_FORMATS),
+                        help="Formato del fichero de salida (parquet necesita pyarrow).")
+    parser.add_argument('--output', default=None,
+                        help="Nombre del fichero de salida sin extensión (por defecto reextracted_cars_<fecha>).")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.archive):
+        print(f"Error: El archivo de snapshots no se encuentra en '{args.archive}'")
+        return
+
+    output = args.output or f"reextracted_cars_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    with open_sink(output, args.format) as sink:
+        errors = reextract_archive(args.archive, sink, args.workers, args.backend)
+    print(f"Re-extracción finalizada: {sink.rows_written} anuncios, {errors} con error.")
+
+if __name__ == "__main__":
+    main()
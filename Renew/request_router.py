@@ -0,0 +1,62 @@
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from config import BLOCKED_RESOURCE_TYPES, BLOCKED_TRACKER_HOSTS, ROUTING_ALLOWLIST
+
+
+class RequestRouter:
+    """
+    Capa de intercepción de peticiones basada en `route` de Playwright.
+    Aborta por defecto imágenes, vídeo/audio, fuentes y trackers de terceros, porque para scrapear
+    una ficha solo necesitamos el DOM y las URLs de las imágenes, no los bytes.
+    Cuando hace falta descargar imágenes concretas (el carrusel de la galería), se abren con `allow_requests`.
+    Uso:
+        router = RequestRouter()
+        router.install(context)  # o una página
+    """
+
+    def __init__(self, blocked_resource_types=BLOCKED_RESOURCE_TYPES, blocked_hosts=BLOCKED_TRACKER_HOSTS,
+                 allowlist=ROUTING_ALLOWLIST):
+        self.blocked_resource_types = set(blocked_resource_types)
+        self.blocked_hosts = tuple(blocked_hosts)
+        self.allowlist = tuple(allowlist)
+        self.blocked_requests = 0
+        self.allowed_requests = 0
+
+    def install(self, target):
+        """Registra el router en un BrowserContext o en una Page."""
+        target.route("**/*", self._handle_route)
+        return self
+
+    def should_block(self, url: str, resource_type: str) -> bool:
+        if any(allowed in url for allowed in self.allowlist):
+            return False
+        if resource_type in self.blocked_resource_types:
+            return True
+        host = urlparse(url).hostname or ''
+        return any(host == blocked or host.endswith('.' + blocked) for blocked in self.blocked_hosts)
+
+    def _handle_route(self, route):
+        request = route.request
+        if self.should_block(request.url, request.resource_type):
+            self.blocked_requests += 1
+            route.abort()
+        else:
+            self.allowed_requests += 1
+            route.continue_()
+
+
+@contextmanager
+def allow_requests(page, url_pattern: str):
+    """
+    Deja pasar en `page` las peticiones que casan con `url_pattern` mientras dure el bloque.
+    Las rutas de la página tienen prioridad sobre las del contexto, así que se saltan el RequestRouter.
+    """
+    def _continue(route):
+        route.continue_()
+
+    page.route(url_pattern, _continue)
+    try:
+        yield
+    finally:
+        page.unroute(url_pattern, _continue)
@@ -1,107 +1,349 @@
+import queue
+from contextlib import contextmanager
+from urllib.parse import urlencode, urljoin, urlparse, parse_qsl, urlunparse
+
 import requests  # Todavía lo necesitamos para descargar las imágenes directamente
 from playwright.sync_api import sync_playwright, expect
 import re  # Necesario para parsear el número de imágenes
 
+from data_processor import fingerprint_html
+from config import (HEADLESS, BROWSER_CONTEXT_POOL_SIZE, CONTEXT_MAX_USES, BLOCK_HEAVY_RESOURCES, STOCK_SEARCH_URL,
+                    SEARCH_PAGE_PARAM, MAX_SEARCH_PAGES, GALLERY_IMAGE_URL_PREFIX)
+from request_router import RequestRouter, allow_requests
+from readiness import DETAIL_READY_SELECTOR, wait_for_selector, wait_for_dom_change
+
+COOKIE_BUTTON_SELECTOR = 'button:has-text("Aceptar todas"), button:has-text("Entendido"), button:has-text("Aceptar")'
+CURRENT_IMAGE_SELECTOR = 'div.lg-item.lg-current img.lg-object.lg-image'
+
+# Enlaces a fichas de detalle: /coches/segunda-mano/<provincia>/<marca>/<modelo>/<combustible>/<versión>/<id>/
+DETAIL_URL_REGEX = re.compile(r'(?:https?://www\.autofer\.com)?(/coches/segunda-mano/(?:[^"\'\s/?#<>]+/){5}\d+)/?')
+SEARCH_RESULTS_READY_SELECTOR = 'a[href*="/coches/segunda-mano/"]'
+
+# Cabeceras para las revalidaciones con requests (sin navegador)
+REVALIDATION_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/100.0.4896.127 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml',
+}
+
+
+class _ContextSlot:
+    """Un BrowserContext aislado con su página y el número de anuncios procesados con él."""
+
+    def __init__(self, context, page, router=None):
+        self.context = context
+        self.page = page
+        self.router = router
+        self.uses = 0
+        self.crashed = False
+
 
-def fetch_car_data_and_images_with_playwright(url: str) -> tuple[str, list]:
+class ScraperSession:
     """
-    Obtiene el contenido HTML completo y las URLs de las imágenes de una página de detalle de coche usando Playwright.
-    Maneja el contenido dinámico y las interacciones.
-    Retorna una tupla: (contenido_html_string, lista_de_urls_imagenes)
+    Sesión de scraping de larga duración: lanza Chromium una sola vez y reparte un pool
+    acotado de BrowserContext aislados (cada uno con su página) que se reciclan entre anuncios.
+    Un contexto se cierra y se sustituye por uno nuevo tras `max_uses` anuncios o si su página se cuelga.
+    Con `block_resources=True` cada contexto lleva un RequestRouter que aborta imágenes, fuentes,
+    vídeo y trackers (ver config.py).
+    Uso:
+        with ScraperSession() as session:
+            with session.page() as page:
+                page.goto(url)
     """
-    html_content = None
-    image_urls = []
-    print(f"Iniciando Playwright para extraer HTML y imágenes de: {url}")
 
-    with sync_playwright() as p:
-        browser = None
-        try:
-            # Puedes cambiar 'headless=True' a 'headless=False' para ver el navegador en acción
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
+    def __init__(self, pool_size: int = BROWSER_CONTEXT_POOL_SIZE, max_uses: int = CONTEXT_MAX_USES,
+                 headless: bool = HEADLESS, block_resources: bool = BLOCK_HEAVY_RESOURCES):
+        self.pool_size = max(1, pool_size)
+        self.max_uses = max(1, max_uses)
+        self.headless = headless
+        self.block_resources = block_resources
+        self.blocked_requests = 0
+        self._playwright = None
+        self._browser = None
+        self._idle_slots = queue.LifoQueue()
+        self._open_slots = 0
 
-            # Navega a la URL y espera a que la red esté inactiva (indicando que la página cargó)
-            page.goto(url, wait_until='networkidle')
+    def start(self):
+        if self._browser is None:
+            self._playwright = sync_playwright().start()
+            self._browser = self._playwright.chromium.launch(headless=self.headless)
+            print(f"Chromium lanzado (pool de {self.pool_size} contextos, reciclado cada {self.max_uses} usos).")
+        return self
 
-            # --- Manejo de la ventana emergente de cookies (si existe) ---
+    def close(self):
+        while not self._idle_slots.empty():
+            self._close_slot(self._idle_slots.get_nowait())
+        if self._browser:
             try:
-                # Intenta encontrar un botón que tenga "Aceptar todas" o "Entendido" o "Aceptar"
-                cookie_button = page.locator(
-                    'button:has-text("Aceptar todas"), button:has-text("Entendido"), button:has-text("Aceptar")')
-                if cookie_button.is_visible(timeout=5000):  # Espera hasta 5 segundos
-                    cookie_button.click()
-                    print("Clic en botón de aceptar cookies.")
-                    page.wait_for_load_state('networkidle')  # Espera a que la página se estabilice tras el clic
+                self._browser.close()
             except Exception:
-                # No hay botón de cookies o no es visible a tiempo, o ya se aceptaron
                 pass
+            self._browser = None
+            if self.block_resources:
+                print(f"Peticiones bloqueadas por el router durante la sesión: {self.blocked_requests}")
+        if self._playwright:
+            self._playwright.stop()
+            self._playwright = None
 
-            # Obtener el contenido HTML completo después de que la página se haya cargado y estabilizado
-            html_content = page.content()
+    def __enter__(self):
+        return self.start()
 
-            # --- Lógica de Extracción de Imágenes (la misma que ya teníamos) ---
-            # Localiza y haz clic en el botón "X imágenes" para abrir el carrusel
-            images_button = page.get_by_role("button", name=re.compile(r'\d+\s+imágenes'))
-            images_button_to_click = images_button.first
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-            if images_button_to_click.is_visible(timeout=10000):
-                button_text = images_button_to_click.text_content()
-                num_images_match = re.search(r'(\d+)\s+imágenes', button_text)
-                total_images = int(num_images_match.group(1)) if num_images_match else 0
+    def _new_slot(self) -> _ContextSlot:
+        context = self._browser.new_context()
+        router = RequestRouter().install(context) if self.block_resources else None
+        page = context.new_page()
+        slot = _ContextSlot(context, page, router)
 
-                print(f"Botón de imágenes encontrado: '{button_text}'. Clicando...")
-                images_button_to_click.click()
+        def _on_crash(_page):
+            slot.crashed = True
 
-                page.wait_for_selector('div.lg-item.lg-current img.lg-object.lg-image', timeout=15000)
+        page.on("crash", _on_crash)
+        self._open_slots += 1
+        return slot
 
-                extracted_urls = set()
+    def _close_slot(self, slot: _ContextSlot):
+        self._open_slots -= 1
+        if slot.router:
+            self.blocked_requests += slot.router.blocked_requests
+        try:
+            slot.context.close()
+        except Exception:
+            pass
 
-                current_img_tag = page.locator('div.lg-item.lg-current img.lg-object.lg-image').first
-                if current_img_tag.is_visible() and current_img_tag.get_attribute('src'):
-                    extracted_urls.add(current_img_tag.get_attribute('src'))
+    def acquire(self) -> _ContextSlot:
+        """Devuelve un contexto libre del pool, creando uno nuevo si aún no se ha alcanzado el límite."""
+        if self._browser is None:
+            self.start()
+        try:
+            return self._idle_slots.get_nowait()
+        except queue.Empty:
+            pass
+        if self._open_slots < self.pool_size:
+            return self._new_slot()
+        return self._idle_slots.get()
 
-                next_button = page.locator('button.lg-next.lg-icon')
+    def release(self, slot: _ContextSlot, failed: bool = False):
+        """
+        Devuelve un contexto al pool. Si ha fallado, se ha colgado o ha alcanzado `max_uses`,
+        se cierra; el siguiente `acquire` creará uno limpio en su lugar.
+        """
+        slot.uses += 1
+        if failed or slot.crashed or slot.page.is_closed() or slot.uses >= self.max_uses:
+            self._close_slot(slot)
+        else:
+            self._idle_slots.put(slot)
 
-                if not next_button.is_visible():
-                    print("Botón 'siguiente' del carrusel no visible (carrusel con una sola imagen o problema).")
-                else:
-                    clicks_to_perform = total_images - 1 if total_images > 0 else 30
+    @contextmanager
+    def page(self):
+        """Context manager que presta la página de un contexto del pool y la devuelve al terminar."""
+        slot = self.acquire()
+        failed = False
+        try:
+            yield slot.page
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(slot, failed=failed)
+
+
+def _extract_html_and_images(page, url: str) -> tuple[str, list]:
+    """
+    Extrae el HTML y las URLs de las imágenes de la página de detalle usando una página ya abierta.
+    """
+    image_urls = []
 
-                    for i in range(clicks_to_perform):
-                        if next_button.is_enabled():
-                            next_button.click()
-                            page.wait_for_timeout(500)
+    # Navega a la URL y espera a que la ficha esté en el DOM, sin esperar a que la red quede inactiva
+    page.goto(url, wait_until='domcontentloaded')
+    wait_for_selector(page, DETAIL_READY_SELECTOR, state='attached', name='ficha_lista')
 
-                            visible_images_locators = page.locator(
-                                'div.lg-item.lg-current img.lg-object.lg-image').all()
-                            for img_loc in visible_images_locators:
-                                src = img_loc.get_attribute('src')
-                                if src:
-                                    extracted_urls.add(src)
+    # --- Manejo de la ventana emergente de cookies (si existe) ---
+    try:
+        # Intenta encontrar un botón que tenga "Aceptar todas" o "Entendido" o "Aceptar"
+        cookie_button = page.locator(COOKIE_BUTTON_SELECTOR)
+        if cookie_button.is_visible(timeout=5000):  # Espera hasta 5 segundos
+            cookie_button.click()
+            print("Clic en botón de aceptar cookies.")
+            # Espera a que el banner desaparezca en lugar de a que la red quede inactiva
+            wait_for_selector(page, COOKIE_BUTTON_SELECTOR, state='hidden', timeout=3000, name='cookies_cerradas')
+    except Exception:
+        # No hay botón de cookies o no es visible a tiempo, o ya se aceptaron
+        pass
 
-                            if total_images > 0 and len(extracted_urls) >= total_images:
-                                print(
-                                    f"Hemos extraído {len(extracted_urls)} imágenes únicas, que es el número esperado. Finalizando clicks.")
-                                break
-                        else:
-                            print("Botón 'siguiente' deshabilitado o no visible. Posible fin del carrusel.")
-                            break
+    # Obtener el contenido HTML completo después de que la página se haya cargado y estabilizado
+    html_content = page.content()
 
-                        if not next_button.is_visible():
-                            print("Botón 'siguiente' no visible después de clic. Asumiendo fin del carrusel.")
-                            break
+    # --- Lógica de Extracción de Imágenes (la misma que ya teníamos) ---
+    # Localiza y haz clic en el botón "X imágenes" para abrir el carrusel
+    images_button = page.get_by_role("button", name=re.compile(r'\d+\s+imágenes'))
+    images_button_to_click = images_button.first
 
-                image_urls = list(extracted_urls)
-                print(f"Imágenes extraídas con Playwright: {len(image_urls)}")
+    if images_button_to_click.is_visible(timeout=10000):
+        button_text = images_button_to_click.text_content()
+        num_images_match = re.search(r'(\d+)\s+imágenes', button_text)
+        total_images = int(num_images_match.group(1)) if num_images_match else 0
 
+        print(f"Botón de imágenes encontrado: '{button_text}'. Clicando...")
+        # El RequestRouter aborta las imágenes; las de la galería se dejan pasar para que el carrusel las muestre
+        with allow_requests(page, GALLERY_IMAGE_URL_PREFIX + '**'):
+            images_button_to_click.click()
+
+            wait_for_selector(page, CURRENT_IMAGE_SELECTOR, timeout=15000, name='galeria_imagen')
+
+            extracted_urls = set()
+
+            current_img_tag = page.locator(CURRENT_IMAGE_SELECTOR).first
+            if current_img_tag.is_visible() and current_img_tag.get_attribute('src'):
+                extracted_urls.add(current_img_tag.get_attribute('src'))
+
+            next_button = page.locator('button.lg-next.lg-icon')
+
+            if not next_button.is_visible():
+                print("Botón 'siguiente' del carrusel no visible (carrusel con una sola imagen o problema).")
             else:
-                print("Botón 'X imágenes' no encontrado o no visible en la página. No se extraerán imágenes dinámicas.")
+                clicks_to_perform = total_images - 1 if total_images > 0 else 30
 
-        except Exception as e:
-            print(f"Error durante la extracción de datos e imágenes con Playwright para {url}: {e}")
-            html_content = None  # Asegurarse de que html_content sea None en caso de error
-            image_urls = []
-        finally:
-            if browser:
-                browser.close()
-    return html_content, image_urls
\ No newline at end of file
+                for i in range(clicks_to_perform):
+                    if next_button.is_enabled():
+                        src_before_click = page.locator(CURRENT_IMAGE_SELECTOR).first.get_attribute('src')
+                        next_button.click()
+                        # Espera a que cambie la imagen actual en el DOM en vez de dormir 500 ms fijos
+                        wait_for_dom_change(page, CURRENT_IMAGE_SELECTOR, 'src', src_before_click, name='carrusel_src')
+
+                        visible_images_locators = page.locator(CURRENT_IMAGE_SELECTOR).all()
+                        for img_loc in visible_images_locators:
+                            src = img_loc.get_attribute('src')
+                            if src:
+                                extracted_urls.add(src)
+
+                        if total_images > 0 and len(extracted_urls) >= total_images:
+                            print(
+                                f"Hemos extraído {len(extracted_urls)} imágenes únicas, que es el número esperado. Finalizando clicks.")
+                            break
+                    else:
+                        print("Botón 'siguiente' deshabilitado o no visible. Posible fin del carrusel.")
+                        break
+
+                    if not next_button.is_visible():
+                        print("Botón 'siguiente' no visible después de clic. Asumiendo fin del carrusel.")
+                        break
+
+        image_urls = list(extracted_urls)
+        print(f"Imágenes extraídas con Playwright: {len(image_urls)}")
+
+    else:
+        print("Botón 'X imágenes' no encontrado o no visible en la página. No se extraerán imágenes dinámicas.")
+
+    return html_content, image_urls
+
+
+def fetch_car_data_and_images_with_playwright(url: str, session: ScraperSession = None) -> tuple[str, list]:
+    """
+    Obtiene el contenido HTML completo y las URLs de las imágenes de una página de detalle de coche usando Playwright.
+    Maneja el contenido dinámico y las interacciones.
+    Si se pasa una `ScraperSession`, reutiliza su navegador y su pool de contextos en lugar de lanzar Chromium.
+    Retorna una tupla: (contenido_html_string, lista_de_urls_imagenes)
+    """
+    print(f"Extrayendo HTML e imágenes con Playwright de: {url}")
+
+    owns_session = session is None
+    if owns_session:
+        session = ScraperSession(pool_size=1).start()
+
+    try:
+        with session.page() as page:
+            return _extract_html_and_images(page, url)
+    except Exception as e:
+        print(f"Error durante la extracción de datos e imágenes con Playwright para {url}: {e}")
+        return None, []
+    finally:
+        if owns_session:
+            session.close()
+
+
+def revalidate_listing(url: str, etag: str = None, last_modified: str = None, timeout: int = 10) -> dict:
+    """
+    Comprueba con una petición HTTP normal (sin Playwright) si un anuncio ha cambiado.
+    Envía If-None-Match / If-Modified-Since si se conocen y calcula la huella del HTML servido.
+    Retorna un dict con 'status' ('not_modified', 'fetched', 'gone' o 'error'), 'html_hash',
+    'etag' y 'last_modified'.
+    """
+    headers = dict(REVALIDATION_HEADERS)
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    result = {'status': 'error', 'html_hash': None, 'etag': etag, 'last_modified': last_modified}
+    try:
+        response = requests.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304:
+            result['status'] = 'not_modified'
+        elif response.status_code in (404, 410):
+            result['status'] = 'gone'
+        else:
+            response.raise_for_status()
+            result['status'] = 'fetched'
+            result['html_hash'] = fingerprint_html(response.text)
+            result['etag'] = response.headers.get('ETag')
+            result['last_modified'] = response.headers.get('Last-Modified')
+    except requests.exceptions.RequestException as e:
+        print(f"Error al revalidar {url}: {e}")
+    return result
+
+
+def normalize_listing_url(url: str) -> str:
+    """Quita query y fragmento y deja la barra final, para que la misma ficha dé siempre el mismo GUID."""
+    parsed = urlparse(url)
+    return urlunparse(parsed._replace(path=parsed.path.rstrip('/') + '/', query='', fragment=''))
+
+
+def search_page_url(search_url: str, page_number: int) -> str:
+    """Construye la URL de la página `page_number` del buscador de stock."""
+    parsed = urlparse(search_url)
+    query = dict(parse_qsl(parsed.query))
+    query[SEARCH_PAGE_PARAM] = str(page_number)
+    return urlunparse(parsed._replace(query=urlencode(query)))
+
+
+def discover_listing_urls(session: ScraperSession, search_url: str = STOCK_SEARCH_URL,
+                          max_pages: int = MAX_SEARCH_PAGES) -> tuple[list[str], bool]:
+    """
+    Recorre las páginas del buscador de stock y devuelve las URLs de las fichas de detalle,
+    sin duplicados y en el orden en que aparecen. Para en la primera página que no aporta ninguna URL nueva.
+    Retorna (urls, completo). `completo` solo es True si se llegó a esa última página sin errores:
+    si una página falla o se agota `max_pages`, faltan fichas y no se puede deducir qué anuncios se han retirado.
+    """
+    discovered = []
+    seen = set()
+    complete = False
+    with session.page() as page:
+        for page_number in range(1, max_pages + 1):
+            url = search_page_url(search_url, page_number)
+            try:
+                page.goto(url, wait_until='domcontentloaded')
+                if not wait_for_selector(page, SEARCH_RESULTS_READY_SELECTOR, state='attached',
+                                         name='buscador_listo'):
+                    raise TimeoutError("el listado de resultados no ha cargado")
+                html_content = page.content()
+            except Exception as e:
+                print(f"Error al cargar la página {page_number} del buscador ({url}): {e}")
+                break
+
+            new_urls = 0
+            for match in DETAIL_URL_REGEX.finditer(html_content):
+                listing_url = normalize_listing_url(urljoin(search_url, match.group(1)))
+                if listing_url not in seen:
+                    seen.add(listing_url)
+                    discovered.append(listing_url)
+                    new_urls += 1
+            print(f"Buscador página {page_number}: {new_urls} fichas nuevas (total {len(discovered)}).")
+            if new_urls == 0:
+                # Un buscador sin ningún resultado se trata como fallo (p. ej. ha cambiado el HTML), no como stock vacío
+                complete = bool(discovered)
+                break
+        else:
+            print(f"Se alcanzó el máximo de {max_pages} páginas del buscador sin llegar al final.")
+    return discovered, complete
@@ -0,0 +1,172 @@
+"""
+Salidas en streaming del scraper: cada anuncio se escribe en cuanto termina, con un esquema de columnas fijo
+y versionado, en lugar de acumular todo el rastreo en memoria y volcarlo al final.
+Formatos: CSV (siempre) y Parquet por grupos de filas (si está instalado pyarrow).
+"""
+import csv
+import threading
+from abc import ABC, abstractmethod
+
+from data_processor import HIGHLIGHT_FIELDS, SPEC_FIELDS, EQUIPMENT_PANELS
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pyarrow es opcional: sin él solo está disponible la salida CSV
+    pyarrow = None
+
+# Versión del esquema de salida. Súbela cada vez que se añada, quite o renombre una columna.
+SCHEMA_VERSION = 1
+
+# Columnas principales, en el mismo orden que tenía el CSV original
+_LEADING_FIELDS = ['original_url', 'guid', 'change_type', 'brand', 'model', 'price_cash', 'price_financed',
+                   'kilometros', 'registration_year', 'fuel_type', 'engine_cv',
+                   'transmission', 'condition', 'body_type', 'traction', 'seats']
+
+# Columnas de salida en orden fijo: las principales, el resto de campos de la ficha y las imágenes al final.
+OUTPUT_FIELDS = (
+    _LEADING_FIELDS
+    + [field for _, field, _ in HIGHLIGHT_FIELDS + SPEC_FIELDS if field not in _LEADING_FIELDS]
+    + [f'details_{category}' for category in EQUIPMENT_PANELS]
+    + ['image_source', 'fetched_at', 'error', 'images', 'schema_version']
+)
+
+# Separador de las URLs de imagen dentro de la columna 'images'
+IMAGES_SEPARATOR = '|'
+
+# Filas por grupo (row group) en los ficheros Parquet
+PARQUET_ROW_GROUP_SIZE = 1000
+
+
+def flatten_row(row: dict) -> dict:
+    """Convierte un registro de extract_car_data en una fila del esquema: solo columnas conocidas, todo texto."""
+    flat = {}
+    for field in OUTPUT_FIELDS:
+        value = row.get(field)
+        if isinstance(value, list):
+            value = IMAGES_SEPARATOR.join(value)
+        flat[field] = None if value is None else str(value)
+    flat['schema_version'] = str(SCHEMA_VERSION)
+    return flat
+
+
+class RowSink(ABC):
+    """
+    Base de las salidas en streaming. `write(row)` se puede llamar desde varios hilos.
+    Las claves que no están en OUTPUT_FIELDS se descartan y se avisa una sola vez por clave.
+    """
+    extension = None
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows_written = 0
+        self._lock = threading.Lock()
+        self._unknown_keys = set()
+
+    def write(self, row: dict):
+        unknown = set(row) - set(OUTPUT_FIELDS) - self._unknown_keys
+        for key in sorted(unknown):
+            print(f"Aviso: la columna '{key}' no está en el esquema v{SCHEMA_VERSION} y no se guarda.")
+        with self._lock:
+            self._unknown_keys |= unknown
+            self._write_row(flatten_row(row))
+            self.rows_written += 1
+
+    def write_many(self, rows: list[dict]):
+        for row in rows:
+            self.write(row)
+
+    def close(self):
+        with self._lock:
+            self._close()
+        print(f"Datos guardados en {self.path} ({self.rows_written} filas, esquema v{SCHEMA_VERSION})")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @abstractmethod
+    def _write_row(self, row: dict):
+        """Escribe una fila ya aplanada. Se llama con el lock tomado."""
+
+    @abstractmethod
+    def _close(self):
+        """Vuelca lo pendiente y cierra el fichero. Se llama con el lock tomado."""
+
+
+class CsvSink(RowSink):
+    """CSV con cabecera fija. Cada fila se vuelca a disco al escribirse, así que un fallo no pierde lo ya hecho."""
+    extension = 'csv'
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=OUTPUT_FIELDS)
+        self._writer.writeheader()
+        self._file.flush()
+
+    def _write_row(self, row: dict):
+        self._writer.writerow(row)
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class ParquetSink(RowSink):
+    """
+    Parquet con todas las columnas como texto. Las filas se acumulan hasta PARQUET_ROW_GROUP_SIZE y se escriben
+    como un grupo de filas, así que la memoria no crece con el rastreo y se pueden leer solo algunas columnas.
+    """
+    extension = 'parquet'
+
+    def __init__(self, path: str, row_group_size: int = PARQUET_ROW_GROUP_SIZE):
+        if pyarrow is None:
+            raise ImportError("La salida Parquet necesita pyarrow (pip install pyarrow).")
+        super().__init__(path)
+        self.row_group_size = row_group_size
+        self._schema = pyarrow.schema([(field, pyarrow.string()) for field in OUTPUT_FIELDS],
+                                      metadata={'schema_version': str(SCHEMA_VERSION)})
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+        self._buffer = []
+
+    def _write_row(self, row: dict):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            table = pyarrow.Table.from_pylist(self._buffer, schema=self._schema)
+            self._writer.write_table(table, row_group_size=self.row_group_size)
+            self._buffer = []
+
+    def _close(self):
+        self._flush()
+        self._writer.close()
+
+
+# Formatos de salida disponibles, por nombre
+SINK_FORMATS = {CsvSink.extension: CsvSink}
+if pyarrow is not None:
+    SINK_FORMATS[ParquetSink.extension] = ParquetSink
+
+
+def open_sink(basename: str, output_format: str = 'csv') -> RowSink:
+    """Abre la salida `basename`.<formato> con el formato indicado ('csv' o 'parquet')."""
+    if output_format not in SINK_FORMATS:
+        raise ValueError(f"Formato de salida no disponible: '{output_format}'. "
+                         f"Opciones: {', '.join(sorted(SINK_FORMATS))}")
+    sink_class = SINK_FORMATS[output_format]
+    return sink_class(f"{basename}.{sink_class.extension}")
+
+
+def save_to_csv(data: list[dict], filename: str):
+    """Escribe de una vez una lista de registros en un CSV con el esquema fijo."""
+    if not data:
+        print("No hay datos para guardar en CSV.")
+        return
+    with CsvSink(filename) as sink:
+        sink.write_many(data)
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+
+from data_processor import generate_guid_from_data
+
+# Nivel de compresión zlib de los HTML archivados (1 = rápido, 9 = más pequeño)
+COMPRESSION_LEVEL = 6
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    content_hash TEXT PRIMARY KEY,
+    html_zlib BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    guid TEXT NOT NULL,
+    original_url TEXT NOT NULL,
+    fetched_at TEXT NOT NULL,
+    content_hash TEXT NOT NULL REFERENCES blobs(content_hash),
+    images_json TEXT NOT NULL,
+    image_source TEXT,
+    PRIMARY KEY (guid, fetched_at)
+);
+"""
+
+
+class SnapshotArchive:
+    """
+    Archivo comprimido de las páginas descargadas, para poder volver a extraer los datos sin Playwright.
+    Cada HTML se guarda una sola vez comprimido con zlib, direccionado por su SHA-256 (tabla blobs),
+    y cada descarga queda registrada por GUID y fecha con las URLs de imágenes obtenidas (tabla snapshots).
+    Es seguro guardar desde varios hilos.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def store(self, original_url: str, html_content: str, image_urls: list, image_source: str = None) -> str:
+        """Archiva una descarga de `original_url` y retorna el hash del contenido."""
+        html_bytes = html_content.encode('utf-8')
+        content_hash = hashlib.sha256(html_bytes).hexdigest()
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO blobs (content_hash, html_zlib) VALUES (?, ?)",
+                               (content_hash, zlib.compress(html_bytes, COMPRESSION_LEVEL)))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO snapshots (guid, original_url, fetched_at, content_hash, images_json, "
+                "image_source) VALUES (?, ?, ?, ?, ?, ?)",
+                (generate_guid_from_data(original_url), original_url, datetime.now().isoformat(), content_hash,
+                 json.dumps(image_urls, ensure_ascii=False), image_source))
+            self._conn.commit()
+        return content_hash
+
+    def load_html(self, content_hash: str) -> str:
+        with self._lock:
+            row = self._conn.execute("SELECT html_zlib FROM blobs WHERE content_hash = ?", (content_hash,)).fetchone()
+        if row is None:
+            return None
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def latest_snapshots(self) -> list[dict]:
+        """
+        Última descarga de cada anuncio, sin el HTML (solo su hash), ordenadas por GUID.
+        Cada elemento: {'guid', 'original_url', 'fetched_at', 'content_hash', 'images', 'image_source'}.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT s.guid, s.original_url, s.fetched_at, s.content_hash, s.images_json, s.image_source "
+                "FROM snapshots s JOIN (SELECT guid, MAX(fetched_at) AS fetched_at FROM snapshots GROUP BY guid) "
+                "latest ON latest.guid = s.guid AND latest.fetched_at = s.fetched_at ORDER BY s.guid").fetchall()
+        return [{'guid': guid, 'original_url': url, 'fetched_at': fetched_at, 'content_hash': content_hash,
+                 'images': json.loads(images_json), 'image_source': image_source}
+                for guid, url, fetched_at, content_hash, images_json, image_source in rows]
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los módulos de Renew se importan entre sí sin paquete (from config import ...), igual que al ejecutar main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,224 @@
+"""
+Servidor HTTP falso de la API de Drive v3, para probar drive_uploader sin red.
+Implementa lo que usa el módulo: files.list (con paginación), files.get, files.create de metadatos, carpetas y accesos
+directos, subidas multipart y reanudables, y el endpoint batch. Los archivos se guardan en memoria.
+"""
+import email
+import email.parser
+import hashlib
+import itertools
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+SHORTCUT_MIME_TYPE = 'application/vnd.google-apps.shortcut'
+
+
+class FakeDrive:
+    """Estado del Drive falso. Arranca con start() y se apunta el cliente a `root_url`."""
+
+    def __init__(self):
+        self.files = {}  # id → recurso de Drive (dict)
+        self.contents = {}  # id → bytes subidos
+        self.requests = []  # (método, ruta, uploadType) de cada petición recibida, incluidas las de los lotes
+        self._failures = []  # (prefijo de ruta, código) que se devuelven antes de atender la petición
+        self._uploads = {}  # upload_id → (metadatos, bytes recibidos) de las subidas reanudables en curso
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = None
+
+    # --- Control desde los tests ---
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _handler_for(self))
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def root_url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_port}/'
+
+    def fail_next(self, path_prefix: str, *status_codes: int):
+        """Las próximas peticiones a `path_prefix` responden con estos códigos, uno por petición."""
+        with self._lock:
+            self._failures += [(path_prefix, status) for status in status_codes]
+
+    def add_folder(self, name: str, parent: str = 'root') -> str:
+        return self._create({'name': name, 'mimeType': FOLDER_MIME_TYPE, 'parents': [parent]})['id']
+
+    def delete(self, file_id: str):
+        with self._lock:
+            self.files.pop(file_id, None)
+            self.contents.pop(file_id, None)
+
+    def uploads(self) -> list[dict]:
+        """Archivos con contenido (no carpetas ni accesos directos)."""
+        return [item for item in self.files.values() if item['id'] in self.contents]
+
+    def shortcuts(self) -> list[dict]:
+        return [item for item in self.files.values() if item['mimeType'] == SHORTCUT_MIME_TYPE]
+
+    def count(self, method: str, path_prefix: str) -> int:
+        return sum(1 for request_method, path, _ in self.requests
+                   if request_method == method and path.startswith(path_prefix))
+
+    # --- Implementación de la API ---
+
+    def _create(self, metadata: dict, content: bytes = None, content_type: str = None) -> dict:
+        with self._lock:
+            parents = metadata.get('parents') or ['root']
+            for parent in parents:
+                if parent != 'root' and self.files.get(parent, {}).get('mimeType') != FOLDER_MIME_TYPE:
+                    raise _ApiError(404, f'File not found: {parent}.')
+            target = (metadata.get('shortcutDetails') or {}).get('targetId')
+            if target is not None and target not in self.files:
+                raise _ApiError(404, f'File not found: {target}.')
+            file_id = f'id{next(self._ids)}'
+            item = {'id': file_id, 'name': metadata.get('name'), 'parents': parents,
+                    'mimeType': metadata.get('mimeType') or content_type or 'application/octet-stream',
+                    'webViewLink': f'https://drive.google.com/file/d/{file_id}/view'}
+            if target is not None:
+                item['shortcutDetails'] = {'targetId': target}
+            if content is not None:
+                item['md5Checksum'] = hashlib.md5(content).hexdigest()
+                self.contents[file_id] = content
+            self.files[file_id] = item
+            return item
+
+    def _get(self, file_id: str) -> dict:
+        with self._lock:
+            if file_id not in self.files:
+                raise _ApiError(404, f'File not found: {file_id}.')
+            return dict(self.files[file_id])
+
+    def _list(self, query: dict) -> dict:
+        q = query.get('q', [''])[0]
+        conditions = []
+        for mime_type in re.findall(r"mimeType\s*=\s*'([^']*)'", q):
+            conditions.append(lambda item, mime_type=mime_type: item['mimeType'] == mime_type)
+        for prefix in re.findall(r"mimeType contains '([^']*)'", q):
+            conditions.append(lambda item, prefix=prefix: prefix in item['mimeType'])
+        for parent in re.findall(r"'([^']*)' in parents", q):
+            conditions.append(lambda item, parent=parent: parent in item['parents'])
+        with self._lock:
+            matches = [dict(item) for item in self.files.values() if all(check(item) for check in conditions)]
+        page_size = int(query.get('pageSize', ['100'])[0])
+        start = int(query.get('pageToken', ['0'])[0])
+        response = {'files': matches[start:start + page_size]}
+        if start + page_size < len(matches):
+            response['nextPageToken'] = str(start + page_size)
+        return response
+
+    def handle(self, method: str, url: str, headers, body: bytes) -> tuple:
+        """Atiende una petición; retorna (código, cabeceras, cuerpo dict o None)."""
+        parsed = urlparse(url)
+        query = parse_qs(parsed.query)
+        upload_type = query.get('uploadType', [None])[0]
+        with self._lock:
+            self.requests.append((method, parsed.path, upload_type))
+            for index, (prefix, status) in enumerate(self._failures):
+                if parsed.path.startswith(prefix):
+                    del self._failures[index]
+                    return status, {}, {'error': {'code': status, 'message': 'Fallo simulado'}}
+        try:
+            if parsed.path == '/drive/v3/files' and method == 'GET':
+                return 200, {}, self._list(query)
+            if parsed.path.startswith('/drive/v3/files/') and method == 'GET':
+                return 200, {}, self._get(parsed.path.rsplit('/', 1)[1])
+            if parsed.path == '/drive/v3/files' and method == 'POST':
+                return 200, {}, self._create(json.loads(body or b'{}'))
+            if parsed.path == '/upload/drive/v3/files' and upload_type == 'multipart':
+                metadata, content, content_type = _split_multipart(headers['Content-Type'], body)
+                return 200, {}, self._create(metadata, content, content_type)
+            if parsed.path == '/upload/drive/v3/files' and upload_type == 'resumable':
+                return self._resumable(method, query, headers, body)
+        except _ApiError as e:
+            return e.status, {}, {'error': {'code': e.status, 'message': str(e)}}
+        return 404, {}, {'error': {'code': 404, 'message': f'Ruta no implementada: {method} {parsed.path}'}}
+
+    def _resumable(self, method: str, query: dict, headers, body: bytes) -> tuple:
+        if method == 'POST':
+            upload_id = f'up{next(self._ids)}'
+            metadata = json.loads(body or b'{}')
+            metadata.setdefault('mimeType', headers.get('X-Upload-Content-Type'))
+            with self._lock:
+                self._uploads[upload_id] = (metadata, b'')
+            location = f'{self.root_url}upload/drive/v3/files?uploadType=resumable&upload_id={upload_id}'
+            return 200, {'Location': location}, None
+        upload_id = query['upload_id'][0]
+        total = int(headers['Content-Range'].rsplit('/', 1)[1])
+        with self._lock:
+            metadata, received = self._uploads[upload_id]
+            received += body
+            self._uploads[upload_id] = (metadata, received)
+        if len(received) < total:
+            return 308, {'Range': f'bytes=0-{len(received) - 1}'}, None
+        del self._uploads[upload_id]
+        return 200, {}, self._create(metadata, received)
+
+    def handle_batch(self, content_type: str, body: bytes) -> tuple:
+        """Atiende un lote multipart/mixed; retorna (content-type, cuerpo) de la respuesta multipart."""
+        with self._lock:
+            self.requests.append(('POST', '/batch/drive/v3', None))
+        message = email.message_from_string(f'Content-Type: {content_type}\r\n\r\n' + body.decode('utf-8'))
+        boundary = 'respuesta_lote'
+        parts = []
+        for part in message.get_payload():
+            request_line, embedded = part.get_payload().split('\n', 1)
+            method, url, _ = request_line.split(' ', 2)
+            embedded_message = email.message_from_string(embedded)
+            status, _, payload = self.handle(method, url, embedded_message,
+                                             embedded_message.get_payload().encode('utf-8'))
+            content_id = part['Content-ID'].replace('<', '<response-', 1)
+            parts.append(f'--{boundary}\r\nContent-Type: application/http\r\nContent-ID: {content_id}\r\n\r\n'
+                         f'HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n\r\n'
+                         f'{json.dumps(payload)}\r\n')
+        return f'multipart/mixed; boundary={boundary}', (''.join(parts) + f'--{boundary}--\r\n').encode('utf-8')
+
+
+class _ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _split_multipart(content_type: str, body: bytes) -> tuple:
+    """Separa una subida multipart/related en (metadatos, contenido, tipo del contenido)."""
+    message = email.parser.BytesParser().parsebytes(f'Content-Type: {content_type}\r\n\r\n'.encode() + body)
+    metadata_part, media_part = message.get_payload()
+    return json.loads(metadata_part.get_payload()), media_part.get_payload(decode=True), media_part.get_content_type()
+
+
+def _handler_for(drive: FakeDrive):
+    class Handler(BaseHTTPRequestHandler):
+        def _respond(self, status, headers, payload, content_type='application/json'):
+            data = b'' if payload is None else payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _serve(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if urlparse(self.path).path == '/batch/drive/v3':
+                content_type, data = drive.handle_batch(self.headers['Content-Type'], body)
+                self._respond(200, {}, data, content_type)
+            else:
+                self._respond(*drive.handle(self.command, self.path, self.headers, body))
+
+        do_GET = do_POST = do_PUT = _serve
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
@@ -0,0 +1,56 @@
+import time
+from contextlib import contextmanager
+
+import main
+
+URLS = [f'https://www.autofer.com/coches/segunda-mano/madrid/kia/ceed/diesel/drive/{n}/' for n in range(1, 9)]
+
+
+class FakeSession:
+    """ScraperSession mínima: los anuncios falsos no usan la página."""
+
+    def __init__(self, pool_size=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    @contextmanager
+    def page(self):
+        yield None
+
+
+def fake_scrape(url, page, archive):
+    # Los primeros anuncios tardan más, así que terminan en orden inverso al de entrada
+    time.sleep(0.02 * (len(URLS) - URLS.index(url)))
+    return {'original_url': url}
+
+
+def test_on_result_follows_input_order(monkeypatch):
+    monkeypatch.setattr(main, 'ScraperSession', FakeSession)
+    monkeypatch.setattr(main, 'scrape_car_details', fake_scrape)
+    delivered = []
+
+    main.scrape_urls_concurrently(URLS, concurrency=4, max_per_host=4,
+                                  on_result=lambda url, car_data: delivered.append(url), keep_results=False)
+    assert delivered == URLS
+
+
+def test_results_after_a_dead_worker_are_still_delivered(monkeypatch):
+    monkeypatch.setattr(main, 'ScraperSession', FakeSession)
+
+    def scrape_or_crash(url, page, archive):
+        if url == URLS[0]:
+            raise RuntimeError('el hilo muere')
+        return fake_scrape(url, page, archive)
+
+    monkeypatch.setattr(main, 'scrape_car_details', scrape_or_crash)
+    delivered = []
+
+    main.scrape_urls_concurrently(URLS, concurrency=2, max_per_host=2,
+                                  on_result=lambda url, car_data: delivered.append(url), keep_results=False)
+    # La URL que no se procesó no pasa por on_result; el resto sale igualmente y en orden
+    assert delivered == URLS[1:]
@@ -0,0 +1,63 @@
+from contextlib import contextmanager
+
+from scraper import discover_listing_urls
+
+SEARCH_URL = 'https://www.autofer.com/coches/segunda-mano/'
+
+
+def listing_link(number):
+    return f'<a href="/coches/segunda-mano/madrid/kia/ceed/diesel/drive/{number}/">KIA</a>'
+
+
+class FakeSearchPage:
+    """Página de Playwright mínima: cada página del buscador devuelve el HTML indicado o lanza un error."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.current = None
+
+    def goto(self, url, wait_until=None):
+        self.current = self.pages.get(int(url.rsplit('page=', 1)[1]), '<html></html>')
+        if isinstance(self.current, Exception):
+            raise self.current
+
+    def wait_for_selector(self, selector, state=None, timeout=None):
+        if 'href' not in self.current:
+            raise TimeoutError(selector)
+
+    def content(self):
+        return self.current
+
+
+class FakeSession:
+    def __init__(self, pages):
+        self._page = FakeSearchPage(pages)
+
+    @contextmanager
+    def page(self):
+        yield self._page
+
+
+def test_discovery_is_complete_when_it_reaches_the_last_results_page():
+    session = FakeSession({1: listing_link(1) + listing_link(2), 2: listing_link(3), 3: listing_link(3)})
+    urls, complete = discover_listing_urls(session, SEARCH_URL, max_pages=10)
+    assert len(urls) == 3
+    assert complete
+
+
+def test_discovery_is_incomplete_when_a_page_fails():
+    session = FakeSession({1: listing_link(1), 2: RuntimeError('timeout')})
+    urls, complete = discover_listing_urls(session, SEARCH_URL, max_pages=10)
+    assert len(urls) == 1
+    assert not complete
+
+
+def test_discovery_is_incomplete_when_the_first_page_fails():
+    assert discover_listing_urls(FakeSession({1: RuntimeError('timeout')}), SEARCH_URL) == ([], False)
+
+
+def test_discovery_is_incomplete_when_max_pages_is_reached():
+    session = FakeSession({1: listing_link(1), 2: listing_link(2), 3: listing_link(3)})
+    urls, complete = discover_listing_urls(session, SEARCH_URL, max_pages=2)
+    assert len(urls) == 2
+    assert not complete
@@ -0,0 +1,212 @@
+import hashlib
+import os
+
+import pytest
+from google.auth.credentials import AnonymousCredentials
+
+import drive_uploader
+from drive_uploader import (ContentHashIndex, DriveFolderRegistry, build_drive_service,
+                            create_drive_folder_if_not_exists, folder_registry, upload_images_to_drive)
+from fake_drive import FakeDrive
+
+CREDS = AnonymousCredentials()
+
+
+@pytest.fixture
+def drive(monkeypatch, tmp_path):
+    fake = FakeDrive().start()
+    monkeypatch.chdir(tmp_path)  # La caché de carpetas (DRIVE_FOLDER_CACHE_FILE) es una ruta relativa
+    monkeypatch.setattr(drive_uploader, '_folder_registries', {})
+    monkeypatch.setattr(drive_uploader, 'DRIVE_API_ENDPOINT', fake.root_url)
+    # Archivos de más de 300 KB por subida reanudable, en trozos de 256 KB; sin esperas entre reintentos
+    monkeypatch.setattr(drive_uploader, 'DRIVE_RESUMABLE_THRESHOLD', 300 * 1024)
+    monkeypatch.setattr(drive_uploader, 'RESUMABLE_CHUNK_SIZE', 256 * 1024)
+    monkeypatch.setattr(drive_uploader.time, 'sleep', lambda seconds: None)
+    yield fake
+    fake.stop()
+
+
+def write_images(directory, sizes):
+    paths = []
+    for number, size in enumerate(sizes):
+        path = os.path.join(directory, f'imagen_{number}.jpg')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        paths.append(path)
+    return paths
+
+
+def md5_of(path):
+    with open(path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def upload(uploads, tmp_path, **kwargs):
+    return upload_images_to_drive(uploads, CREDS, workers=4, manifest_path=str(tmp_path / 'manifest.sqlite3'),
+                                  content_index_path=str(tmp_path / 'content.sqlite3'), **kwargs)
+
+
+def test_uploads_small_files_multipart_and_large_files_resumable(drive, tmp_path):
+    folder_id = drive.add_folder('coche')
+    paths = write_images(tmp_path, [10 * 1024, 20 * 1024, 700 * 1024])
+
+    results = upload([(path, folder_id) for path in paths], tmp_path)
+
+    assert [drive.files[file_id]['name'] for file_id, _ in results] == [os.path.basename(p) for p in paths]
+    assert [drive.files[file_id]['md5Checksum'] for file_id, _ in results] == [md5_of(p) for p in paths]
+    assert all(drive.files[file_id]['parents'] == [folder_id] for file_id, _ in results)
+    assert drive.requests.count(('POST', '/upload/drive/v3/files', 'multipart')) == 2
+    assert drive.requests.count(('POST', '/upload/drive/v3/files', 'resumable')) == 1
+    assert drive.count('PUT', '/upload/drive/v3/files') == 3  # 700 KB en trozos de 256 KB
+
+
+def test_retries_rate_limits_and_server_errors(drive, tmp_path):
+    folder_id = drive.add_folder('coche')
+    path, = write_images(tmp_path, [10 * 1024])
+    drive.fail_next('/upload/', 429, 503)
+
+    (file_id, _), = upload([(path, folder_id)], tmp_path)
+
+    assert drive.files[file_id]['md5Checksum'] == md5_of(path)
+    assert drive.count('POST', '/upload/') == 3
+
+
+def test_rerun_skips_files_already_in_the_manifest(drive, tmp_path):
+    folder_id = drive.add_folder('coche')
+    uploads = [(path, folder_id) for path in write_images(tmp_path, [10 * 1024, 20 * 1024])]
+    first = upload(uploads, tmp_path)
+    requests_after_first_run = len(drive.requests)
+
+    assert upload(uploads, tmp_path) == first
+    assert len(drive.requests) == requests_after_first_run
+
+
+def test_missing_file_does_not_abort_the_batch(drive, tmp_path):
+    folder_id = drive.add_folder('coche')
+    paths = write_images(tmp_path, [10 * 1024, 20 * 1024])
+    missing = str(tmp_path / 'borrada.jpg')
+
+    results = upload([(paths[0], folder_id), (missing, folder_id), (paths[1], folder_id)], tmp_path)
+
+    assert results[1] == (None, None)
+    assert [drive.files[results[index][0]]['md5Checksum'] for index in (0, 2)] == [md5_of(p) for p in paths]
+
+
+def test_folder_registry_creates_missing_folders_in_one_batch(drive, tmp_path):
+    parent_id = drive.add_folder('anuncios')
+    existing_id = drive.add_folder('coche_1', parent=parent_id)
+    registry = DriveFolderRegistry(parent_id, cache_path=str(tmp_path / 'folders.json'))
+
+    folders = registry.ensure_folders(build_drive_service(CREDS), ['coche_1', 'coche_2', 'coche_3'])
+
+    assert folders['coche_1'] == existing_id
+    assert [drive.files[folders[name]]['parents'] for name in ('coche_2', 'coche_3')] == [[parent_id]] * 2
+    assert drive.count('POST', '/batch/drive/v3') == 1
+
+
+def test_upload_into_a_deleted_cached_folder_recreates_it(drive, tmp_path):
+    parent_id = drive.add_folder('anuncios')
+    stale_id = create_drive_folder_if_not_exists(build_drive_service(CREDS), 'coche_1', parent_id)
+    drive.delete(stale_id)  # Borrada en Drive, pero sigue en la caché del registro
+    path, = write_images(tmp_path, [10 * 1024])
+
+    (file_id, _), = upload([(path, stale_id)], tmp_path)
+
+    new_id = folder_registry(parent_id).get_or_create(build_drive_service(CREDS), 'coche_1')
+    assert new_id != stale_id
+    assert drive.files[new_id]['name'] == 'coche_1'
+    assert drive.files[file_id]['parents'] == [new_id]
+
+
+class CountingService:
+    """Envuelve un cliente de Drive y cuenta las llamadas a files()."""
+
+    def __init__(self, service):
+        self.service = service
+        self.calls = 0
+
+    def files(self):
+        self.calls += 1
+        return self.service.files()
+
+    def new_batch_http_request(self, callback=None):
+        return self.service.new_batch_http_request(callback=callback)
+
+
+def test_folder_registry_uses_each_callers_service(drive):
+    parent_id = drive.add_folder('anuncios')
+    first, second = CountingService(build_drive_service(CREDS)), CountingService(build_drive_service(CREDS))
+
+    create_drive_folder_if_not_exists(first, 'coche_1', parent_id)
+    calls_of_first = first.calls
+    create_drive_folder_if_not_exists(second, 'coche_2', parent_id)
+
+    assert first.calls == calls_of_first
+    assert second.calls > 0
+
+
+def touch(path):
+    # Un anuncio re-scrapeado vuelve a descargar sus fotos: mismo contenido, otra fecha de modificación
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_redownloaded_file_in_the_same_folder_is_neither_uploaded_nor_linked(drive, tmp_path):
+    folder_id = drive.add_folder('coche')
+    path, = write_images(tmp_path, [10 * 1024])
+    first = upload([(path, folder_id)], tmp_path)
+    touch(path)
+
+    assert upload([(path, folder_id)], tmp_path) == first
+    assert len(drive.uploads()) == 1
+    assert drive.shortcuts() == []
+
+
+def test_duplicate_in_another_folder_is_linked_only_once(drive, tmp_path):
+    first_folder, second_folder = drive.add_folder('coche_1'), drive.add_folder('coche_2')
+    path, = write_images(tmp_path, [10 * 1024])
+    (file_id, _), = upload([(path, first_folder)], tmp_path)
+
+    for _ in range(2):
+        assert upload([(path, second_folder)], tmp_path)[0][0] == file_id
+        touch(path)
+
+    assert len(drive.uploads()) == 1
+    assert [(item['parents'], item['shortcutDetails']['targetId']) for item in drive.shortcuts()] == \
+        [([second_folder], file_id)]
+
+
+def test_duplicate_into_a_deleted_cached_folder_is_linked_not_uploaded_again(drive, tmp_path):
+    parent_id = drive.add_folder('anuncios')
+    first_folder = drive.add_folder('coche_1', parent=parent_id)
+    stale_id = create_drive_folder_if_not_exists(build_drive_service(CREDS), 'coche_2', parent_id)
+    path, = write_images(tmp_path, [10 * 1024])
+    (file_id, _), = upload([(path, first_folder)], tmp_path)
+    drive.delete(stale_id)  # Carpeta destino borrada en Drive, pero sigue en la caché del registro
+
+    assert upload([(path, stale_id)], tmp_path)[0][0] == file_id
+
+    new_id = folder_registry(parent_id).get_or_create(build_drive_service(CREDS), 'coche_2')
+    assert len(drive.uploads()) == 1
+    assert [(item['parents'], item['shortcutDetails']['targetId']) for item in drive.shortcuts()] == \
+        [([new_id], file_id)]
+
+
+def test_rebuild_from_drive_restores_folders_of_files_and_shortcuts(drive, tmp_path):
+    first_folder, second_folder = drive.add_folder('coche_1'), drive.add_folder('coche_2')
+    path, = write_images(tmp_path, [10 * 1024])
+    upload([(path, first_folder)], tmp_path)
+    upload([(path, second_folder)], tmp_path)
+
+    with ContentHashIndex(str(tmp_path / 'reconstruido.sqlite3')) as content_index:
+        assert content_index.rebuild_from_drive(build_drive_service(CREDS)) == 1
+        assert content_index.is_in_folder(md5_of(path), first_folder)
+        assert content_index.is_in_folder(md5_of(path), second_folder)
+
+
+def test_hash_locks_are_released_when_unused(tmp_path):
+    with ContentHashIndex(str(tmp_path / 'content.sqlite3')) as content_index:
+        with content_index.lock_for('a'):
+            with content_index.lock_for('b'):
+                assert set(content_index._hash_locks) == {'a', 'b'}
+        assert content_index._hash_locks == {}
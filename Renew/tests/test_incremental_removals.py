@@ -0,0 +1,47 @@
+from data_processor import generate_guid_from_data
+from frontier import CrawlFrontier
+from listing_store import ListingStateStore
+from main import crawl_seen_guids, finish_incremental_crawl
+
+URLS = [f'https://www.autofer.com/coches/segunda-mano/madrid/kia/ceed/diesel/drive/{n}/' for n in range(1, 5)]
+
+
+def open_crawl(tmp_path):
+    store = ListingStateStore(str(tmp_path / 'state.sqlite3'))
+    for url in URLS:
+        store.upsert({'guid': generate_guid_from_data(url), 'original_url': url, 'brand': 'KIA'})
+    return store, CrawlFrontier(str(tmp_path / 'frontier.sqlite3'))
+
+
+def removed_urls(store, frontier):
+    return sorted(row['original_url'] for row in finish_incremental_crawl(store, set(),
+                                                                          crawl_seen_guids(store, frontier)))
+
+
+def test_complete_discovery_removes_listings_missing_from_the_frontier(tmp_path):
+    store, frontier = open_crawl(tmp_path)
+    frontier.add(URLS[:2])
+    frontier.set_discovery_complete(True)
+    assert removed_urls(store, frontier) == sorted(URLS[2:])
+
+
+def test_incomplete_discovery_keeps_known_listings(tmp_path):
+    store, frontier = open_crawl(tmp_path)
+    frontier.add(URLS[:1])  # Solo las semillas de urls.txt (--no-discover o error en la página 1 del buscador)
+    frontier.set_discovery_complete(False)
+    assert removed_urls(store, frontier) == []
+
+
+def test_incomplete_discovery_still_removes_gone_listings(tmp_path):
+    store, frontier = open_crawl(tmp_path)
+    frontier.add(URLS[:2])
+    frontier.mark(URLS[1], 'gone')
+    assert not frontier.discovery_complete()
+    assert removed_urls(store, frontier) == [URLS[1]]
+
+
+def test_reset_forgets_discovery_completeness(tmp_path):
+    store, frontier = open_crawl(tmp_path)
+    frontier.set_discovery_complete(True)
+    frontier.reset()
+    assert not frontier.discovery_complete()
@@ -0,0 +1,37 @@
+import glob
+import json
+import os
+
+import pytest
+
+from data_processor import PARSER_BACKENDS, extract_car_data
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+# Fichas guardadas: cada <nombre>.html tiene al lado <nombre>.json con la salida esperada de extract_car_data
+SAVED_PAGES = sorted(os.path.splitext(os.path.basename(path))[0]
+                     for path in glob.glob(os.path.join(PAGES_DIR, '*.html')))
+IMAGE_URLS = ['https://cdn.dealerk.es/dealer/datafiles/vehicle/images/1.jpg']
+
+
+def listing_url(page_name):
+    return f'https://www.autofer.com/coches/segunda-mano/{page_name}/'
+
+
+def read_page(page_name, extension):
+    with open(os.path.join(PAGES_DIR, f'{page_name}.{extension}'), encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('backend', sorted(PARSER_BACKENDS))
+@pytest.mark.parametrize('page_name', SAVED_PAGES)
+def test_backend_matches_golden_output(page_name, backend):
+    car_data = extract_car_data(read_page(page_name, 'html'), listing_url(page_name), IMAGE_URLS, backend=backend)
+    assert car_data == json.loads(read_page(page_name, 'json'))
+
+
+@pytest.mark.parametrize('html_content', ['', '   \r\n\t', '<!-- sin contenido -->'])
+def test_backends_agree_on_empty_html(html_content):
+    results = [extract_car_data(html_content, listing_url('vacia'), [], backend=backend)
+               for backend in sorted(PARSER_BACKENDS)]
+    assert results[0].keys() == {'original_url', 'images', 'guid'}
+    assert all(result == results[0] for result in results)
@@ -0,0 +1,50 @@
+import hashlib
+import random
+import time
+
+from listing_index import ListingIndex
+
+# Tamaños de catálogo que se miden y consultas por tamaño
+CATALOGUE_SIZES = [100, 1_000, 10_000, 100_000, 1_000_000]
+LOOKUPS = 10_000
+LINEAR_SCAN_LOOKUPS = 20  # El recorrido lineal es lento: con pocas consultas basta para ver cómo crece
+BRANDS = ['KIA Ceed', 'Opel Corsa', 'Audi A3', 'BMW Serie 1', 'Land Rover Discovery', 'Fiat 500']
+FUELS = ['Gasolina', 'Diésel', 'Híbrido', 'Híbrido Enchufable', 'Eléctrico']
+DEALERS = ['OCASION PLUS', 'AUTOFER', 'RENEW']
+
+
+def synthetic_listings(size):
+    return [{
+        'guid_anuncio': hashlib.md5(str(i).encode()).hexdigest(),
+        'Marca': BRANDS[i % len(BRANDS)],
+        'Concesionario': DEALERS[i % len(DEALERS)],
+        'Tipo Combustible': FUELS[i % len(FUELS)],
+    } for i in range(size)]
+
+
+def microseconds_per_call(function, arguments):
+    started = time.perf_counter()
+    for argument in arguments:
+        function(argument)
+    return (time.perf_counter() - started) / len(arguments) * 1e6
+
+
+def main():
+    print(f"{'anuncios':>10} {'índice (µs)':>12} {'lineal (µs)':>12} {'construcción (s)':>17}")
+    for size in CATALOGUE_SIZES:
+        listings = synthetic_listings(size)
+        started = time.perf_counter()
+        index = ListingIndex(listings)
+        build_seconds = time.perf_counter() - started
+
+        guids = [listings[random.randrange(size)]['guid_anuncio'] for _ in range(LOOKUPS)]
+        indexed = microseconds_per_call(index.get, guids)
+        # El acceso anterior de get_listing_by_guid: next(...) sobre toda la lista
+        linear = microseconds_per_call(
+            lambda guid: next((item for item in listings if item.get('guid_anuncio') == guid), None),
+            guids[:LINEAR_SCAN_LOOKUPS])
+        print(f"{size:>10} {indexed:>12.3f} {linear:>12.1f} {build_seconds:>17.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import os
+import stat
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from werkzeug.security import safe_join
+
+from parte_2_variantes_imagenes import original_filename_for
+
+IMAGE_STAT_CACHE_SIZE = 20000  # Entradas (imágenes distintas) que se recuerdan como máximo
+IMAGE_STAT_CACHE_TTL = 300  # Segundos: una imagen nueva o regenerada en disco se ve como mucho tras este tiempo
+
+
+@dataclass(frozen=True, slots=True)
+class ImageFile:
+    """Archivo que se sirve para una URL de imagen, con lo necesario para las cabeceras de caché."""
+    path: str
+    size: int
+    mtime: float
+    etag: str
+    is_fallback: bool  # True si se pidió una variante que aún no existe y se sirve el original
+
+
+class ImageStatCache:
+    """
+    Caché en memoria (LRU con caducidad) de (guid, archivo) → ImageFile, para que las peticiones repetidas
+    de una imagen no toquen el disco: ni isdir/exists ni stat. También recuerda las que no existen.
+    El ETag sale del tamaño y el mtime en nanosegundos, que cambian siempre que se reescribe el archivo
+    (las descargas y variantes se escriben en un temporal y se renombran).
+    """
+
+    def __init__(self, base_dir, max_entries=IMAGE_STAT_CACHE_SIZE, ttl=IMAGE_STAT_CACHE_TTL):
+        self.base_dir = base_dir
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, guid, filename):
+        """ImageFile que corresponde a /api/images/<guid>/<filename>, o None si no hay nada que servir."""
+        key = (guid, filename)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        image = self._stat(guid, filename)
+        with self._lock:
+            self._entries[key] = (now + self.ttl, image)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return image
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _stat(self, guid, filename):
+        path = safe_join(self.base_dir, guid, filename)  # None si intenta salir del directorio
+        if path is None:
+            return None
+        is_fallback = False
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            # Variante todavía sin generar: se sirve el original
+            original_filename = original_filename_for(filename)
+            path = safe_join(self.base_dir, guid, original_filename) if original_filename else None
+            if path is None:
+                return None
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                return None
+            is_fallback = True
+        if not stat.S_ISREG(file_stat.st_mode):
+            return None
+        etag = f"{file_stat.st_size:x}-{file_stat.st_mtime_ns:x}"
+        return ImageFile(path=path, size=file_stat.st_size, mtime=file_stat.st_mtime, etag=etag,
+                         is_fallback=is_fallback)
@@ -0,0 +1,226 @@
+import bisect
+import re
+import unicodedata
+from collections import Counter
+
+# Marcas de dos palabras; en el resto la marca es la primera palabra de 'Marca' (p. ej. "KIA Ceed" → "kia")
+MULTIWORD_BRANDS = ('alfa romeo', 'aston martin', 'land rover', 'rolls royce')
+
+
+def normalize_index_key(value):
+    """Clave de índice: texto en minúsculas, sin acentos ni espacios sobrantes. None si el valor está vacío o es N/A."""
+    if value is None:
+        return None
+    text = ' '.join(str(value).split()).lower()
+    if text in ('', 'n/a', 'nan'):
+        return None
+    return ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+
+
+def brand_key(marca):
+    """Marca normalizada a partir del campo 'Marca' del CSV, que junta marca y modelo ("KIA Ceed")."""
+    text = normalize_index_key(marca)
+    if text is None:
+        return None
+    text = text.replace('-', ' ')
+    for brand in MULTIWORD_BRANDS:
+        if text == brand or text.startswith(brand + ' '):
+            return brand
+    return text.split(' ', 1)[0]
+
+
+# Índices secundarios: nombre del filtro en la API → función que saca la clave de un anuncio
+SECONDARY_INDEX_FIELDS = {
+    'marca': lambda listing: brand_key(listing.get('Marca')),
+    'concesionario': lambda listing: normalize_index_key(listing.get('Concesionario')),
+    'combustible': lambda listing: normalize_index_key(listing.get('Tipo Combustible')),
+}
+
+# Búsqueda de texto libre: campos indexados y palabras (letras y números ya sin acentos)
+TEXT_SEARCH_FIELDS = ('Marca', 'Modelo', 'Concesionario')
+TOKEN_REGEX = re.compile(r'[a-z0-9]+')
+
+# Columnas numéricas de los registros preparados, con filtro por rango y orden
+NUMERIC_FIELDS = ('precio', 'kilometros', 'año')
+
+# Valores por faceta que se devuelven (los más frecuentes)
+FACET_LIMIT = 20
+
+# Si el resultado filtrado supera esta fracción del catálogo, se ordena recorriendo la columna ya ordenada
+SORT_SCAN_FRACTION = 0.125
+
+
+def tokenize(text):
+    """Palabras normalizadas de un texto ("Land-Rover Évoque" → ['land', 'rover', 'evoque'])."""
+    key = normalize_index_key(text)
+    return TOKEN_REGEX.findall(key) if key else []
+
+
+class ListingIndex:
+    """
+    Índices en memoria de los anuncios cargados: por GUID (acceso O(1) al detalle) y secundarios por marca,
+    concesionario y combustible (posiciones en `listings`, en el orden original).
+    Con `make_record`, guarda además en `records` la versión preparada de cada anuncio (misma posición)
+    y prepara las columnas numéricas ordenadas de la búsqueda.
+    Para /api/search: índice invertido palabra → posiciones (con búsqueda por prefijo sobre el vocabulario
+    ordenado) y la clave de cada faceta por posición.
+    Es inmutable: load_data construye uno nuevo y lo sustituye de golpe, así que una petición nunca ve
+    los índices a medio actualizar.
+    """
+
+    def __init__(self, listings, make_record=None):
+        self.listings = listings
+        self.records = [make_record(listing) for listing in listings] if make_record else None
+        self.by_guid = {}
+        self.record_by_guid = {}
+        self.position_by_guid = {}
+        self.secondary = {field: {} for field in SECONDARY_INDEX_FIELDS}
+        self.facet_keys = {field: [None] * len(listings) for field in SECONDARY_INDEX_FIELDS}
+        self.postings = {}
+        for position, listing in enumerate(listings):
+            guid = listing.get('guid_anuncio')
+            if guid and guid not in self.by_guid:
+                self.by_guid[guid] = listing
+                self.position_by_guid[guid] = position
+                if self.records is not None:
+                    self.record_by_guid[guid] = self.records[position]
+            for field, key_for in SECONDARY_INDEX_FIELDS.items():
+                key = key_for(listing)
+                if key is not None:
+                    self.secondary[field].setdefault(key, []).append(position)
+                    self.facet_keys[field][position] = key
+            for token in {token for field in TEXT_SEARCH_FIELDS for token in tokenize(listing.get(field))}:
+                self.postings.setdefault(token, []).append(position)
+        self.vocabulary = sorted(self.postings)
+
+        # Por columna numérica: valores ordenados (para bisect) con sus posiciones, los anuncios sin valor
+        # y el puesto de cada posición en ese orden
+        self.numeric = {}
+        self.missing = {}
+        self.ranks = {}
+        for field in NUMERIC_FIELDS if self.records is not None else ():
+            column = sorted((value, position) for position, value in
+                            enumerate(getattr(record, field) for record in self.records) if value is not None)
+            self.numeric[field] = ([value for value, _ in column], [position for _, position in column])
+            rank = [len(column)] * len(listings)  # Sin valor: detrás de todos
+            for order, (_, position) in enumerate(column):
+                rank[position] = order
+            self.missing[field] = [position for position, order in enumerate(rank) if order == len(column)]
+            self.ranks[field] = rank
+
+    def __len__(self):
+        return len(self.listings)
+
+    def get(self, guid):
+        """Anuncio con ese GUID, o None."""
+        return self.by_guid.get(guid)
+
+    def get_record(self, guid):
+        """Registro preparado del anuncio con ese GUID, o None."""
+        return self.record_by_guid.get(guid)
+
+    def position_of(self, guid):
+        """Posición del anuncio con ese GUID en `listings`, o None."""
+        return self.position_by_guid.get(guid)
+
+    def positions_for(self, field, value):
+        """Posiciones de los anuncios cuyo `field` ('marca', 'concesionario', 'combustible') coincide con `value`."""
+        key = brand_key(value) if field == 'marca' else normalize_index_key(value)
+        return self.secondary[field].get(key, [])
+
+    def filter_positions(self, **criteria):
+        """
+        Posiciones (ordenadas) de los anuncios que cumplen todos los filtros no vacíos de `criteria`.
+        Sin filtros, retorna None (= todos los anuncios).
+        """
+        active = [(field, value) for field, value in criteria.items() if value]
+        if not active:
+            return None
+        candidate_lists = sorted((self.positions_for(field, value) for field, value in active), key=len)
+        result = candidate_lists[0]
+        for other in candidate_lists[1:]:
+            other_set = set(other)
+            result = [position for position in result if position in other_set]
+        return result
+
+    def text_positions(self, query):
+        """
+        Posiciones de los anuncios cuya marca, modelo o concesionario tiene, para cada término de `query`,
+        una palabra que empieza por él ("land rov" encuentra "Land Rover"). None si la consulta no tiene términos.
+        """
+        result = None
+        for term in set(tokenize(query)):
+            matches = set()
+            for token_index in range(bisect.bisect_left(self.vocabulary, term), len(self.vocabulary)):
+                token = self.vocabulary[token_index]
+                if not token.startswith(term):
+                    break
+                matches.update(self.postings[token])
+            result = matches if result is None else result & matches
+            if not result:
+                break
+        return result
+
+    def range_positions(self, field, minimum=None, maximum=None):
+        """Posiciones de los anuncios con `field` ('precio', 'kilometros', 'año') entre minimum y maximum (incluidos)."""
+        values, positions = self.numeric[field]
+        start = 0 if minimum is None else bisect.bisect_left(values, minimum)
+        end = len(values) if maximum is None else bisect.bisect_right(values, maximum)
+        return positions[start:end]
+
+    def search(self, query=None, ranges=None, sort=None, **criteria):
+        """
+        Búsqueda combinada: texto libre, filtros exactos (`criteria`, como filter_positions) y rangos
+        ({'precio': (min, max)}, cualquiera de los dos puede ser None). `sort` es un campo numérico,
+        con '-' delante para orden descendente; los anuncios sin ese valor van siempre al final.
+        Retorna (posiciones del resultado, facetas {campo: {clave: número de anuncios}}).
+        """
+        candidates = []
+        text = self.text_positions(query) if query else None
+        if text is not None:
+            candidates.append(text)
+        filtered = self.filter_positions(**criteria)
+        if filtered is not None:
+            candidates.append(filtered)
+        for field, (minimum, maximum) in (ranges or {}).items():
+            if minimum is not None or maximum is not None:
+                candidates.append(self.range_positions(field, minimum, maximum))
+
+        # Se intersecan de menor a mayor; sin ningún filtro el resultado es el catálogo entero
+        result = None
+        if candidates:
+            candidates.sort(key=len)
+            result = set(candidates[0])
+            for other in candidates[1:]:
+                result.intersection_update(other)
+
+        if sort:
+            positions = self._sorted_positions(sort, result)
+        else:
+            positions = range(len(self.listings)) if result is None else sorted(result)
+        return positions, self._facets(result)
+
+    def _sorted_positions(self, sort, result):
+        field = sort.lstrip('-')
+        descending = sort.startswith('-')
+        if result is None or len(result) > len(self.listings) * SORT_SCAN_FRACTION:
+            # Resultado grande: se recorre la columna ya ordenada y se queda con lo que está en el resultado
+            ordered = self.numeric[field][1][::-1] if descending else self.numeric[field][1]
+            ordered = ordered + self.missing[field]
+            return ordered if result is None else [position for position in ordered if position in result]
+        rank = self.ranks[field]
+        missing_rank = len(self.numeric[field][0])
+        if descending:
+            return sorted(result, key=lambda position: (rank[position] == missing_rank, -rank[position]))
+        return sorted(result, key=rank.__getitem__)
+
+    def _facets(self, result):
+        facets = {}
+        for field, keys in self.facet_keys.items():
+            if result is None:
+                counts = Counter({key: len(positions) for key, positions in self.secondary[field].items()})
+            else:
+                counts = Counter(keys[position] for position in result)
+                counts.pop(None, None)
+            facets[field] = dict(counts.most_common(FACET_LIMIT))
+        return facets
@@ -0,0 +1,183 @@
+import json
+import os
+import re
+from dataclasses import dataclass
+
+from parte_2_variantes_imagenes import VARIANT_FORMATS, VARIANT_SIZES, variant_filename
+
+NUMERIC_REGEX = re.compile(r"^-?\d+(\.\d+)?$")
+
+# Claves de la tarjeta del listado (las que se pueden pedir con ?fields= en /api/listings y /api/search)
+SUMMARY_FIELDS = ("guid_anuncio", "marca", "modelo", "precio", "kilometros", "año", "concesionario", "tours_url",
+                  "thumbnail_url", "thumbnail_variants")
+
+# Campos de texto del detalle que se muestran como "N/A" cuando vienen vacíos
+DETAIL_TEXT_FIELDS = ["garantia", "descripción", "url_anuncio", "provincia", "tipo_de_anuncio", "clase_de_vehículo",
+                      "carrocería", "combustible", "tipo_de_motor", "cambio", "localidad", "concesionario"]
+
+
+# --- Función auxiliar para manejar valores numéricos y "N/A" ---
+def parse_numeric_value(value, value_type=float):
+    """
+    Intenta convertir un valor a numérico, manejando "N/A", vacíos, y formatos de moneda.
+    Devuelve None si no es numérico o se limpia a una cadena vacía.
+    """
+    if value is None:
+        return None
+
+    if isinstance(value, str):
+        cleaned_value = value.strip().upper()
+        if cleaned_value == "N/A" or cleaned_value == "":
+            return None  # Si es N/A o vacío, devolver None (se convierte a null en JSON)
+
+        # Si no es N/A ni vacío, intentar limpiar para numérico
+        cleaned_value = value.replace('\u20ac', '').replace('€', '').strip()
+
+        # Manejar comas como separadores decimales si el formato es europeo (ej: "1.234,56")
+        if ',' in cleaned_value and '.' in cleaned_value and cleaned_value.rfind(',') > cleaned_value.rfind('.'):
+            cleaned_value = cleaned_value.replace('.', '').replace(',', '.')
+        elif ',' in cleaned_value:
+            cleaned_value = cleaned_value.replace(',', '.')
+        else:
+            cleaned_value = cleaned_value.replace('.',
+                                                  '')  # Eliminar solo puntos, asumiendo que son separadores de miles
+
+        # Validar que después de la limpieza, solo queden dígitos y un posible punto decimal.
+        # La regex permite números negativos y decimales.
+        if not NUMERIC_REGEX.match(cleaned_value):
+            return None  # Si no se parece a un número, devolver None
+
+        # Si la cadena resultante está vacía después de la limpieza, también es None
+        if not cleaned_value:
+            return None
+
+        value = cleaned_value
+
+    # Intentar la conversión final
+    try:
+        return value_type(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def is_missing_text(value):
+    """True si el valor es una cadena vacía o "N/A"."""
+    return isinstance(value, str) and value.strip().upper() in ("N/A", "")
+
+
+def image_url(guid, filename, image_version=None):
+    """
+    URL de /api/images para un archivo. Con `image_version(guid, filename)` se añade ?v=<versión> (el ETag del
+    archivo), así la URL cambia cuando cambian los bytes y se puede cachear como inmutable.
+    """
+    url = f"/api/images/{guid}/{filename}"
+    version = image_version(guid, filename) if image_version else None
+    return f"{url}?v={version}" if version else url
+
+
+def image_variant_urls(guid, image_filename, image_version=None):
+    """
+    URLs de la imagen original y de sus variantes (miniatura, mediana) en cada formato generado.
+    Si una variante aún no se ha generado, /api/images sirve el original en su lugar.
+    """
+    urls = {"original": image_url(guid, image_filename, image_version)}
+    for variant in VARIANT_SIZES:
+        for extension in VARIANT_FORMATS:
+            key = variant if extension == 'jpg' else f"{variant}_{extension}"
+            urls[key] = image_url(guid, variant_filename(image_filename, variant, extension), image_version)
+    return urls
+
+
+def to_json_bytes(data):
+    """Serialización compacta en UTF-8, lista para concatenar en una respuesta."""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+@dataclass(frozen=True, slots=True)
+class ListingRecord:
+    """
+    Anuncio ya normalizado para la API: los números limpios y los dos diccionarios que ve el frontend
+    (tarjeta del listado y detalle), con su JSON serializado de antemano.
+    Se construye una vez en load_data; las rutas solo eligen registros y concatenan su JSON.
+    """
+    guid: str
+    precio: float
+    kilometros: float
+    año: int
+    summary: dict
+    detail: dict
+    summary_json: bytes
+    detail_json: bytes
+
+
+def build_listing_record(raw_listing, image_version=None):
+    """
+    Convierte un anuncio de listings_with_local_data en un ListingRecord.
+    `image_version(guid, archivo)` da la versión que se pone en las URLs de imagen (ver image_url).
+    """
+    guid = raw_listing.get("guid_anuncio")
+    precio = parse_numeric_value(raw_listing.get("Precio Contado"))
+    kilometros = parse_numeric_value(raw_listing.get("Kilómetros"))
+    año = parse_numeric_value(raw_listing.get("Año Matriculación"), int)
+    tours_url = raw_listing.get("Tours")
+    if is_missing_text(tours_url):
+        tours_url = None
+
+    images = []
+    for img_info in raw_listing.get('downloaded_images') or []:
+        if isinstance(img_info, dict) and 'local_path' in img_info:
+            images.append(image_variant_urls(guid, os.path.basename(img_info['local_path']), image_version))
+
+    # Tarjeta del listado: solo las claves que usa el frontend
+    summary = {
+        "guid_anuncio": guid,
+        "marca": raw_listing.get("Marca"),
+        "modelo": raw_listing.get("Modelo"),
+        "precio": precio,
+        "kilometros": kilometros,
+        "año": año,
+        "concesionario": raw_listing.get("Concesionario"),
+        "tours_url": tours_url,
+        "thumbnail_url": None,
+    }
+    if images:
+        summary["thumbnail_url"] = images[0]['thumb']
+        summary["thumbnail_variants"] = images[0]
+
+    # Detalle: todas las claves que espera el modal
+    detail = {
+        "guid_anuncio": guid,
+        "marca": raw_listing.get("Marca"),
+        "modelo": raw_listing.get("Modelo"),
+        "precio": precio,
+        "precio_financiado_display": parse_numeric_value(raw_listing.get("Precio Financiado")),
+        "año": año,
+        "kilometros": kilometros,
+        "puertas": parse_numeric_value(raw_listing.get("Puertas"), int),
+        "concesionario": raw_listing.get("Concesionario"),
+        "tipo_de_motor": raw_listing.get("Tipo Combustible"),
+        "cambio": raw_listing.get("Transmisión"),
+        "localidad": raw_listing.get("Ubicación Concesionario"),
+        "provincia": raw_listing.get("Provincia", "N/A"),
+        "tipo_de_anuncio": raw_listing.get("Tipo de Anuncio", "Coche de ocasión"),
+        "clase_de_vehículo": raw_listing.get("Clase de Vehículo", "Turismo"),
+        "combustible": raw_listing.get("Tipo Combustible"),
+        "carrocería": raw_listing.get("Carrocería"),
+        "garantia": raw_listing.get("Garantía Oficial"),
+        "descripción": raw_listing.get("Descripción"),
+        "url_anuncio": raw_listing.get("URL Anuncio"),
+        "tours_url": tours_url,
+        "images": [{
+            "api_image_url": variant_urls['original'],
+            "api_medium_url": variant_urls['medium'],
+            "api_thumbnail_url": variant_urls['thumb'],
+            "variants": variant_urls,
+        } for variant_urls in images],
+    }
+    for key in DETAIL_TEXT_FIELDS:
+        if is_missing_text(detail[key]):
+            detail[key] = "N/A"
+
+    return ListingRecord(guid=guid, precio=precio, kilometros=kilometros, año=año,
+                         summary=summary, detail=detail,
+                         summary_json=to_json_bytes(summary), detail_json=to_json_bytes(detail))
@@ -1,46 +1,275 @@
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 import os
 import json
 from PIL import Image  # Importar la clase Image de Pillow
+import bisect
+import collections
+import hashlib
 import io
+import queue
+import random
+import sqlite3
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import math
 
+from parte_2_variantes_imagenes import generate_all_variants
+
 # --- Configuración ---
 # ¡IMPORTANTE! ACTUALIZA ESTAS RUTAS A TU NUEVA UBICACIÓN
 CSV_PATH = "C:\\Users\\CERO\\PycharmProjects\\PythonProject1\\csv coches\\Coches_Ocasión.csv"  # Asegúrate de que esta es la ruta correcta
 DOWNLOAD_BASE_DIR = "C:\\Users\\CERO\\PycharmProjects\\PythonProject1\\csv coches\\imagenes_coches_descargadas"
-LOCAL_JSON_PATH = "C:\\Users\\CERO\\PycharmProjects\\PythonProject1\\csv coches\\listings_with_local_data.json"
+LOCAL_JSONL_PATH = "C:\\Users\\CERO\\PycharmProjects\\PythonProject1\\csv coches\\listings_with_local_data.jsonl"  # Un anuncio por línea
 ANALYSIS_RESULTS_PATH = "C:\\Users\\CERO\\PycharmProjects\\PythonProject1\\csv coches\\analysis_results.json"
 MAX_RETRIES = 3
-RETRY_DELAY = 2  # segundos
+RETRY_DELAY = 2  # segundos; base de la espera exponencial con azar entre reintentos (2 s, 4 s, 8 s... ±50 %)
+DOWNLOAD_CONCURRENCY = 16  # Descargas de imágenes simultáneas en total
+MAX_CONCURRENCY_PER_HOST = 8  # Descargas simultáneas como máximo contra un mismo servidor
+LISTING_CONCURRENCY = 4  # Anuncios que se procesan a la vez (sus imágenes comparten el límite global)
+GENERATE_VARIANTS = True  # Al terminar, genera las miniaturas y variantes medianas (parte_2_variantes_imagenes.py)
+METRICS_SNAPSHOT_INTERVAL = 10  # Segundos entre volcados de las métricas en curso a ANALYSIS_RESULTS_PATH
+CSV_CHUNK_SIZE = 500  # Filas del CSV que se leen de cada vez
 MAX_IMAGE_COUNT_PER_CAR = 25  # Límite de imágenes por coche
 MIN_SIZE_BYTES = 5000  # Tamaño mínimo en bytes para considerar la imagen válida (puede ser útil para filtrar placeholders)
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # Bytes por trozo al volcar una descarga a disco
+JPEG_MAGIC_BYTES = b'\xff\xd8\xff'  # Cabecera de todo archivo JPEG
+JPEG_DIRECT_MODES = ('RGB', 'L')  # JPEG que se guardan tal cual; los demás (p. ej. CMYK) se convierten a RGB
+DOWNLOAD_MANIFEST_PATH = "C:\\Users\\CERO\\PycharmProjects\\PythonProject1\\csv coches\\download_manifest.sqlite3"  # Imágenes ya descargadas
+REVALIDATE_EXISTING_IMAGES = False  # Si es True, las imágenes ya descargadas se revalidan con un GET condicional (ETag / Last-Modified)
+
+# Cabeceras User-Agent para simular una petición de navegador Chrome
+DOWNLOAD_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/100.0.4896.127 Safari/537.36',
+    'Accept': 'image/jpeg,image/png,image/*;q=0.8,*/*;q=0.5'
+    # Preferimos JPEG, luego PNG, luego cualquier imagen, luego todo
+}
+
+# --- Métricas para el análisis ---
+# Límites superiores de los cubos de los histogramas (el último cubo recoge todo lo que los supera)
+LATENCY_BUCKETS_SECONDS = [0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10]
+SIZE_BUCKETS_BYTES = [5_000, 10_000, 25_000, 50_000, 75_000, 100_000, 150_000, 200_000, 300_000, 500_000, 1_000_000]
+MAX_RECENT_ERRORS = 50  # Últimos mensajes de error que se guardan como ejemplo
+
+
+class Histogram:
+    """
+    Histograma de cubos fijos: memoria constante sea cual sea el número de muestras.
+    Los percentiles se estiman interpolando dentro del cubo en que caen.
+    """
 
-# --- Inicialización de métricas para el análisis ---
-total_cars_processed = 0
-total_download_size_bytes = 0
-total_image_width = 0
-total_image_height = 0
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def quantile(self, q):
+        if not self.count:
+            return 0
+        target = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= target:
+                lower = self.bounds[index - 1] if index > 0 else self.min
+                upper = self.bounds[index] if index < len(self.bounds) else self.max
+                lower, upper = max(lower, self.min), min(upper, self.max)
+                return lower + (upper - lower) * (target - seen) / bucket_count
+            seen += bucket_count
+        return self.max
+
+    def summary(self, scale=1, digits=2):
+        return {
+            "p50": round(self.quantile(0.5) * scale, digits),
+            "p95": round(self.quantile(0.95) * scale, digits),
+            "media": round(self.mean() * scale, digits),
+            "max": round((self.max or 0) * scale, digits),
+        }
+
+
+class DownloadMetrics:
+    """
+    Métricas de la ejecución, seguras para los hilos de descarga: contadores, histogramas de latencia y peso,
+    errores por tipo y un puñado de errores recientes. Ocupa memoria constante y se puede volcar en cualquier
+    momento con snapshot().
+    """
 
-total_images_downloaded_global_counter = []
-total_download_size_bytes_global_counter = []
-total_image_width_global_counter = []
-total_image_height_global_counter = []
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.counters = {}
+        self.latency_seconds = Histogram(LATENCY_BUCKETS_SECONDS)
+        self.size_bytes = Histogram(SIZE_BUCKETS_BYTES)
+        self.width_total = 0
+        self.height_total = 0
+        self.errors_by_type = {}
+        self.recent_errors = collections.deque(maxlen=MAX_RECENT_ERRORS)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_download(self, latency_seconds, size_bytes, width, height):
+        with self._lock:
+            self.counters['imagenes_descargadas'] = self.counters.get('imagenes_descargadas', 0) + 1
+            self.latency_seconds.observe(latency_seconds)
+            self.size_bytes.observe(size_bytes)
+            self.width_total += width
+            self.height_total += height
+
+    def record_error(self, guid_anuncio, error_type, error_msg):
+        with self._lock:
+            self.errors_by_type[error_type] = self.errors_by_type.get(error_type, 0) + 1
+            self.recent_errors.append({"guid_anuncio": guid_anuncio, "tipo": error_type, "mensaje": error_msg})
+
+    def snapshot(self, in_progress=False):
+        """
+        Resultados del análisis en el formato de ANALYSIS_RESULTS_PATH. Las claves antiguas se mantienen salvo
+        'errores_descarga_por_anuncio' (todos los mensajes de cada anuncio, crecía sin límite), que se sustituye
+        por 'errores_por_tipo' (contador por tipo de error) y 'ultimos_errores' (los MAX_RECENT_ERRORS últimos).
+        """
+        with self._lock:
+            counters = dict(self.counters)
+            downloaded = counters.get('imagenes_descargadas', 0)
+            successful_cars = counters.get('coches_exitosos', 0)
+            elapsed = max(time.time() - self.started_at, 1e-9)
+            avg_width = self.width_total / downloaded if downloaded else 0
+            avg_height = self.height_total / downloaded if downloaded else 0
+            return {
+                "fecha_generacion": datetime.now().isoformat(),
+                "en_curso": in_progress,
+                "segundos_transcurridos": round(elapsed, 1),
+                "total_coches_procesados": counters.get('coches_procesados', 0),
+                "coches_exitosos": successful_cars,
+                "coches_fallidos": counters.get('coches_fallidos', 0),
+                "total_imagenes_descargadas": downloaded,
+                "imagenes_reutilizadas": counters.get('imagenes_reutilizadas', 0),
+                "promedio_imagenes_por_coche": round(counters.get('imagenes_por_coche', 0) / successful_cars, 2)
+                if successful_cars else 0,
+                "promedio_peso_kb": round(self.size_bytes.mean() / 1024, 2),
+                "promedio_dimensiones_px": f"{round(avg_width)}x{round(avg_height)}",
+                "imagenes_por_segundo": round(downloaded / elapsed, 2),
+                "mb_por_segundo": round(self.size_bytes.total / elapsed / (1024 * 1024), 3),
+                "latencia_descarga_s": self.latency_seconds.summary(digits=3),
+                "peso_kb": self.size_bytes.summary(scale=1 / 1024),
+                "errores_por_tipo": dict(self.errors_by_type),
+                "ultimos_errores": list(self.recent_errors),
+            }
+
+    def write_snapshot(self, path, in_progress=False):
+        """Escribe el snapshot en `path` de forma atómica (archivo temporal + renombrado)."""
+        snapshot = self.snapshot(in_progress)
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=4)
+        os.replace(temporary_path, path)
+        return snapshot
+
+
+def report_metrics_periodically(stop_event):
+    """Vuelca las métricas en curso a ANALYSIS_RESULTS_PATH cada METRICS_SNAPSHOT_INTERVAL segundos."""
+    while not stop_event.wait(METRICS_SNAPSHOT_INTERVAL):
+        try:
+            snapshot = metrics.write_snapshot(ANALYSIS_RESULTS_PATH, in_progress=True)
+            print(f"[métricas] {snapshot['total_coches_procesados']} coches, "
+                  f"{snapshot['total_imagenes_descargadas']} imágenes, {snapshot['imagenes_por_segundo']} img/s")
+        except OSError as e:
+            print(f"No se pudieron volcar las métricas en curso: {e}")
 
-successful_cars = 0
-failed_cars = 0
-images_per_car_counts = []
-download_errors_by_type = {}
 
+# Métricas de la ejecución actual (main las reinicia)
+metrics = DownloadMetrics()
 
-def safe_download_image(url, destination_path, guid_anuncio):
-    """
-    Descarga una imagen de forma segura con reintentos, utilizando solo Pillow.
-    Asegura que la URL de descarga termina en .jpg para forzar el formato.
-    """
+# Una sesión HTTP por hilo (reutiliza conexiones keep-alive) y un semáforo por host
+_thread_state = threading.local()
+_host_limits = {}
+_host_limits_lock = threading.Lock()
+_download_executor = None
+
+
+def get_http_session():
+    """Retorna la sesión HTTP del hilo actual, con su pool de conexiones, creándola la primera vez."""
+    if not hasattr(_thread_state, 'session'):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=MAX_CONCURRENCY_PER_HOST, pool_maxsize=MAX_CONCURRENCY_PER_HOST)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _thread_state.session = session
+    return _thread_state.session
+
+
+def host_semaphore(url):
+    """Semáforo que limita las descargas simultáneas contra el host de `url` a MAX_CONCURRENCY_PER_HOST."""
+    host = requests.utils.urlparse(url).netloc
+    with _host_limits_lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(MAX_CONCURRENCY_PER_HOST)
+        return _host_limits[host]
+
+
+def get_download_executor():
+    """Pool global de descargas: limita a DOWNLOAD_CONCURRENCY las imágenes en vuelo entre todos los anuncios."""
+    global _download_executor
+    with _host_limits_lock:
+        if _download_executor is None:
+            _download_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_CONCURRENCY)
+        return _download_executor
+
+
+def backoff_delay(attempt):
+    """Espera antes del reintento `attempt` (0, 1, 2...): exponencial sobre RETRY_DELAY con ±50 % de azar."""
+    return RETRY_DELAY * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+def error_type_for(exception):
+    """Clase de error para las métricas: 'HTTP <código>' en errores HTTP y el nombre de la excepción en el resto."""
+    response = getattr(exception, 'response', None)
+    if isinstance(exception, requests.exceptions.HTTPError) and response is not None:
+        return f"HTTP {response.status_code}"
+    return type(exception).__name__
+
+
+def write_chunks_to_file(destination_path, first_chunk, chunks):
+    """Vuelca la descarga a disco trozo a trozo en un .part y lo renombra al final, para no dejar archivos a medias."""
+    partial_path = destination_path + '.part'
+    try:
+        with open(partial_path, 'wb') as f:
+            f.write(first_chunk)
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(partial_path, destination_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+
+def transcode_to_jpeg(img, destination_path):
+    """Convierte una imagen de Pillow a un modo compatible con JPEG y la guarda en `destination_path`."""
+    if img.mode in ('RGBA', 'P', 'CMYK'):
+        img = img.convert('RGB')
+    elif img.mode == 'LA':
+        img = img.convert('L')
+    img.save(destination_path, "jpeg")
+    return img.size
+
+
+def adjust_image_url(url):
+    """Retorna la URL de la imagen pidiendo siempre un .jpg, para forzar el formato."""
     # Asegurarse de que la URL pida un JPG
     # Si la URL ya tiene una extensión de imagen, la reemplazamos con .jpg
     # Si no tiene extensión o si termina en algo como .avif, lo ajustamos
@@ -67,31 +296,47 @@ def safe_download_image(url, destination_path, guid_anuncio):
     adjusted_url = requests.utils.urlunparse(
         parsed_url._replace(path=new_path)
     )
+    return adjusted_url
 
-    # Cabeceras User-Agent para simular una petición de navegador Chrome
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/100.0.4896.127 Safari/537.36',
-        'Accept': 'image/jpeg,image/png,image/*;q=0.8,*/*;q=0.5'
-        # Preferimos JPEG, luego PNG, luego cualquier imagen, luego todo
-    }
+
+def safe_download_image(url, destination_path, guid_anuncio):
+    """
+    Descarga una imagen de forma segura con reintentos, utilizando solo Pillow.
+    Asegura que la URL de descarga termina en .jpg para forzar el formato.
+    Si el servidor ya devuelve un JPEG (se mira la cabecera), los bytes se escriben tal cual en disco por trozos
+    y solo se lee la cabecera para las dimensiones; únicamente AVIF/PNG/WebP y similares se decodifican y recodifican.
+    Retorna (éxito, ancho, alto, bytes, validadores), donde validadores son el ETag y el Last-Modified de la respuesta.
+    """
+    adjusted_url = adjust_image_url(url)
 
     for attempt in range(MAX_RETRIES):
         try:
             print(f"  Descargando desde: {adjusted_url} (Intento {attempt + 1}/{MAX_RETRIES})")  # Usamos adjusted_url
-            response = requests.get(adjusted_url, timeout=10, stream=True, headers=headers)
-            response.raise_for_status()
-
-            image_data_bytes = io.BytesIO(response.content)
+            # La descarga cuenta para el límite por host; la recodificación con Pillow va fuera del semáforo
+            with host_semaphore(adjusted_url):
+                download_started = time.perf_counter()
+                response = get_http_session().get(adjusted_url, timeout=10, stream=True, headers=DOWNLOAD_HEADERS)
+                with response:
+                    response.raise_for_status()
+                    validators = response_validators(response)
+                    chunks = response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE)
+                    first_chunk = next(chunks, b'')
+                    if first_chunk.startswith(JPEG_MAGIC_BYTES):
+                        write_chunks_to_file(destination_path, first_chunk, chunks)
+                        image_data_bytes = None
+                    else:
+                        image_data_bytes = io.BytesIO(first_chunk + b''.join(chunks))
+                download_seconds = time.perf_counter() - download_started
 
             try:
-                img = Image.open(image_data_bytes)
-
-                if img.mode in ('RGBA', 'P', 'CMYK'):
-                    img = img.convert('RGB')
-                elif img.mode == 'LA':
-                    img = img.convert('L')
-
-                img.save(destination_path, "jpeg")
+                if image_data_bytes is None:
+                    # Image.open solo lee la cabecera: no se decodifica la imagen
+                    with Image.open(destination_path) as img:
+                        width, height = img.size
+                        if img.mode not in JPEG_DIRECT_MODES:
+                            width, height = transcode_to_jpeg(img, destination_path)
+                else:
+                    width, height = transcode_to_jpeg(Image.open(image_data_bytes), destination_path)
 
                 actual_size_bytes = os.path.getsize(destination_path)
 
@@ -99,188 +344,364 @@ def safe_download_image(url, destination_path, guid_anuncio):
                     print(
                         f"  Advertencia: La imagen descargada '{os.path.basename(destination_path)}' es muy pequeña ({actual_size_bytes} bytes). Podría no ser una imagen de coche válida.")
 
-                return True, img.size[0], img.size[1], actual_size_bytes
+                metrics.record_download(download_seconds, actual_size_bytes, width, height)
+                return True, width, height, actual_size_bytes, validators
 
             except Image.UnidentifiedImageError:
                 error_msg = f"Pillow no pudo identificar el formato de la imagen descargada de {adjusted_url}. Esto NO DEBERÍA pasar si el servidor devuelve un JPG."
                 print(f"  Error: {error_msg}")
-                download_errors_by_type[guid_anuncio] = download_errors_by_type.get(guid_anuncio, []) + [error_msg]
-                return False, 0, 0, 0
+                metrics.record_error(guid_anuncio, 'UnidentifiedImageError', error_msg)
+                return False, 0, 0, 0, {}
             except Exception as e_pillow:
                 error_msg = f"Error de Pillow al procesar la imagen de {adjusted_url}: {e_pillow}"
                 print(f"  Error: {error_msg}")
-                download_errors_by_type[guid_anuncio] = download_errors_by_type.get(guid_anuncio, []) + [error_msg]
-                return False, 0, 0, 0
+                metrics.record_error(guid_anuncio, f"Pillow {error_type_for(e_pillow)}", error_msg)
+                return False, 0, 0, 0, {}
 
         except requests.exceptions.RequestException as e:
             error_msg = f"Error de red o HTTP al descargar {adjusted_url}: {e}"
             print(f"  Error de descarga (Intento {attempt + 1}/{MAX_RETRIES}): {error_msg}")
-            download_errors_by_type[guid_anuncio] = download_errors_by_type.get(guid_anuncio, []) + [error_msg]
-            time.sleep(RETRY_DELAY)
+            metrics.record_error(guid_anuncio, error_type_for(e), error_msg)
+            if attempt + 1 < MAX_RETRIES:
+                time.sleep(backoff_delay(attempt))
         except Exception as e:
             error_msg = f"Error inesperado durante la descarga inicial de {adjusted_url}: {e}"
             print(f"  Error inesperado (Intento {attempt + 1}/{MAX_RETRIES}): {e}")
-            download_errors_by_type[guid_anuncio] = download_errors_by_type.get(guid_anuncio, []) + [error_msg]
-            time.sleep(RETRY_DELAY)
+            metrics.record_error(guid_anuncio, error_type_for(e), error_msg)
+            if attempt + 1 < MAX_RETRIES:
+                time.sleep(backoff_delay(attempt))
 
     print(f"Fallo la descarga de {adjusted_url} despues de {MAX_RETRIES} intentos.")
-    return False, 0, 0, 0
+    return False, 0, 0, 0, {}
 
 
-def process_image_urls(guid_anuncio, urls):
-    """
-    Procesa una lista de URLs de imagen para un anuncio, descarga y guarda.
-    Retorna una lista de diccionarios con la información de las imágenes locales.
-    """
-    local_images_data = []
-    car_image_dir = os.path.join(DOWNLOAD_BASE_DIR, guid_anuncio)
-    os.makedirs(car_image_dir, exist_ok=True)
+def response_validators(response):
+    """Cabeceras de caché de una respuesta, para revalidar la imagen más adelante con un GET condicional."""
+    return {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
 
-    downloaded_count = 0
-    for i, url in enumerate(urls):
-        if downloaded_count >= MAX_IMAGE_COUNT_PER_CAR:
-            print(f"Límite de {MAX_IMAGE_COUNT_PER_CAR} imágenes alcanzado para el anuncio {guid_anuncio}.")
-            break
 
-        local_filename = f"x{i + 1}.jpg"
-        local_image_path = os.path.join(car_image_dir, local_filename)
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-        # Primero, verifica si la imagen ya existe y es válida para evitar descargarla de nuevo
-        if os.path.exists(local_image_path) and os.path.getsize(local_image_path) > MIN_SIZE_BYTES:
-            try:
-                with Image.open(local_image_path) as img:
-                    local_images_data.append({
-                        "original_url": url,
-                        "local_path": local_image_path,
-                        "size_bytes": os.path.getsize(local_image_path),
-                        "width": img.size[0],
-                        "height": img.size[1]
-                    })
-                    downloaded_count += 1
-                    print(
-                        f"  Imagen {os.path.basename(local_image_path)} ya existe localmente y es válida. Saltando descarga.")
-                    continue
-            except Exception as e:
-                print(f"  Error al verificar imagen local {local_image_path}: {e}. Intentando descargar de nuevo.")
-                if os.path.exists(local_image_path):
-                    os.remove(local_image_path)
 
-        success, width, height, size_bytes = safe_download_image(url, local_image_path, guid_anuncio)
+class DownloadManifest:
+    """
+    Registro persistente (SQLite) de las imágenes ya descargadas: URL, ruta local, bytes, dimensiones,
+    SHA-256 y ETag/Last-Modified. Decidir si una imagen se salta es una consulta al índice más un os.stat,
+    sin abrir cada archivo con Pillow. Es seguro usarlo desde varios hilos.
+    """
 
-        if success:
-            global total_images_downloaded_global_counter, total_download_size_bytes_global_counter, \
-                total_image_width_global_counter, total_image_height_global_counter
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS images (local_path TEXT PRIMARY KEY, original_url TEXT NOT NULL, "
+            "size_bytes INTEGER NOT NULL, width INTEGER NOT NULL, height INTEGER NOT NULL, sha256 TEXT, "
+            "etag TEXT, last_modified TEXT, downloaded_at TEXT NOT NULL)")
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def lookup(self, url, local_image_path):
+        """
+        Retorna la entrada de la imagen si se descargó de esta misma URL y el archivo sigue en disco con el mismo
+        tamaño; si no, None.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM images WHERE local_path = ?", (local_image_path,)).fetchone()
+        if row is None or row['original_url'] != url:
+            return None
+        try:
+            if os.stat(local_image_path).st_size != row['size_bytes']:
+                return None
+        except OSError:
+            return None
+        return dict(row)
+
+    def record(self, url, local_image_path, size_bytes, width, height, validators=None):
+        validators = validators or {}
+        # El hash lee el archivo entero: se calcula fuera del lock para que los hilos no se esperen por el disco
+        sha256 = file_sha256(local_image_path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO images (local_path, original_url, size_bytes, width, height, sha256, etag, "
+                "last_modified, downloaded_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (local_image_path, url, size_bytes, width, height, sha256,
+                 validators.get('etag'), validators.get('last_modified'), datetime.now().isoformat()))
+            self._conn.commit()
+
+
+# Manifiesto de la ejecución actual (lo abre main)
+download_manifest = None
+
+
+def image_not_modified(url, entry):
+    """
+    GET condicional con el ETag / Last-Modified guardados. Retorna True si el servidor responde 304.
+    La respuesta se pide en streaming y se cierra sin leer el cuerpo, así que un 200 no descarga la imagen.
+    """
+    headers = dict(DOWNLOAD_HEADERS)
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    if len(headers) == len(DOWNLOAD_HEADERS):
+        return False
+    adjusted_url = adjust_image_url(url)
+    try:
+        with host_semaphore(adjusted_url):
+            with get_http_session().get(adjusted_url, timeout=10, stream=True, headers=headers) as response:
+                return response.status_code == 304
+    except requests.exceptions.RequestException as e:
+        print(f"  No se pudo revalidar {adjusted_url}: {e}. Se conserva la copia local.")
+        return True
+
+
+def local_image_data(entry):
+    return {
+        "original_url": entry['original_url'],
+        "local_path": entry['local_path'],
+        "size_bytes": entry['size_bytes'],
+        "width": entry['width'],
+        "height": entry['height']
+    }
 
-            total_images_downloaded_global_counter.append(1)
-            total_download_size_bytes_global_counter.append(size_bytes)
-            total_image_width_global_counter.append(width)
-            total_image_height_global_counter.append(height)
 
-            local_images_data.append({
+def load_existing_image(url, local_image_path):
+    """
+    Si la imagen ya está descargada y es válida, retorna sus datos locales para no descargarla de nuevo.
+    Si no existe (o está corrupta, en cuyo caso se borra), retorna None.
+    """
+    if not (os.path.exists(local_image_path) and os.path.getsize(local_image_path) > MIN_SIZE_BYTES):
+        return None
+    try:
+        with Image.open(local_image_path) as img:
+            print(f"  Imagen {os.path.basename(local_image_path)} ya existe localmente y es válida. Saltando descarga.")
+            return {
                 "original_url": url,
                 "local_path": local_image_path,
-                "size_bytes": size_bytes,
-                "width": width,
-                "height": height
-            })
-            downloaded_count += 1
-        else:
-            print(
-                f"No se pudo descargar o procesar la imagen {url} para el anuncio {guid_anuncio}.")  # Aquí seguimos mostrando la URL original
-            # en caso de fallo, para depurar.
+                "size_bytes": os.path.getsize(local_image_path),
+                "width": img.size[0],
+                "height": img.size[1]
+            }
+    except Exception as e:
+        print(f"  Error al verificar imagen local {local_image_path}: {e}. Intentando descargar de nuevo.")
+        if os.path.exists(local_image_path):
+            os.remove(local_image_path)
+        return None
+
+
+def fetch_image(guid_anuncio, url, local_image_path):
+    """Obtiene una imagen (local o descargándola) y retorna sus datos, o None si falla. Se ejecuta en el pool."""
+    entry = download_manifest.lookup(url, local_image_path) if download_manifest else None
+    if entry and (not REVALIDATE_EXISTING_IMAGES or image_not_modified(url, entry)):
+        metrics.increment('imagenes_reutilizadas')
+        return local_image_data(entry)
+    if entry is None:
+        # Imágenes descargadas antes de existir el manifiesto: se comprueban una vez y se registran
+        existing = load_existing_image(url, local_image_path)
+        if existing:
+            if download_manifest:
+                download_manifest.record(url, local_image_path, existing['size_bytes'], existing['width'],
+                                         existing['height'])
+            metrics.increment('imagenes_reutilizadas')
+            return existing
+
+    success, width, height, size_bytes, validators = safe_download_image(url, local_image_path, guid_anuncio)
+    if not success:
+        print(
+            f"No se pudo descargar o procesar la imagen {url} para el anuncio {guid_anuncio}.")  # Aquí seguimos mostrando la URL original
+        # en caso de fallo, para depurar.
+        return None
+    if download_manifest:
+        download_manifest.record(url, local_image_path, size_bytes, width, height, validators)
+
+    return {
+        "original_url": url,
+        "local_path": local_image_path,
+        "size_bytes": size_bytes,
+        "width": width,
+        "height": height
+    }
 
-    return local_images_data
+
+def process_image_urls(guid_anuncio, urls):
+    """
+    Procesa una lista de URLs de imagen para un anuncio, descarga y guarda.
+    Retorna una lista de diccionarios con la información de las imágenes locales.
+    Las imágenes se descargan en paralelo en el pool global. Se piden solo las que faltan para llegar a
+    MAX_IMAGE_COUNT_PER_CAR; si alguna falla, se prueba con las siguientes URLs en otra tanda.
+    """
+    car_image_dir = os.path.join(DOWNLOAD_BASE_DIR, guid_anuncio)
+    os.makedirs(car_image_dir, exist_ok=True)
+
+    executor = get_download_executor()
+    images_by_index = {}
+    remaining = list(enumerate(urls))
+    while remaining and len(images_by_index) < MAX_IMAGE_COUNT_PER_CAR:
+        wave = remaining[:MAX_IMAGE_COUNT_PER_CAR - len(images_by_index)]
+        remaining = remaining[len(wave):]
+        futures = {i: executor.submit(fetch_image, guid_anuncio, url, os.path.join(car_image_dir, f"x{i + 1}.jpg"))
+                   for i, url in wave}
+        for i, future in futures.items():
+            image_data = future.result()
+            if image_data:
+                images_by_index[i] = image_data
+
+    if len(images_by_index) >= MAX_IMAGE_COUNT_PER_CAR and remaining:
+        print(f"Límite de {MAX_IMAGE_COUNT_PER_CAR} imágenes alcanzado para el anuncio {guid_anuncio}.")
+    return [images_by_index[i] for i in sorted(images_by_index)]
+
+
+def resume_partial_jsonl(partial_path):
+    """
+    Retorna los GUID de los anuncios que ya están en el .part de una ejecución interrumpida.
+    Si la última línea quedó a medias por el corte, se descarta reescribiendo el archivo solo con las líneas válidas.
+    """
+    if not os.path.exists(partial_path):
+        return set()
+    done_guids = set()
+    valid_lines = 0
+    truncated = False
+    with open(partial_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                done_guids.add(str(json.loads(line)['guid_anuncio']))
+                valid_lines += 1
+            except (ValueError, KeyError):
+                truncated = True
+    if truncated:
+        clean_path = partial_path + '.tmp'
+        with open(partial_path, 'r', encoding='utf-8') as src, open(clean_path, 'w', encoding='utf-8') as dst:
+            for line in src:
+                try:
+                    json.loads(line)['guid_anuncio']
+                    dst.write(line if line.endswith('\n') else line + '\n')
+                except (ValueError, KeyError):
+                    pass
+        os.replace(clean_path, partial_path)
+        print(f"Descartadas líneas incompletas de '{partial_path}'; se conservan {valid_lines} anuncios.")
+    return done_guids
 
 
 # --- Función principal de procesamiento (resto del código sin cambios) ---
 def main():
-    global total_cars_processed, successful_cars, failed_cars, images_per_car_counts
+    global download_manifest, metrics
 
-    global total_images_downloaded_global_counter
-    global total_download_size_bytes_global_counter
-    global total_image_width_global_counter
-    global total_image_height_global_counter
+    metrics = DownloadMetrics()
 
-    total_images_downloaded_global_counter = []
-    total_download_size_bytes_global_counter = []
-    total_image_width_global_counter = []
-    total_image_height_global_counter = []
-
-    try:
-        df = pd.read_csv(CSV_PATH)
-    except FileNotFoundError:
+    if not os.path.exists(CSV_PATH):
         print(f"Error: El archivo CSV no se encuentra en '{CSV_PATH}'")
         return
 
-    processed_listings = []
-    print(f"Iniciando procesamiento de {len(df)} anuncios...")
+    # Los anuncios terminados se añaden a un .part; si una ejecución anterior se cortó, se retoma desde ahí
+    partial_path = LOCAL_JSONL_PATH + '.part'
+    done_guids = resume_partial_jsonl(partial_path)
+    if done_guids:
+        print(f"Retomando una ejecución interrumpida: {len(done_guids)} anuncios ya procesados.")
+
+    download_manifest = DownloadManifest(DOWNLOAD_MANIFEST_PATH)
+    print(f"Iniciando procesamiento de '{CSV_PATH}' en bloques de {CSV_CHUNK_SIZE} filas...")
 
-    for index, row in df.iterrows():
-        total_cars_processed += 1
+    # Productor: lee el CSV por bloques y encola las filas; la cola acotada frena la lectura si los trabajadores van
+    # más lentos, así que en memoria solo hay unos pocos anuncios a la vez.
+    pending_rows = queue.Queue(maxsize=LISTING_CONCURRENCY * 4)
+    output_lock = threading.Lock()
+
+    def produce_rows():
+        try:
+            index = 0
+            for chunk in pd.read_csv(CSV_PATH, chunksize=CSV_CHUNK_SIZE):
+                for row in chunk.to_dict('records'):
+                    if str(row['guid_anuncio']) not in done_guids:
+                        pending_rows.put((index, row))
+                    index += 1
+        finally:
+            for _ in range(LISTING_CONCURRENCY):
+                pending_rows.put(None)
+
+    def process_listing(index, row):
         guid_anuncio = str(row['guid_anuncio'])
         image_urls_str = row['url_imagenes']
 
         if pd.isna(image_urls_str):
             print(f"Anuncio {guid_anuncio}: No hay URLs de imágenes. Saltando.")
-            failed_cars += 1
-            continue
+            return None
 
         image_urls = [url.strip() for url in image_urls_str.split(';') if url.strip()]
 
-        print(f"\n--- Procesando anuncio {guid_anuncio} ({index + 1}/{len(df)}) ---")
+        print(f"\n--- Procesando anuncio {guid_anuncio} (fila {index + 1}) ---")
         print(f"Encontradas {len(image_urls)} URLs de imágenes.")
 
-        downloaded_images = process_image_urls(guid_anuncio, image_urls)
-
-        if downloaded_images:
-            successful_cars += 1
-            row_dict = row.to_dict()
-            row_dict['downloaded_images'] = downloaded_images
-            processed_listings.append(row_dict)
-            images_per_car_counts.append(len(downloaded_images))
-        else:
-            print(f"Anuncio {guid_anuncio}: No se pudo descargar ninguna imagen.")
-            failed_cars += 1
-
-    with open(LOCAL_JSON_PATH, 'w', encoding='utf-8') as f:
-        json.dump(processed_listings, f, ensure_ascii=False, indent=4)
-    print(f"\nDatos de listings con rutas locales guardados en '{LOCAL_JSON_PATH}'")
-
-    avg_images_per_car = sum(images_per_car_counts) / len(images_per_car_counts) if images_per_car_counts else 0
-
-    total_actual_images_downloaded = len(total_images_downloaded_global_counter)
-
-    avg_total_download_size_bytes = sum(
-        total_download_size_bytes_global_counter) / total_actual_images_downloaded if total_actual_images_downloaded else 0
-    avg_total_image_width = sum(
-        total_image_width_global_counter) / total_actual_images_downloaded if total_actual_images_downloaded else 0
-    avg_total_image_height = sum(
-        total_image_height_global_counter) / total_actual_images_downloaded if total_actual_images_downloaded else 0
-
-    analysis_results = {
-        "fecha_generacion": datetime.now().isoformat(),
-        "total_coches_procesados": total_cars_processed,
-        "coches_exitosos": successful_cars,
-        "coches_fallidos": failed_cars,
-        "total_imagenes_descargadas": total_actual_images_downloaded,
-        "promedio_imagenes_por_coche": round(avg_images_per_car, 2),
-        "promedio_peso_kb": round(avg_total_download_size_bytes / 1024, 2),
-        "promedio_dimensiones_px": f"{round(avg_total_image_width)}x{round(avg_total_image_height)}",
-        "errores_descarga_por_anuncio": download_errors_by_type,
-    }
-
-    with open(ANALYSIS_RESULTS_PATH, 'w', encoding='utf-8') as f:
-        json.dump(analysis_results, f, ensure_ascii=False, indent=4)
+        return process_image_urls(guid_anuncio, image_urls)
+
+    # Consumidores: varios anuncios a la vez (sus imágenes comparten el pool global de descargas). Cada anuncio
+    # terminado se escribe en su propia línea en cuanto acaba, en el orden en que terminan.
+    def consume_rows(output_file):
+        while True:
+            item = pending_rows.get()
+            if item is None:
+                return
+            index, row = item
+            downloaded_images = process_listing(index, row)
+            metrics.increment('coches_procesados')
+            if downloaded_images:
+                metrics.increment('coches_exitosos')
+                metrics.increment('imagenes_por_coche', len(downloaded_images))
+                row['downloaded_images'] = downloaded_images
+                with output_lock:
+                    output_file.write(json.dumps(row, ensure_ascii=False) + '\n')
+                    output_file.flush()
+            else:
+                if downloaded_images is not None:
+                    print(f"Anuncio {row['guid_anuncio']}: No se pudo descargar ninguna imagen.")
+                metrics.increment('coches_fallidos')
+
+    stop_reporting = threading.Event()
+    reporter = threading.Thread(target=report_metrics_periodically, args=(stop_reporting,), daemon=True)
+    reporter.start()
+    try:
+        with open(partial_path, 'a', encoding='utf-8') as output_file:
+            producer = threading.Thread(target=produce_rows, daemon=True)
+            producer.start()
+            with ThreadPoolExecutor(max_workers=LISTING_CONCURRENCY) as listing_executor:
+                workers = [listing_executor.submit(consume_rows, output_file) for _ in range(LISTING_CONCURRENCY)]
+                for worker in workers:
+                    worker.result()
+            producer.join()
+    finally:
+        stop_reporting.set()
+        reporter.join()
+        download_manifest.close()
+
+    os.replace(partial_path, LOCAL_JSONL_PATH)
+    print(f"\nDatos de listings con rutas locales guardados en '{LOCAL_JSONL_PATH}'")
+
+    analysis_results = metrics.write_snapshot(ANALYSIS_RESULTS_PATH)
     print(f"Resultados del análisis guardados en '{ANALYSIS_RESULTS_PATH}'")
 
     print("\n--- Resumen del Proceso ---")
-    print(f"Total coches procesados: {total_cars_processed}")
-    print(f"Coches con imágenes descargadas: {successful_cars}")
-    print(f"Coches fallidos (sin imágenes/errores): {failed_cars}")
-    print(f"Total de imágenes descargadas y procesadas: {total_actual_images_downloaded}")
-    print(f"Promedio de peso de imagen: {avg_total_download_size_bytes / 1024:.2f} KB")
-    print(f"Promedio de dimensiones de imagen: {round(avg_total_image_width)}x{round(avg_total_image_height)} px")
-
+    print(f"Total coches procesados: {analysis_results['total_coches_procesados']}")
+    print(f"Coches con imágenes descargadas: {analysis_results['coches_exitosos']}")
+    print(f"Coches fallidos (sin imágenes/errores): {analysis_results['coches_fallidos']}")
+    print(f"Total de imágenes descargadas y procesadas: {analysis_results['total_imagenes_descargadas']}")
+    print(f"Imágenes reutilizadas de ejecuciones anteriores: {analysis_results['imagenes_reutilizadas']}")
+    print(f"Promedio de peso de imagen: {analysis_results['promedio_peso_kb']:.2f} KB")
+    print(f"Promedio de dimensiones de imagen: {analysis_results['promedio_dimensiones_px']} px")
+    print(f"Latencia de descarga (s): {analysis_results['latencia_descarga_s']}")
+    print(f"Ritmo: {analysis_results['imagenes_por_segundo']} img/s, {analysis_results['mb_por_segundo']} MB/s")
+    if analysis_results['errores_por_tipo']:
+        print(f"Errores por tipo: {analysis_results['errores_por_tipo']}")
+
+    if GENERATE_VARIANTS:
+        generate_all_variants(DOWNLOAD_BASE_DIR)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
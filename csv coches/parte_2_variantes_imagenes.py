@@ -0,0 +1,127 @@
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+
+# --- Configuración ---
+# Debe coincidir con DOWNLOAD_BASE_DIR de parte_1_analisis_imagenes.py
+DOWNLOAD_BASE_DIR = "C:\\Users\\CERO\\PycharmProjects\\PythonProject1\\csv coches\\imagenes_coches_descargadas"
+VARIANT_WORKERS = None  # Procesos del pool (None = uno por CPU)
+
+# Variantes que se generan junto a cada original: nombre → tamaño máximo (ancho, alto), manteniendo la proporción
+VARIANT_SIZES = {
+    'thumb': (320, 240),  # Tarjetas del listado
+    'medium': (960, 720),  # Carrusel del detalle
+}
+VARIANT_JPEG_QUALITY = 82
+VARIANT_WEBP_QUALITY = 78
+
+# Formatos de las variantes: JPEG siempre, más los extra que el Pillow instalado sepa guardar.
+# Añade 'avif' para generar también AVIF (pesa algo menos, pero es bastante más lento de codificar).
+VARIANT_EXTRA_FORMATS = ['webp']
+_PILLOW_FORMATS = {'jpg': 'JPEG', 'webp': 'WEBP', 'avif': 'AVIF'}
+Image.init()
+VARIANT_FORMATS = ['jpg'] + [extension for extension in VARIANT_EXTRA_FORMATS if _PILLOW_FORMATS[extension] in Image.SAVE]
+
+# Originales descargados (x1.jpg, x2.jpg...) y variantes generadas (x1_thumb.jpg, x1_medium.webp...)
+ORIGINAL_IMAGE_REGEX = re.compile(r'^x\d+\.jpg$')
+VARIANT_IMAGE_REGEX = re.compile(r'^(x\d+)_([a-z]+)\.([a-z]+)$')
+
+
+def variant_filename(original_filename, variant, extension='jpg'):
+    """'x1.jpg' → 'x1_thumb.jpg' (o .webp / .avif)."""
+    return f"{os.path.splitext(original_filename)[0]}_{variant}.{extension}"
+
+
+def original_filename_for(filename):
+    """Si `filename` es una variante ('x1_thumb.webp'), retorna su original ('x1.jpg'); si no, None."""
+    match = VARIANT_IMAGE_REGEX.match(filename)
+    if not match or match.group(2) not in VARIANT_SIZES or match.group(3) not in _PILLOW_FORMATS:
+        return None
+    return f"{match.group(1)}.jpg"
+
+
+def variants_up_to_date(original_path):
+    """True si todas las variantes del original existen y son más recientes que él."""
+    original_mtime = os.path.getmtime(original_path)
+    directory, filename = os.path.split(original_path)
+    for variant in VARIANT_SIZES:
+        for extension in VARIANT_FORMATS:
+            variant_path = os.path.join(directory, variant_filename(filename, variant, extension))
+            if not os.path.exists(variant_path) or os.path.getmtime(variant_path) < original_mtime:
+                return False
+    return True
+
+
+def generate_variants(original_path):
+    """
+    Genera todas las variantes de una imagen (se ejecuta en un proceso del pool).
+    El original se decodifica una sola vez; cada variante se reduce a partir de la anterior, de mayor a menor.
+    Retorna (ruta, número de archivos escritos, error o None).
+    """
+    try:
+        directory, filename = os.path.split(original_path)
+        written = 0
+        with Image.open(original_path) as img:
+            # draft() deja que el decodificador JPEG reduzca ya al leer, así no se decodifica a tamaño completo
+            largest = max(VARIANT_SIZES.values())
+            img.draft('RGB', largest)
+            current = ImageOps.exif_transpose(img).convert('RGB')
+        for variant, size in sorted(VARIANT_SIZES.items(), key=lambda item: item[1], reverse=True):
+            current.thumbnail(size, Image.LANCZOS)
+            for extension in VARIANT_FORMATS:
+                variant_path = os.path.join(directory, variant_filename(filename, variant, extension))
+                temporary_path = variant_path + '.tmp'
+                options = {'quality': VARIANT_WEBP_QUALITY if extension != 'jpg' else VARIANT_JPEG_QUALITY}
+                if extension == 'jpg':
+                    options.update(optimize=True, progressive=True)
+                current.save(temporary_path, _PILLOW_FORMATS[extension], **options)
+                os.replace(temporary_path, variant_path)
+                written += 1
+        return original_path, written, None
+    except Exception as e:
+        return original_path, 0, str(e)
+
+
+def find_stale_originals(base_dir=DOWNLOAD_BASE_DIR):
+    """Recorre las carpetas de los anuncios y retorna los originales cuyas variantes faltan o están desfasadas."""
+    stale = []
+    total = 0
+    for entry in os.scandir(base_dir):
+        if not entry.is_dir():
+            continue
+        for image_entry in os.scandir(entry.path):
+            if ORIGINAL_IMAGE_REGEX.match(image_entry.name):
+                total += 1
+                if not variants_up_to_date(image_entry.path):
+                    stale.append(image_entry.path)
+    return stale, total
+
+
+def generate_all_variants(base_dir=DOWNLOAD_BASE_DIR, workers=VARIANT_WORKERS):
+    """Genera en un pool de procesos las variantes que faltan en `base_dir`. Retorna cuántos originales se procesaron."""
+    if not os.path.isdir(base_dir):
+        print(f"Error: El directorio de imágenes no se encuentra en '{base_dir}'")
+        return 0
+
+    started = time.time()
+    stale, total = find_stale_originals(base_dir)
+    print(f"Variantes: {len(stale)} de {total} imágenes necesitan generarse "
+          f"({', '.join(VARIANT_SIZES)} en {', '.join(VARIANT_FORMATS)}).")
+    if not stale:
+        return 0
+
+    errors = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for original_path, written, error in executor.map(generate_variants, stale, chunksize=16):
+            if error:
+                errors += 1
+                print(f"  Error al generar las variantes de {original_path}: {error}")
+    print(f"Variantes generadas para {len(stale) - errors} imágenes en {time.time() - started:.1f} s "
+          f"({errors} con error).")
+    return len(stale)
+
+
+if __name__ == "__main__":
+    generate_all_variants()
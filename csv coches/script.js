@@ -6,6 +6,7 @@ const FLASK_API_BASE_URL = 'http://127.0.0.1:5000'; // ¡Importante: Asegúrate
 let allListings = [];
 let currentPage = 1;
 const listingsPerPage = 10;
+let currentSearchTerm = ''; // Si no está vacío, los listados vienen de /api/search
 
 // --- Referencias a elementos del DOM ---
 const listingsContainer = document.getElementById('car-listings');
@@ -74,7 +75,11 @@ async function fetchListings() {
         if (loadingMessageElement) loadingMessageElement.style.display = 'block';
         if (listingsContainer) listingsContainer.innerHTML = '';
 
-        const response = await fetch(`${FLASK_API_BASE_URL}/api/listings?page=${currentPage}&limit=${listingsPerPage}`);
+        // La búsqueda se hace en el servidor sobre todo el catálogo, no solo sobre la página cargada
+        const url = currentSearchTerm
+            ? `${FLASK_API_BASE_URL}/api/search?q=${encodeURIComponent(currentSearchTerm)}&page=${currentPage}&limit=${listingsPerPage}`
+            : `${FLASK_API_BASE_URL}/api/listings?page=${currentPage}&limit=${listingsPerPage}`;
+        const response = await fetch(url);
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
@@ -153,7 +158,7 @@ function displayListings(listingsToDisplay) {
         listingCard.innerHTML = `
             <div class="card-image">
                 <figure class="image is-4by3">
-                    <img src="${imageUrl}" alt="${listing.marca || 'Coche'} ${listing.modelo || ''}">
+                    <img src="${imageUrl}" alt="${listing.marca || 'Coche'} ${listing.modelo || ''}" loading="lazy" width="320" height="240">
                 </figure>
             </div>
             <div class="card-content">
@@ -209,20 +214,9 @@ function updatePagination(page, limit, total) {
 }
 
 function performSearch() {
-    const searchTerm = searchInput.value.toLowerCase().trim();
-    if (!searchTerm) {
-        displayListings(allListings);
-        return;
-    }
-    const filteredListings = allListings.filter(listing => {
-        const marca = listing.marca ? String(listing.marca).toLowerCase() : '';
-        const modelo = listing.modelo ? String(listing.modelo).toLowerCase() : '';
-        const concesionario = listing.concesionario ? String(listing.concesionario).toLowerCase() : '';
-        return marca.includes(searchTerm) ||
-               modelo.includes(searchTerm) ||
-               concesionario.includes(searchTerm);
-    });
-    displayListings(filteredListings);
+    currentSearchTerm = searchInput.value.trim();
+    currentPage = 1;
+    fetchListings();
 }
 
 // --- Funciones del Carrusel en el Modal ---
@@ -232,7 +226,7 @@ function showImage(index) {
     const img = carImages[index];
     modalImagesGallery.innerHTML = `
         <div class="carousel-image-container has-text-centered">
-            <img src="${img.api_image_url ? `${FLASK_API_BASE_URL}${img.api_image_url}` : 'https://via.placeholder.com/600x450?text=No+Disponible'}" alt="Imagen de coche">
+            <img src="${(img.api_medium_url || img.api_image_url) ? `${FLASK_API_BASE_URL}${img.api_medium_url || img.api_image_url}` : 'https://via.placeholder.com/600x450?text=No+Disponible'}" alt="Imagen de coche">
         </div>
         <div class="carousel-navigation has-text-centered mt-2">
             <button class="button is-small is-info mr-2" id="prev-image-btn" ${index === 0 ? 'disabled' : ''}><i class="fas fa-chevron-left"></i></button>
@@ -1,9 +1,15 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, jsonify, request, send_file
 from flask_cors import CORS
 import os
 import json
-import re  # Para expresiones regulares en parse_numeric_value
+import base64
+import functools
+import bisect
+import binascii
 import numpy as np  # Necesario para np.isnan, np.isinf
+from listing_index import ListingIndex, NUMERIC_FIELDS
+from listing_records import SUMMARY_FIELDS, build_listing_record, to_json_bytes
+from image_stat_cache import ImageStatCache
 
 app = Flask(__name__)
 CORS(app)  # Habilita CORS para todas las rutas
@@ -14,10 +20,25 @@ CORS(app)  # Habilita CORS para todas las rutas
 BASE_PROJECT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 CSV_DATA_DIR = os.path.join(BASE_PROJECT_PATH, 'csv coches')
 
-LISTINGS_DATA_FILE = os.path.join(CSV_DATA_DIR, 'listings_with_local_data.json')
+# parte_1_analisis_imagenes.py escribe un anuncio por línea (JSON Lines); el .json antiguo se sigue aceptando
+LISTINGS_DATA_FILE = os.path.join(CSV_DATA_DIR, 'listings_with_local_data.jsonl')
+LEGACY_LISTINGS_DATA_FILE = os.path.join(CSV_DATA_DIR, 'listings_with_local_data.json')
 ANALYSIS_RESULTS_FILE = os.path.join(CSV_DATA_DIR, 'analysis_results.json')
 DOWNLOAD_DIR_FULL_PATH = os.path.join(CSV_DATA_DIR, 'imagenes_coches_descargadas')
 
+# --- Caché HTTP de imágenes ---
+# Los archivos se nombran por posición (x1.jpg...) y se reescriben al volver a descargar un anuncio, así que solo
+# la URL con ?v=<ETag actual> (la que genera listing_records) se puede guardar sin volver a preguntar.
+IMAGE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Sin versión o con una versión antigua: el navegador revalida cada vez con el ETag (normalmente un 304)
+IMAGE_REVALIDATE_CACHE_CONTROL = 'no-cache'
+# Original servido en lugar de una variante aún sin generar: caché corta, para que luego se pida la variante
+IMAGE_FALLBACK_CACHE_CONTROL = 'public, max-age=300'
+
+# --- Paginación ---
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100  # Tope de anuncios por respuesta en /api/listings y /api/search
+
 # --- Verificación de existencia de archivos/directorios al inicio ---
 print(f"DEBUG: BASE_PROJECT_PATH: {BASE_PROJECT_PATH}")
 print(f"DEBUG: CSV_DATA_DIR: {CSV_DATA_DIR}")
@@ -26,35 +47,61 @@ print(f"DEBUG: ANALYSIS_RESULTS_FILE: {ANALYSIS_RESULTS_FILE}")
 print(f"DEBUG: DOWNLOAD_DIR_FULL_PATH: {DOWNLOAD_DIR_FULL_PATH}")
 
 print(f"DEBUG: ¿Existe LISTINGS_DATA_FILE?: {os.path.exists(LISTINGS_DATA_FILE)}")
+print(f"DEBUG: ¿Existe LEGACY_LISTINGS_DATA_FILE?: {os.path.exists(LEGACY_LISTINGS_DATA_FILE)}")
 print(f"DEBUG: ¿Existe ANALYSIS_RESULTS_FILE?: {os.path.exists(ANALYSIS_RESULTS_FILE)}")  # Corregido
 print(f"DEBUG: ¿Existe DOWNLOAD_DIR_FULL_PATH?: {os.path.isdir(DOWNLOAD_DIR_FULL_PATH)}")
 
 # --- Carga de datos global ---
 listings_data = []
 analysis_results = {}
-listings_by_guid = {}  # Un diccionario para acceso rápido por GUID (se llenará en load_data)
+listing_index = ListingIndex([], build_listing_record)  # Índices y registros preparados (se reemplaza en load_data)
+image_stat_cache = ImageStatCache(DOWNLOAD_DIR_FULL_PATH)  # Metadatos de las imágenes servidas
+
+
+def iter_raw_listings(path):
+    """Recorre los anuncios de un archivo JSON Lines (uno por línea) o de un JSON antiguo con una lista."""
+    with open(path, 'r', encoding='utf-8') as f:
+        if not path.endswith('.jsonl'):
+            yield from json.load(f)
+            return
+        for line_number, line in enumerate(f, start=1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"Advertencia: línea {line_number} de '{path}' ilegible, se ignora. Error: {e}")
+
+
+def image_url_version(guid, filename):
+    """Versión de la URL de una imagen: su ETag actual, o None si aún no existe (se serviría el original)."""
+    image = image_stat_cache.lookup(guid, filename)
+    return None if image is None or image.is_fallback else image.etag
 
 
 def load_data():
-    global listings_data, analysis_results, listings_by_guid
+    global listings_data, analysis_results, listing_index
+    # Las imágenes pueden haber cambiado desde la última carga: las versiones de las URLs se calculan de nuevo
+    image_stat_cache.clear()
     try:
-        if os.path.exists(LISTINGS_DATA_FILE):
-            with open(LISTINGS_DATA_FILE, 'r', encoding='utf-8') as f:
-                raw_listings = json.load(f)
-                # Limpiar NaN/Infinity durante la carga inicial del JSON si fuera necesario (doble seguridad)
-                listings_data = []
-                for item in raw_listings:
-                    cleaned_item = {}
-                    for key, value in item.items():
-                        if isinstance(value, float) and (np.isnan(value) or np.isinf(value)):
-                            cleaned_item[key] = None
-                        else:
-                            cleaned_item[key] = value
-                    listings_data.append(cleaned_item)
-
-            listings_by_guid = {listing.get('guid_anuncio'): listing for listing in listings_data if
-                                listing.get('guid_anuncio')}
-            print(f"Datos de listings cargados desde '{LISTINGS_DATA_FILE}'. Total: {len(listings_data)} anuncios.")
+        listings_file = LISTINGS_DATA_FILE if os.path.exists(LISTINGS_DATA_FILE) else LEGACY_LISTINGS_DATA_FILE
+        if os.path.exists(listings_file):
+            # Limpiar NaN/Infinity durante la carga inicial del JSON si fuera necesario (doble seguridad)
+            loaded_listings = []
+            for item in iter_raw_listings(listings_file):
+                cleaned_item = {}
+                for key, value in item.items():
+                    if isinstance(value, float) and (np.isnan(value) or np.isinf(value)):
+                        cleaned_item[key] = None
+                    else:
+                        cleaned_item[key] = value
+                loaded_listings.append(cleaned_item)
+
+            # El índice (y los registros ya normalizados y serializados) se construye aparte y se publica de una vez:
+            # las peticiones en curso siguen con el anterior
+            listing_index = ListingIndex(loaded_listings,
+                                         functools.partial(build_listing_record, image_version=image_url_version))
+            listings_data = listing_index.listings
+            print(f"Datos de listings cargados desde '{listings_file}'. Total: {len(listings_data)} anuncios.")
         else:
             print(f"Advertencia: El archivo '{LISTINGS_DATA_FILE}' no se encontró. Los listados estarán vacíos.")
 
@@ -77,214 +124,229 @@ def load_data():
     except json.JSONDecodeError as e:
         print(
             f"ERROR: No se pudo decodificar el archivo JSON. Revisa la sintaxis del JSON y los literales NaN/Infinity. Error: {e}")
-        listings_data = []  # Vaciar para evitar errores posteriores
+        listing_index = ListingIndex([], build_listing_record)  # Vaciar para evitar errores posteriores
+        listings_data = listing_index.listings
         analysis_results = {}
-        listings_by_guid = {}
     except Exception as e:
         print(f"ERROR: Ocurrió un error al cargar los datos: {e}")
-        listings_data = []
+        listing_index = ListingIndex([], build_listing_record)
+        listings_data = listing_index.listings
         analysis_results = {}
-        listings_by_guid = {}
 
 
 # Cargar datos al iniciar el servidor
 load_data()
 
 
-# --- Función auxiliar para manejar valores numéricos y "N/A" ---
-def parse_numeric_value(value, value_type=float):
+# --- Rutas de la API ---
+
+@app.route('/')
+def home():
     """
-    Intenta convertir un valor a numérico, manejando "N/A", vacíos, y formatos de moneda.
-    Devuelve None si no es numérico o se limpia a una cadena vacía.
+    Ruta de inicio para verificar que el servidor está funcionando.
+    No devuelve HTML para la aplicación, solo un mensaje de estado.
     """
-    if value is None:
-        return None
-
-    if isinstance(value, str):
-        cleaned_value = value.strip().upper()
-        if cleaned_value == "N/A" or cleaned_value == "":
-            return None  # Si es N/A o vacío, devolver None (se convierte a null en JSON)
-
-        # Si no es N/A ni vacío, intentar limpiar para numérico
-        cleaned_value = value.replace('\u20ac', '').replace('€', '').strip()
+    return jsonify({"message": "API de Coches funcionando. Accede a /api/listings para los datos."})
 
-        # Manejar comas como separadores decimales si el formato es europeo (ej: "1.234,56")
-        if ',' in cleaned_value and '.' in cleaned_value and cleaned_value.rfind(',') > cleaned_value.rfind('.'):
-            cleaned_value = cleaned_value.replace('.', '').replace(',', '.')
-        elif ',' in cleaned_value:
-            cleaned_value = cleaned_value.replace(',', '.')
-        else:
-            cleaned_value = cleaned_value.replace('.',
-                                                  '')  # Eliminar solo puntos, asumiendo que son separadores de miles
 
-        # Validar que después de la limpieza, solo queden dígitos y un posible punto decimal.
-        # La regex permite números negativos y decimales.
-        if not re.match(r"^-?\d+(\.\d+)?$", cleaned_value):
-            return None  # Si no se parece a un número, devolver None
+# --- Paginación y serialización de listados ---
 
-        # Si la cadena resultante está vacía después de la limpieza, también es None
-        if not cleaned_value:
-            return None
+def encode_cursor(guid, position):
+    """Cursor opaco que apunta justo detrás del anuncio `guid` (que estaba en `position`)."""
+    return base64.urlsafe_b64encode(to_json_bytes({"g": guid, "p": position})).decode('ascii')
 
-        value = cleaned_value
 
-    # Intentar la conversión final
+def decode_cursor(cursor):
+    """Retorna (guid, posición) de un cursor, o None si no es válido."""
     try:
-        return value_type(value)
-    except (ValueError, TypeError):
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return str(data["g"]), int(data["p"])
+    except (binascii.Error, UnicodeError, ValueError, TypeError, KeyError):
         return None
 
 
-# --- Rutas de la API ---
+def cursor_start(index, positions, cursor):
+    """
+    Primer índice (en `positions`, o en el catálogo si es None) detrás del anuncio del cursor.
+    Si el anuncio ya no está en su posición se busca por GUID, así que el cursor sigue valiendo tras recargar
+    los datos; si ya no existe, se continúa desde la posición que tenía, que ahora ocupa el anuncio siguiente.
+    """
+    guid, position = cursor
+    current = position
+    if not (0 <= position < len(index.listings) and index.listings[position].get('guid_anuncio') == guid):
+        current = index.position_of(guid)
+        if current is None:
+            # Se retoma en `position` misma: lo que estaba detrás del anuncio borrado ha subido una posición
+            current = max(position - 1, -1)
+    if positions is None:
+        return current + 1
+    return bisect.bisect_right(positions, current)
 
-@app.route('/')
-def home():
+
+def requested_page_size():
+    """?limit= acotado entre 1 y MAX_PAGE_SIZE."""
+    return min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+
+
+def requested_fields():
     """
-    Ruta de inicio para verificar que el servidor está funcionando.
-    No devuelve HTML para la aplicación, solo un mensaje de estado.
+    Claves pedidas con ?fields=marca,precio,... (siempre incluye guid_anuncio), o None para la tarjeta completa.
+    Lanza ValueError si alguna clave no existe.
     """
-    return jsonify({"message": "API de Coches funcionando. Accede a /api/listings para los datos."})
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in SUMMARY_FIELDS]
+    if unknown:
+        raise ValueError(f"Campos desconocidos: {', '.join(unknown)}. Disponibles: {', '.join(SUMMARY_FIELDS)}")
+    return ["guid_anuncio"] + [field for field in fields if field != "guid_anuncio"]
+
+
+def stream_listings_response(page_records, fields, metadata):
+    """
+    Respuesta JSON generada por trozos: {"listings": [...], **metadata}.
+    Sin proyección se envía el JSON ya preparado de cada anuncio; con `fields` solo se serializan esas claves.
+    """
+    def generate():
+        yield b'{"listings":['
+        for number, record in enumerate(page_records):
+            if number:
+                yield b','
+            if fields is None:
+                yield record.summary_json
+            else:
+                yield to_json_bytes({field: record.summary[field] for field in fields if field in record.summary})
+        yield b'],' + to_json_bytes(metadata)[1:]
+
+    return app.response_class(generate(), mimetype='application/json')
 
 
 @app.route('/api/listings', methods=['GET'])
 def get_listings():
+    """
+    Página de anuncios. Admite ?page= (paginación clásica) o ?cursor= (el next_cursor de la respuesta anterior,
+    estable aunque se recarguen los datos), ?limit= (máximo MAX_PAGE_SIZE), ?fields= para recibir solo
+    algunas claves de la tarjeta y los filtros marca, concesionario y combustible.
+    """
     page = request.args.get('page', 1, type=int)
-    limit = request.args.get('limit', 10, type=int)
+    limit = requested_page_size()
+    index = listing_index  # Referencia local: una recarga a mitad de la petición no la afecta
 
-    if not listings_data:
+    if not index.listings:
         return jsonify({"error": "No listings data available on server"}), 500
 
-    start_index = (page - 1) * limit
+    try:
+        fields = requested_fields()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Filtros opcionales resueltos con los índices secundarios (?marca=kia&combustible=diesel&concesionario=...)
+    positions = index.filter_positions(marca=request.args.get('marca'),
+                                       concesionario=request.args.get('concesionario'),
+                                       combustible=request.args.get('combustible'))
+    total_listings = len(index.records) if positions is None else len(positions)
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        decoded_cursor = decode_cursor(cursor)
+        if decoded_cursor is None:
+            return jsonify({"error": "Cursor no válido"}), 400
+        start_index = cursor_start(index, positions, decoded_cursor)
+        page = None
+    else:
+        start_index = max(page - 1, 0) * limit
     end_index = start_index + limit
 
-    paginated_raw_listings = listings_data[start_index:end_index]
-
-    total_listings = len(listings_data)
-
-    processed_listings_for_frontend = []
-    for raw_listing in paginated_raw_listings:
-        # Construye un nuevo diccionario con solo las claves esperadas por el frontend
-        processed_listing = {
-            "guid_anuncio": raw_listing.get("guid_anuncio"),
-            "marca": raw_listing.get("Marca"),  # Usa la clave original del CSV
-            "modelo": raw_listing.get("Modelo"),  # Usa la clave original del CSV
-            "precio": parse_numeric_value(raw_listing.get("Precio Contado")),  # Usa la clave original del CSV
-            "kilometros": parse_numeric_value(raw_listing.get("Kilómetros")),  # Usa la clave original del CSV
-            "año": parse_numeric_value(raw_listing.get("Año Matriculación"), int),  # Usa la clave original del CSV
-            "concesionario": raw_listing.get("Concesionario"),  # Usa la clave original del CSV
-            "tours_url": raw_listing.get("Tours"),  # Asegúrate de que 'Tours' es el nombre de la clave en tu JSON
-            "thumbnail_url": None  # Se llenará a continuación
-        }
-
-        # --- Lógica para la thumbnail_url ---
-        # Verificamos si 'downloaded_images' es una lista no vacía
-        if isinstance(raw_listing.get('downloaded_images'), list) and raw_listing['downloaded_images']:
-            first_image_info = raw_listing['downloaded_images'][0]
-            # Asegúrate de que first_image_info es un diccionario y contiene 'local_path'
-            if isinstance(first_image_info, dict) and 'local_path' in first_image_info:
-                image_filename = os.path.basename(first_image_info['local_path'])
-                processed_listing['thumbnail_url'] = f"/api/images/{processed_listing['guid_anuncio']}/{image_filename}"
-            # else: no se asigna thumbnail_url, se queda como None
-
-        # Limpiar tours_url si es "N/A" o vacío
-        if isinstance(processed_listing.get('tours_url'), str) and (
-                processed_listing['tours_url'].strip().upper() == "N/A" or processed_listing[
-            'tours_url'].strip() == ""):
-            processed_listing['tours_url'] = None
-
-        processed_listings_for_frontend.append(processed_listing)
-        print(
-            f"DEBUG: Listing procesado para frontend (ejemplo thumbnail_url): {processed_listing.get('thumbnail_url')}")  # Debug print
+    page_positions = range(start_index, min(end_index, total_listings)) if positions is None \
+        else positions[start_index:end_index]
+    page_records = [index.records[position] for position in page_positions]
 
-    response_data = {
-        "listings": processed_listings_for_frontend,
+    next_cursor = None
+    if end_index < total_listings and page_records:
+        next_cursor = encode_cursor(page_records[-1].guid, page_positions[-1])
+
+    return stream_listings_response(page_records, fields, {
         "page": page,
         "limit": limit,
-        "total_listings": total_listings
-    }
+        "total_listings": total_listings,
+        "next_cursor": next_cursor,
+    })
 
-    return jsonify(response_data)
+
+@app.route('/api/search', methods=['GET'])
+def search_listings():
+    """
+    Búsqueda sobre todo el catálogo con los índices de load_data.
+    Parámetros: q (texto libre en marca, modelo y concesionario), marca, concesionario, combustible,
+    precio_min/precio_max, kilometros_min/kilometros_max, año_min/año_max,
+    sort (precio, kilometros o año; '-' delante para descendente), page, limit (máximo MAX_PAGE_SIZE) y fields.
+    Además de la página de anuncios retorna las facetas (marca, concesionario, combustible) del resultado.
+    """
+    page = request.args.get('page', 1, type=int)
+    limit = requested_page_size()
+    sort = request.args.get('sort') or None
+    index = listing_index  # Referencia local: una recarga a mitad de la petición no la afecta
+
+    if sort and sort.lstrip('-') not in NUMERIC_FIELDS:
+        return jsonify({"error": f"sort debe ser uno de: {', '.join(NUMERIC_FIELDS)} (con '-' para descendente)"}), 400
+    try:
+        fields = requested_fields()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    ranges = {field: (request.args.get(f'{field}_min', type=float), request.args.get(f'{field}_max', type=float))
+              for field in NUMERIC_FIELDS}
+    positions, facets = index.search(query=request.args.get('q', '').strip(), ranges=ranges, sort=sort,
+                                     marca=request.args.get('marca'),
+                                     concesionario=request.args.get('concesionario'),
+                                     combustible=request.args.get('combustible'))
+
+    start_index = max(page - 1, 0) * limit
+    page_records = [index.records[position] for position in positions[start_index:start_index + limit]]
+    return stream_listings_response(page_records, fields, {
+        "page": page,
+        "limit": limit,
+        "total_listings": len(positions),
+        "facets": facets,
+    })
 
 
 @app.route('/api/listings/<guid>', methods=['GET'])
 def get_listing_by_guid(guid):
-    # Encuentra el anuncio por GUID
-    raw_listing = next((item for item in listings_data if item.get("guid_anuncio") == guid), None)
+    # Encuentra el anuncio por GUID (acceso directo por índice, con el detalle ya serializado)
+    record = listing_index.get_record(guid)
 
-    if not raw_listing:
+    if not record:
         return jsonify({"error": "Listing not found"}), 404
 
-    # Construye un nuevo diccionario con todas las claves esperadas por el modal de detalles
-    processed_listing = {
-        "guid_anuncio": raw_listing.get("guid_anuncio"),
-        "marca": raw_listing.get("Marca"),
-        "modelo": raw_listing.get("Modelo"),
-        "precio": parse_numeric_value(raw_listing.get("Precio Contado")),
-        "precio_financiado_display": parse_numeric_value(raw_listing.get("Precio Financiado")),
-        "año": parse_numeric_value(raw_listing.get("Año Matriculación"), int),
-        "kilometros": parse_numeric_value(raw_listing.get("Kilómetros")),
-        "puertas": parse_numeric_value(raw_listing.get("Puertas"), int),
-        "concesionario": raw_listing.get("Concesionario"),
-        "tipo_de_motor": raw_listing.get("Tipo Combustible"),
-        "cambio": raw_listing.get("Transmisión"),
-        "localidad": raw_listing.get("Ubicación Concesionario"),
-        "provincia": raw_listing.get("Provincia", "N/A"),  # Asume que puede existir o usa N/A
-        "tipo_de_anuncio": raw_listing.get("Tipo de Anuncio", "Coche de ocasión"),
-        # Asume que puede existir o usa por defecto
-        "clase_de_vehículo": raw_listing.get("Clase de Vehículo", "Turismo"),
-        # Asume que puede existir o usa por defecto
-        "combustible": raw_listing.get("Tipo Combustible"),
-        "carrocería": raw_listing.get("Carrocería"),
-        "garantia": raw_listing.get("Garantía Oficial"),
-        "descripción": raw_listing.get("Descripción"),
-        "url_anuncio": raw_listing.get("URL Anuncio"),
-        "tours_url": raw_listing.get("Tours"),  # Asegúrate de que 'Tours' es el nombre de la clave
-        "images": []  # Se llenará a continuación
-    }
-
-    # Limpiar campos de texto específicos que pueden ser "N/A"
-    for key in ["garantia", "descripción", "url_anuncio", "provincia", "tipo_de_anuncio", "clase_de_vehículo",
-                "carrocería", "combustible", "tipo_de_motor", "cambio", "localidad", "concesionario"]:
-        current_value = processed_listing.get(key)
-        if isinstance(current_value, str) and (current_value.strip().upper() == "N/A" or current_value.strip() == ""):
-            processed_listing[key] = "N/A"
-        # else: mantener el valor original, ya sea cadena o None
-
-    # Limpiar tours_url si es "N/A" o vacío
-    if isinstance(processed_listing.get('tours_url'), str) and (
-            processed_listing['tours_url'].strip().upper() == "N/A" or processed_listing['tours_url'].strip() == ""):
-        processed_listing['tours_url'] = None
-
-    # Formatear URLs para las imágenes del detalle del coche (para el carrusel)
-    if 'downloaded_images' in raw_listing and isinstance(raw_listing['downloaded_images'], list) and raw_listing[
-        'downloaded_images']:
-        for img_info in raw_listing['downloaded_images']:
-            if isinstance(img_info, dict) and 'local_path' in img_info:
-                image_filename = os.path.basename(img_info['local_path'])
-                processed_listing['images'].append({
-                    "api_image_url": f"/api/images/{guid}/{image_filename}",
-                })
-
-    return jsonify(processed_listing)
+    return app.response_class(record.detail_json, mimetype='application/json')
 
 
 @app.route('/api/images/<guid>/<filename>')
 def get_image(guid, filename):
-    image_dir = os.path.join(DOWNLOAD_DIR_FULL_PATH, guid)
-
-    print(f"DEBUG: Solicitud de imagen para GUID: {guid}, Archivo: {filename}")
-    print(f"DEBUG: Directorio de imagen esperado: {image_dir}")
-    print(f"DEBUG: Ruta completa del archivo esperado: {os.path.join(image_dir, filename)}")
-
-    if not os.path.isdir(image_dir):
-        print(f"ERROR: Directorio de imágenes no encontrado: {image_dir}")
-        return "Directory not found", 404
-
-    if not os.path.exists(os.path.join(image_dir, filename)):
-        print(f"ERROR: Archivo de imagen no encontrado: {os.path.join(image_dir, filename)}")
+    """
+    Sirve una imagen con ETag y Cache-Control. Con If-None-Match responde 304 desde la caché de stat,
+    sin tocar el disco; las peticiones Range (206) las resuelve send_file.
+    Solo se marca como inmutable si ?v= coincide con el ETag actual del archivo.
+    """
+    image = image_stat_cache.lookup(guid, filename)
+    if image is None:
+        print(f"ERROR: Archivo de imagen no encontrado: {guid}/{filename}")
         return "Image not found", 404
 
-    return send_from_directory(image_dir, filename)
+    if request.if_none_match.contains(image.etag):
+        response = app.response_class(status=304)
+        response.set_etag(image.etag)
+    else:
+        response = send_file(image.path, conditional=True, etag=image.etag, last_modified=image.mtime)
+    if image.is_fallback:
+        response.headers['Cache-Control'] = IMAGE_FALLBACK_CACHE_CONTROL
+    elif request.args.get('v') == image.etag:
+        response.headers['Cache-Control'] = IMAGE_CACHE_CONTROL
+    else:
+        response.headers['Cache-Control'] = IMAGE_REVALIDATE_CACHE_CONTROL
+    return response
 
 
 @app.route('/api/analysis', methods=['GET'])
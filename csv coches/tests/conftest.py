@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Los módulos de csv coches se importan entre sí sin paquete (from listing_index import ...), igual que al
+# ejecutar server_api.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,26 @@
+import hashlib
+
+import parte_1_analisis_imagenes
+from parte_1_analisis_imagenes import DownloadManifest, file_sha256
+
+URL = 'https://cdn.dealerk.es/dealer/datafiles/vehicle/images/1.jpg'
+
+
+def test_record_hashes_the_file_outside_the_lock(tmp_path, monkeypatch):
+    image_path = tmp_path / 'imagen_1.jpg'
+    image_path.write_bytes(b'\xff\xd8\xff' + b'x' * 5000)
+    manifest = DownloadManifest(str(tmp_path / 'manifest.sqlite3'))
+    hashed_while_locked = []
+
+    def checking_sha256(file_path):
+        hashed_while_locked.append(manifest._lock.locked())
+        return file_sha256(file_path)
+
+    monkeypatch.setattr(parte_1_analisis_imagenes, 'file_sha256', checking_sha256)
+    manifest.record(URL, str(image_path), 5003, 800, 600, {'etag': '"abc"'})
+
+    assert hashed_while_locked == [False]
+    entry = manifest.lookup(URL, str(image_path))
+    assert entry['sha256'] == hashlib.sha256(image_path.read_bytes()).hexdigest()
+    assert entry['etag'] == '"abc"'
+    manifest.close()
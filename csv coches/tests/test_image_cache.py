@@ -0,0 +1,56 @@
+import pytest
+
+import server_api
+from image_stat_cache import ImageStatCache
+from listing_records import build_listing_record
+
+GUID = 'ABC123'
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setattr(server_api, 'image_stat_cache', ImageStatCache(str(tmp_path)))
+    (tmp_path / GUID).mkdir()
+    return server_api.app.test_client()
+
+
+def write_image(tmp_path, filename, content):
+    (tmp_path / GUID / filename).write_bytes(content)
+
+
+def image_urls(tmp_path):
+    raw_listing = {'guid_anuncio': GUID, 'downloaded_images': [{'local_path': str(tmp_path / GUID / 'x1.jpg')}]}
+    return build_listing_record(raw_listing, image_version=server_api.image_url_version).summary['thumbnail_variants']
+
+
+def test_versioned_url_is_immutable_and_changes_with_the_file(client, tmp_path):
+    write_image(tmp_path, 'x1.jpg', b'primera descarga')
+    first_url = image_urls(tmp_path)['original']
+    response = client.get(first_url)
+
+    etag, _ = response.get_etag()
+    assert first_url == f'/api/images/{GUID}/x1.jpg?v={etag}'
+    assert 'immutable' in response.headers['Cache-Control']
+
+    # El anuncio se vuelve a descargar: mismo nombre de archivo, otros bytes
+    write_image(tmp_path, 'x1.jpg', b'segunda descarga, otra foto')
+    server_api.image_stat_cache.clear()
+    assert image_urls(tmp_path)['original'] != first_url
+    assert client.get(first_url).headers['Cache-Control'] == server_api.IMAGE_REVALIDATE_CACHE_CONTROL
+
+
+def test_unversioned_url_is_revalidated(client, tmp_path):
+    write_image(tmp_path, 'x1.jpg', b'foto')
+    response = client.get(f'/api/images/{GUID}/x1.jpg')
+
+    assert response.headers['Cache-Control'] == server_api.IMAGE_REVALIDATE_CACHE_CONTROL
+    revalidation = client.get(f'/api/images/{GUID}/x1.jpg', headers={'If-None-Match': response.headers['ETag']})
+    assert revalidation.status_code == 304
+
+
+def test_missing_variant_url_has_no_version_and_short_cache(client, tmp_path):
+    write_image(tmp_path, 'x1.jpg', b'foto')
+    thumb_url = image_urls(tmp_path)['thumb']
+
+    assert thumb_url == f'/api/images/{GUID}/x1_thumb.jpg'
+    assert client.get(thumb_url).headers['Cache-Control'] == server_api.IMAGE_FALLBACK_CACHE_CONTROL
@@ -0,0 +1,55 @@
+import pytest
+
+import server_api
+from listing_index import ListingIndex
+from listing_records import build_listing_record
+
+
+def catalogue(guids):
+    # Dos marcas alternas, para probar también el cursor con filtro
+    return ListingIndex([{'guid_anuncio': guid, 'Marca': 'KIA' if number % 2 == 0 else 'Opel'}
+                         for number, guid in enumerate(guids)], build_listing_record)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(server_api, 'listing_index', catalogue('ABCDEF'))
+    return server_api.app.test_client()
+
+
+def page(client, **params):
+    data = client.get('/api/listings', query_string=params).get_json()
+    return [listing['guid_anuncio'] for listing in data['listings']], data['next_cursor']
+
+
+def test_cursor_walks_the_whole_catalogue(client):
+    guids, cursor = page(client, limit=2)
+    while cursor:
+        more, cursor = page(client, limit=2, cursor=cursor)
+        guids += more
+    assert guids == list('ABCDEF')
+
+
+def test_cursor_survives_reordering_by_guid(client, monkeypatch):
+    first, cursor = page(client, limit=2)
+    monkeypatch.setattr(server_api, 'listing_index', catalogue('XABCDEF'))  # Un anuncio nuevo delante
+
+    assert first == ['A', 'B']
+    assert page(client, limit=2, cursor=cursor)[0] == ['C', 'D']
+
+
+def test_cursor_resumes_at_the_old_slot_when_its_listing_is_gone(client, monkeypatch):
+    first, cursor = page(client, limit=2)
+    monkeypatch.setattr(server_api, 'listing_index', catalogue('ACDEF'))  # Recarga sin B
+
+    assert first == ['A', 'B']
+    assert page(client, limit=2, cursor=cursor)[0] == ['C', 'D']
+
+
+def test_filtered_cursor_resumes_at_the_old_slot_when_its_listing_is_gone(client, monkeypatch):
+    first, cursor = page(client, limit=2, marca='kia')
+    # Recarga sin C: E pasa a ocupar la posición 2, en la que estaba C
+    monkeypatch.setattr(server_api, 'listing_index', catalogue('ABEDGF'))
+
+    assert first == ['A', 'C']
+    assert page(client, limit=2, marca='kia', cursor=cursor)[0] == ['E', 'G']